@@ -0,0 +1,40 @@
+import os
+import json
+import argparse
+import tempfile
+import pandas as pd
+
+from benchmarks.run_benchmarks import scales, filter_modes, default_params, get_archive, benchmark_scale
+
+# Memory of the stage results with the default and the compact dtypes (SignalPreprocessor(compact_dtypes=True)).
+# Run from the repository root:
+#   python -m benchmarks.compact_report --scales medium
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the memory of the default and the compact dtypes")
+    parser.add_argument("--scales", nargs="+", default=["small"], choices=list(scales))
+    parser.add_argument("--filter-modes", nargs="+", default=["discard", "time_window"], choices=filter_modes)
+    parser.add_argument("--params", default=default_params)
+    parser.add_argument("--archive-dir", default=os.path.join(tempfile.gettempdir(), "frequency_analysis_benchmark"))
+    parser.add_argument("--rooms", nargs="+", default=["HS18", "HS19"])
+    parser.add_argument("--events-per-day", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    params = json.load(open(args.params, "r"))
+    room_to_id = {room:i for i, room in enumerate(args.rooms)}
+
+    tables = []
+    for scale in args.scales:
+        path = get_archive(scale, args.archive_dir, args.rooms, args.events_per_day, args.seed)
+        for compact_dtypes in [False, True]:
+            results = pd.DataFrame(benchmark_scale(scale, path, room_to_id, params, modes=args.filter_modes, 
+                                                   compact_dtypes=compact_dtypes))
+            results["dtypes"] = "compact" if compact_dtypes else "default"
+            tables.append(results)
+
+    table = pd.concat(tables).pivot_table(index=["scale", "stage"], columns="dtypes", 
+                                          values=["frame_mb", "peak_mb", "seconds"], sort=False)
+    table[("frame_mb", "reduction")] = table[("frame_mb", "default")] / table[("frame_mb", "compact")]
+    table[("peak_mb", "reduction")] = table[("peak_mb", "default")] / table[("peak_mb", "compact")]
+    print(table.round(3).to_string())
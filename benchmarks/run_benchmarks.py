@@ -0,0 +1,341 @@
+import os
+import gc
+import re
+import sys
+import copy
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from preprocessing import time_parser
+from preprocessing.preprocessor import SignalPreprocessor, CoursePreprocessor
+from benchmarks.synthetic_archive import generate_archive, generate_door_file, raw_data_format
+from benchmarks.synthetic_courses import generate_courses, generate_search_page
+from webcrawler.webcrawler import Snail
+
+# Benchmark of the stages of SignalPreprocessor.apply_preprocessing on synthetic archives
+# and of both engines of CoursePreprocessor.apply_preprocessing on synthetic course data.
+# The timestamp parser is compared to pd.to_datetime on a synthetic door file with millions of rows,
+# the extraction of the crawler search results is timed on large copies of a recorded page.
+# Run from the repository root:
+#   python -m benchmarks.run_benchmarks --scales small medium
+#   python -m benchmarks.run_benchmarks --update-baseline
+# The results are compared to the stored baseline, slower (or more memory hungry) stages
+# are reported as regressions and the exit code is 1. The committed baseline.json (small and medium)
+# was measured on one machine, regenerate it with --update-baseline before comparing on another one.
+
+door_to_id = {"door1":0, "door2":1}
+filter_modes = ["discard", "n_closest", "time_window"]
+
+# number of days of the synthetic archive, 2 rooms x 2 doors, ~1500 samples per door and day
+scales = {"small":{"days":7},
+          "medium":{"days":28},
+          "large":{"days":112}}
+
+# number of rows of the synthetic door file of the parsing benchmark
+parse_scales = {"small":1_000_000, "medium":2_000_000, "large":5_000_000}
+
+# number of semesters of the synthetic course data (copies of the crawled courses in data/raw)
+course_scales = {"small":4, "medium":16, "large":64}
+course_room_to_id = {"HS 18":0, "HS 19":1}
+
+# number of courses on the synthetic search result page
+search_scales = {"small":1000, "medium":3000, "large":10000}
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+default_params = "parameters/preprocessing_parameters.json"
+
+####### Measurement ########
+def measure(func, trace_memory=True):
+    """
+    Returns the result of func(), the wall time and the peak memory (bytes) allocated during the call.
+    The time is measured without tracemalloc, the memory in a second call with tracemalloc
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def get_archive(scale, archive_dir, rooms, events_per_day, seed):
+    # archives are reused as long as their parameters did not change
+    path = os.path.join(archive_dir, scale)
+    config_path = os.path.join(path, "archive.json")
+    config = {"days":scales[scale]["days"], "rooms":rooms, "events_per_day":events_per_day, "seed":seed}
+    if os.path.exists(config_path):
+        stored = json.load(open(config_path, "r"))
+        if all(stored.get(x) == config[x] for x in config):
+            return path
+
+    generate_archive(path, **config)
+    return path
+
+def get_door_file(scale, archive_dir, seed):
+    # the file is reused, its name contains the parameters
+    path = os.path.join(archive_dir, f"door_file_{parse_scales[scale]}_{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(archive_dir, exist_ok=True)
+        generate_door_file(path, parse_scales[scale], seed=seed)
+    return path
+
+def get_course_data(scale, archive_dir, path_to_raw_courses, seed):
+    path = os.path.join(archive_dir, f"courses_{scale}")
+    generate_courses(path, path_to_raw_courses=path_to_raw_courses, semesters=course_scales[scale], seed=seed)
+    return path
+
+####### Stages ########
+def discard_samples_loop(dataframe, lb, ub):
+    # row-wise discard_samples before it was vectorized, kept for the before/after timing
+    df = dataframe.copy()
+    mask = df.apply(lambda x: (x["time"].time() >= lb) & (x["time"].time() <= ub), axis=1)
+    df = df[mask].reset_index(drop=True)
+    return df
+
+def extract_search_results_loop(snail, result_table):
+    # Snail.extract_search_results before the frame was built once, kept for the before/after timing
+    format = result_table[0]
+    columns = [x.text.strip() for x in snail.search_html(format, "th", all=True)]
+    
+    link_dict = {}
+    dataframe = pd.DataFrame(columns=columns)
+    for row in result_table[1:]:
+        cells = snail.search_html(row, "td", all=True)
+        row = []
+        for cell in cells:
+            text = cell.text.strip()
+            x = [x for x in re.split("\n|\t", text) if x != ""]
+            text = x[0]
+            link = cell.a
+            if link is not None:
+                link_dict[x[0]] = link["href"]
+            row.append(text)
+        dataframe.loc[len(dataframe)] = row
+
+    dataframe["max_students"] = None
+    dataframe["registered_students"] = None
+    return dataframe, link_dict
+
+def get_frame_mb(result):
+    # memory of the resulting dataframe (deep), None for other results
+    if isinstance(result, SignalPreprocessor):
+        result = result.raw_uncleaned_data
+    if isinstance(result, pd.DataFrame):
+        return result.memory_usage(deep=True).sum() / 1024**2
+    return None
+
+def record_stage(results, scale, stage, func, rows_in, trace_memory=True, count_rows=len):
+    # measures func and appends the record to results, returns the result of func
+    result, seconds, peak = measure(func, trace_memory)
+    rows_out = count_rows(result[0] if isinstance(result, tuple) else result)
+    results.append({"scale":scale, "stage":stage, "rows_in":rows_in, "rows_out":rows_out,
+                    "seconds":seconds, "rows_per_second":rows_in / seconds if seconds > 0 else None,
+                    "peak_mb":peak / 1024**2 if peak is not None else None,
+                    "frame_mb":get_frame_mb(result[0] if isinstance(result, tuple) else result)})
+    print(f"{scale:>8} {stage:<34} {rows_in:>10} -> {rows_out:<10} {seconds:>9.3f}s", flush=True)
+    return result
+
+def benchmark_scale(scale, path, room_to_id, params, modes=filter_modes, trace_memory=True, compact_dtypes=False,
+                    ingest_workers=()):
+    """
+    Times the stages of clean_raw_data for every filter mode, the stages that do not depend
+    on the filter mode (ingest, basic cleaning, discard windows, 5/6 handling) are timed once.
+    The ingest is also timed with every number of processes in ingest_workers (1 = serial)
+    """
+    results = []
+    def record(stage, func, rows_in, count_rows=len):
+        return record_stage(results, scale, stage, func, rows_in, trace_memory, count_rows)
+
+    # rows_in of the ingest are the door files
+    n_files = 2 * len([x for x in os.listdir(path) if x.startswith("data_")])
+    def ingest():
+        preprocessor = SignalPreprocessor(path, room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+        preprocessor.get_raw_data()
+        return preprocessor
+    preprocessor = record("ingest", ingest, n_files, count_rows=lambda x: len(x.raw_uncleaned_data))
+    raw = preprocessor.raw_uncleaned_data
+    
+    # serial vs parallel ingest, the result has to be the same
+    for n_workers in ingest_workers:
+        def ingest_parallel():
+            preprocessor = SignalPreprocessor(path, room_to_id, door_to_id, n_workers=n_workers, compact_dtypes=compact_dtypes)
+            return preprocessor.get_raw_data()
+        df = record(f"ingest_workers_{n_workers}", ingest_parallel, n_files)
+        if not df.equals(raw):
+            raise RuntimeError(f"Ingest with {n_workers} workers differs from the serial ingest")
+
+    df = record("basic_cleaning", lambda: preprocessor.basic_cleaning_and_data_type_correction(raw), len(raw))
+    windows = params.get("discard_params", preprocessor.discard_params)["windows"]
+    record("discard_windows", lambda: preprocessor.discard_samples_by_windows(df, windows), len(df))
+    
+    # discard_samples before (row-wise apply) and after vectorizing it, with the first window
+    lb, ub = [pd.Timestamp(windows[0][x]).time() for x in ["start", "end"]]
+    discarded = record("discard_samples_loop", lambda: discard_samples_loop(df, lb, ub), len(df))
+    record("discard_samples", lambda: preprocessor.discard_samples(df, lb, ub), len(df))
+    if not preprocessor.discard_samples(df, lb, ub).equals(discarded):
+        raise RuntimeError("Vectorized discard_samples differs from the row-wise version")
+
+    filtering_params = params["filtering_params"]
+    handled = record("handle_5_6", lambda: preprocessor.filter_event_type_5_6(
+                            dataframe=df, handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
+                            **params["handle_56_params"]), len(df))
+
+    for filter_mode in modes:
+        if filter_mode == "discard":
+            func = lambda: preprocessor.filter_discard(dataframe=handled, **filtering_params)
+        elif filter_mode == "n_closest":
+            func = lambda: preprocessor.filter_data_n_closest(dataframe=handled, **filtering_params)
+        else:
+            func = lambda: preprocessor.filter_data_time_window(dataframe=handled, **filtering_params)
+        filtered = record(f"filter_{filter_mode}", func, len(handled))
+
+    record("sort", lambda: preprocessor.sort_by_time(filtered), len(filtered))
+
+    # whole apply_preprocessing per filter mode
+    for filter_mode in modes:
+        mode_params = copy.deepcopy(params)
+        mode_params["filtering_params"]["filter_mode"] = filter_mode
+        record(f"apply_preprocessing_{filter_mode}", lambda: preprocessor.apply_preprocessing(mode_params), len(raw))
+    return results
+
+def benchmark_parsing(scale, path, trace_memory=True):
+    """
+    Times time_parser.parse_ctime and pd.to_datetime(format=...) on the time column of a door file
+    """
+    results = []
+    times = pd.read_csv(path, names=raw_data_format, usecols=["Time"])["Time"]
+    parsed = record_stage(results, scale, "parse_ctime", lambda: time_parser.parse_ctime(times),
+                          len(times), trace_memory)
+    expected = record_stage(results, scale, "parse_to_datetime",
+                            lambda: pd.to_datetime(times, format=time_parser.ctime_format), len(times), trace_memory)
+    if not parsed.equals(expected):
+        raise RuntimeError("parse_ctime differs from pd.to_datetime")
+    return results
+
+def benchmark_search_results(scale, trace_memory=True):
+    """
+    Times Snail.extract_search_results and the row-append version on a large search result page
+    """
+    results = []
+    # the constructor crawls KUSSS, the extraction only needs search_html
+    snail = object.__new__(Snail)
+    html = generate_search_page(search_scales[scale])
+    soup = BeautifulSoup(html, snail.select_parser(), parse_only=Snail.search_result_tags)
+    result_table = snail.search_html(snail.search_html(soup, "table", all=True)[-1], "tr", all=True)
+    
+    rows_in = len(result_table) - 1
+    extracted = record_stage(results, scale, "extract_search_results", 
+                             lambda: snail.extract_search_results(result_table), rows_in, trace_memory)
+    expected = record_stage(results, scale, "extract_search_results_loop", 
+                            lambda: extract_search_results_loop(snail, result_table), rows_in, trace_memory)
+    if not (extracted[0].equals(expected[0].reset_index(drop=True)) and extracted[1] == expected[1]):
+        raise RuntimeError("extract_search_results differs from the row-append version")
+    return results
+
+def benchmark_courses(scale, path, trace_memory=True, compact_dtypes=False):
+    """
+    Times CoursePreprocessor.apply_preprocessing with the pandas and the vectorized engine,
+    rows_in are the raw course dates, rows_out the cleaned course infos
+    """
+    results = []
+    preprocessor = CoursePreprocessor(path, course_room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+    rows_in = len(preprocessor.get_raw_course_dates())
+    preprocessor.get_raw_course_info()
+    for engine in ["pandas", "vectorized"]:
+        record_stage(results, scale, f"course_preprocessing_{engine}", 
+                     lambda: preprocessor.apply_preprocessing(engine=engine), rows_in, trace_memory)
+    return results
+
+####### Baseline ########
+def compare_to_baseline(results, baseline, tolerance, min_seconds):
+    # a stage regressed if it got slower (or needs more memory) by more than tolerance,
+    # differences below min_seconds are ignored as noise
+    stored = {(x["scale"], x["stage"]):x for x in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = stored.get((result["scale"], result["stage"]))
+        if reference is None:
+            continue
+        if result["seconds"] > reference["seconds"] * (1 + tolerance) and result["seconds"] - reference["seconds"] > min_seconds:
+            regressions.append((result, reference, "seconds"))
+        if result["peak_mb"] is not None and reference.get("peak_mb") is not None and result["peak_mb"] > reference["peak_mb"] * (1 + tolerance):
+            regressions.append((result, reference, "peak_mb"))
+    return regressions
+
+def get_environment():
+    return {"python":platform.python_version(), "pandas":pd.__version__, "numpy":np.__version__,
+            "machine":platform.machine(), "processor":platform.processor()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the stages of SignalPreprocessor.apply_preprocessing")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(scales))
+    parser.add_argument("--filter-modes", nargs="+", default=filter_modes, choices=filter_modes)
+    parser.add_argument("--params", default=default_params)
+    parser.add_argument("--archive-dir", default=os.path.join(tempfile.gettempdir(), "frequency_analysis_benchmark"))
+    parser.add_argument("--rooms", nargs="+", default=["HS18", "HS19"])
+    parser.add_argument("--events-per-day", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--raw-courses", default="data/raw", help="crawled courses copied into the synthetic course data")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--compact-dtypes", action="store_true", help="use the compact dtype mode")
+    parser.add_argument("--ingest-workers", nargs="*", type=int, default=[1, min(os.cpu_count() or 1, 4)],
+                        help="numbers of processes of the ingest timings, 1 = serial")
+    parser.add_argument("--baseline", default=default_baseline)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    args = parser.parse_args()
+
+    params = json.load(open(args.params, "r"))
+    room_to_id = {room:i for i, room in enumerate(args.rooms)}
+
+    results = []
+    for scale in args.scales:
+        path = get_archive(scale, args.archive_dir, args.rooms, args.events_per_day, args.seed)
+        results += benchmark_scale(scale, path, room_to_id, params, modes=args.filter_modes, 
+                                   trace_memory=not args.no_memory, compact_dtypes=args.compact_dtypes,
+                                   ingest_workers=list(dict.fromkeys(args.ingest_workers)))
+        
+        path = get_door_file(scale, args.archive_dir, args.seed)
+        results += benchmark_parsing(scale, path, trace_memory=not args.no_memory)
+        
+        path = get_course_data(scale, args.archive_dir, args.raw_courses, args.seed)
+        results += benchmark_courses(scale, path, trace_memory=not args.no_memory, compact_dtypes=args.compact_dtypes)
+        results += benchmark_search_results(scale, trace_memory=not args.no_memory)
+
+    report = {"environment":get_environment(), "params":params, "compact_dtypes":args.compact_dtypes, "results":results}
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+        print(f"Stored baseline in {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}, store one with --update-baseline")
+        sys.exit(0)
+
+    regressions = compare_to_baseline(results, json.load(open(args.baseline, "r")), args.tolerance, args.min_seconds)
+    for result, reference, metric in regressions:
+        print(f"REGRESSION {result['scale']} {result['stage']}: {metric} {reference[metric]:.3f} -> {result[metric]:.3f}")
+    if len(regressions) > 0:
+        sys.exit(1)
+    print("No regressions")
@@ -0,0 +1,121 @@
+import os
+import json
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Generator of synthetic light gate archives in the layout read by SignalPreprocessor:
+# <path>/data_<room>_<date>/door1.csv, door2.csv, format.csv
+# The files have no header, the columns are those of SignalPreprocessor.raw_data_format_signal.
+
+raw_data_format = ["Entering", "Time", "People_IN", "People_OUT", 
+                   "IN_Support_Count", "OUT_Support_Count", "One_Count_1", "One_Count_2"]
+time_format = "%a %b %d %H:%M:%S %Y"
+
+# usual start and end times of the lectures, most people pass the doors around them
+lecture_times = ["08:30", "10:15", "12:00", "13:45", "15:30", "17:15", "19:00"]
+
+def generate_door_day(rng, day, events_per_day, p_5, p_6, p_low_support, burst_fraction, opening_hours):
+    """
+    Returns the samples of one door on one day
+    """
+    n_events = rng.poisson(events_per_day)
+    n_burst = int(n_events * burst_fraction)
+    
+    # background traffic during the opening hours and bursts around the lectures
+    opening = pd.Timedelta(opening_hours[0]).total_seconds(), pd.Timedelta(opening_hours[1]).total_seconds()
+    background = rng.uniform(opening[0], opening[1], n_events - n_burst)
+    centers = np.array([pd.Timedelta(x + ":00").total_seconds() for x in lecture_times])
+    burst = rng.choice(centers, n_burst) + rng.normal(0, 240, n_burst)
+    seconds = np.sort(np.clip(np.concatenate([background, burst]), 0, 24 * 60 * 60 - 1).astype(np.int64))
+    
+    # event types: 1 = in, 0 = out, 5 and 6 are erroneous detections
+    event_types = rng.choice([1, 0, 5, 6], n_events, p=[(1 - p_5 - p_6) / 2, (1 - p_5 - p_6) / 2, p_5, p_6])
+    
+    # support counts, high for the detected direction, low support samples have low counts in both
+    in_support = np.where(event_types == 1, rng.integers(4, 200, n_events), rng.integers(0, 30, n_events))
+    out_support = np.where(event_types == 0, rng.integers(3, 200, n_events), rng.integers(0, 30, n_events))
+    low_support = rng.random(n_events) < p_low_support
+    in_support = np.where(low_support, rng.integers(0, 4, n_events), in_support)
+    out_support = np.where(low_support, rng.integers(0, 3, n_events), out_support)
+    
+    times = pd.Timestamp(day) + pd.to_timedelta(seconds, unit="s")
+    return pd.DataFrame({"Entering":event_types,
+                         "Time":times.strftime(time_format),
+                         "People_IN":np.cumsum(event_types == 1),
+                         "People_OUT":np.cumsum(event_types == 0),
+                         "IN_Support_Count":in_support,
+                         "OUT_Support_Count":out_support,
+                         "One_Count_1":rng.integers(0, 600, n_events),
+                         "One_Count_2":rng.integers(0, 600, n_events)})
+
+def generate_archive(path, days=7, rooms=("HS18", "HS19"), start_date="2024-04-08", events_per_day=1500,
+                     p_5=0.08, p_6=0.04, p_low_support=0.1, burst_fraction=0.6, 
+                     opening_hours=("06:30:00", "22:30:00"), weekends=False, seed=0):
+    """
+    Writes a synthetic archive to path and returns the names of the data directories.
+    events_per_day: mean number of samples per door and day
+    p_5, p_6, p_low_support: proportions of event type 5/6 and low support samples
+    weekends: also write directories for saturdays and sundays
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    
+    dir_names = []
+    for i in range(days):
+        day = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=i)
+        if not weekends and day.weekday() >= 5:
+            continue
+        for room in rooms:
+            dir_name = f"data_{room}_{day.strftime('%Y-%m-%d')}"
+            dir_path = os.path.join(path, dir_name)
+            os.makedirs(dir_path, exist_ok=True)
+            
+            pd.DataFrame(columns=raw_data_format).to_csv(os.path.join(dir_path, "format.csv"), index=False)
+            for door_file in ["door1.csv", "door2.csv"]:
+                df = generate_door_day(rng, day, events_per_day, p_5, p_6, p_low_support, burst_fraction, opening_hours)
+                df.to_csv(os.path.join(dir_path, door_file), index=False, header=False)
+            dir_names.append(dir_name)
+    
+    # parameters of the archive, e.g. to check if an existing archive can be reused
+    config = {"days":days, "rooms":list(rooms), "start_date":start_date, "events_per_day":events_per_day,
+              "p_5":p_5, "p_6":p_6, "p_low_support":p_low_support, "burst_fraction":burst_fraction,
+              "opening_hours":list(opening_hours), "weekends":weekends, "seed":seed}
+    with open(os.path.join(path, "archive.json"), "w") as file:
+        json.dump(config, file, indent=4)
+    return dir_names
+
+def generate_door_file(path_to_file, n_rows, days=100, start_date="2024-04-08", seed=0):
+    """
+    Writes a single door file with about n_rows samples over the given number of days,
+    e.g. to measure the parsing throughput on millions of rows. Returns the number of rows
+    """
+    rng = np.random.default_rng(seed)
+    dataframes = []
+    for i in range(days):
+        day = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=i)
+        dataframes.append(generate_door_day(rng, day, n_rows / days, p_5=0.08, p_6=0.04, p_low_support=0.1,
+                                            burst_fraction=0.6, opening_hours=("06:30:00", "22:30:00")))
+    df = pd.concat(dataframes, axis=0)
+    df.to_csv(path_to_file, index=False, header=False)
+    return len(df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic light gate archive")
+    parser.add_argument("path")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--rooms", nargs="+", default=["HS18", "HS19"])
+    parser.add_argument("--start-date", default="2024-04-08")
+    parser.add_argument("--events-per-day", type=int, default=1500)
+    parser.add_argument("--p-5", type=float, default=0.08)
+    parser.add_argument("--p-6", type=float, default=0.04)
+    parser.add_argument("--p-low-support", type=float, default=0.1)
+    parser.add_argument("--weekends", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    dir_names = generate_archive(args.path, days=args.days, rooms=args.rooms, start_date=args.start_date,
+                                 events_per_day=args.events_per_day, p_5=args.p_5, p_6=args.p_6,
+                                 p_low_support=args.p_low_support, weekends=args.weekends, seed=args.seed)
+    print(f"Wrote {len(dir_names)} data directories to {args.path}")
@@ -0,0 +1,91 @@
+import os
+import re
+import argparse
+import numpy as np
+import pandas as pd
+
+# Generator of synthetic multi-semester course data in the layout read by CoursePreprocessor:
+# <path>/<room>_courses.csv and <path>/<room>_dates.csv
+# Every semester is a copy of the crawled courses in path_to_raw_courses with shifted
+# course numbers and dates, a fraction of the curricula is replaced by irregular strings.
+
+# recorded search result page of the crawler tests
+recorded_search_page = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "tests", "fixtures", "kusss", "coursecatalogue-search_518.html")
+
+irregular_curricula = ["Masterstudium ² Informatik  20{0}W x1y", "Bachelorstudium\tStatistik 20{0}S",
+                       "①  Lehramtsstudium 20{0}W"]
+
+def shift_course_numbers(series, semester):
+    # "340.100" -> "3<s>0.10<s>", <s> are the two digits of the semester
+    digits = f"{semester:02d}"
+    return series.str[:2] + digits[0] + "." + series.str[4:6] + digits[1]
+
+def generate_courses(path, path_to_raw_courses="data/raw", semesters=10, p_irregular=0.1, seed=0):
+    """
+    Writes the courses and dates of every room in path_to_raw_courses for the given
+    number of semesters (at most 100) to path, returns the written file names
+    """
+    if semesters > 100:
+        raise ValueError("At most 100 semesters are supported")
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+
+    file_names = []
+    rooms = sorted(x[:-len("_courses.csv")] for x in os.listdir(path_to_raw_courses) if x.endswith("_courses.csv"))
+    for room in rooms:
+        # strings only, the files are written back unchanged
+        courses = pd.read_csv(os.path.join(path_to_raw_courses, f"{room}_courses.csv"), dtype=str, keep_default_na=False)
+        dates = pd.read_csv(os.path.join(path_to_raw_courses, f"{room}_dates.csv"), dtype=str, keep_default_na=False)
+
+        courses_list, dates_list = [], []
+        for semester in range(semesters):
+            df_courses = courses.copy()
+            df_dates = dates.copy()
+            df_courses["LVA-Nr."] = shift_course_numbers(df_courses["LVA-Nr."], semester)
+            df_dates["LVA-Nummer"] = shift_course_numbers(df_dates["LVA-Nummer"], semester)
+
+            irregular = rng.random(len(df_courses)) < p_irregular
+            curricula = rng.choice(irregular_curricula, irregular.sum())
+            df_courses.loc[irregular, "Quellcurriculum"] = [x.format(f"{semester:02d}") for x in curricula]
+
+            datum = pd.to_datetime(df_dates["Datum"], format="%d.%m.%y") + pd.Timedelta(days=182 * semester)
+            df_dates["Datum"] = datum.dt.strftime("%d.%m.%y")
+
+            courses_list.append(df_courses)
+            dates_list.append(df_dates)
+
+        for file_name, dataframes in [(f"{room}_courses.csv", courses_list), (f"{room}_dates.csv", dates_list)]:
+            pd.concat(dataframes, axis=0).to_csv(os.path.join(path, file_name), index=False)
+            file_names.append(file_name)
+    return file_names
+
+def generate_search_page(n_courses, path_to_page=recorded_search_page):
+    """
+    Returns the html of a search result page with n_courses rows, the rows of the
+    recorded page are repeated with unique course numbers
+    """
+    with open(path_to_page, "r", encoding="utf-8") as file:
+        html = file.read()
+    rows = re.findall(r'<tr class="priorityhighlighted">.*?</tr>\n', html, flags=re.S)
+    start = html.index(rows[0])
+    end = html.index(rows[-1]) + len(rows[-1])
+
+    new_rows = []
+    for i in range(n_courses):
+        course_number = f"{100 + i // 1000}.{i % 1000:03d}"
+        new_rows.append(re.sub(r"\d{3}\.\d{3}", course_number, rows[i % len(rows)]))
+    return html[:start] + "".join(new_rows) + html[end:]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes synthetic multi-semester course data")
+    parser.add_argument("path")
+    parser.add_argument("--raw-courses", default="data/raw")
+    parser.add_argument("--semesters", type=int, default=10)
+    parser.add_argument("--p-irregular", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    file_names = generate_courses(args.path, path_to_raw_courses=args.raw_courses, semesters=args.semesters,
+                                  p_irregular=args.p_irregular, seed=args.seed)
+    print(f"Wrote {len(file_names)} files to {args.path}")
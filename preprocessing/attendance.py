@@ -0,0 +1,136 @@
+import warnings
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+from preprocessing.occupancy import OccupancyEngine
+
+class AttendanceEstimator:
+    """
+    Estimates the attendance of every course date from the occupancy signal
+    in the window [start_time - m_before, end_time + m_after] (minutes).
+
+    The occupancy is resampled to bins of size freq, all course dates are
+    evaluated at once on a (course dates x bins) matrix.
+
+    prediction_mode:
+    - "max": maximal occupancy in the window
+    - "mean": mean occupancy (at the end of the bins) in the window
+    - "median": median occupancy (at the end of the bins) in the window
+    - "max_mean": mean of the occupancy values that are at least (1 - max_mean_cutoff) * maximum,
+      i.e. the plateau around the maximum
+
+    part_mode: aggregation ("median", "mean", "max", "min") of the estimates of all
+    dates of a course (course_attendance), None skips the aggregation
+    """
+    prediction_modes = ["max", "mean", "median", "max_mean"]
+    part_modes = [None, "median", "mean", "max", "min"]
+
+    def __init__(self, occupancy:OccupancyEngine, prediction_mode="max", m_before=0, m_after=0,
+                 part_mode="median", max_mean_cutoff=0.3, freq="1min"):
+        if prediction_mode not in self.prediction_modes:
+            raise ValueError(f"Unknown prediction_mode {prediction_mode}, use one of {self.prediction_modes}")
+        if part_mode not in self.part_modes:
+            raise ValueError(f"Unknown part_mode {part_mode}, use one of {self.part_modes}")
+
+        self.occupancy = occupancy
+        self.prediction_mode = prediction_mode
+        self.m_before = timedelta(minutes=m_before)
+        self.m_after = timedelta(minutes=m_after)
+        self.part_mode = part_mode
+        self.max_mean_cutoff = max_mean_cutoff
+        self.freq = pd.Timedelta(freq)
+
+    @classmethod
+    def from_params(cls, occupancy, signal_params:dict, **kwargs):
+        # signal_params section of preprocessing_parameters.json
+        return cls(occupancy, **signal_params, **kwargs)
+
+    ####### Helper Methods ########
+    def get_windows(self, course_dates):
+        # window bounds rounded to whole bins
+        window_start = (course_dates["start_time"] - self.m_before).dt.floor(self.freq)
+        window_end = (course_dates["end_time"] + self.m_after).dt.ceil(self.freq)
+        return window_start, window_end
+
+    def get_bin_matrix(self, grid, room_ids, window_start, window_end):
+        """
+        Returns the row in grid of every (course date, bin) of the windows and a mask
+        of the valid entries, course dates of rooms without data are masked out
+        """
+        grid_start = grid["time"].iloc[0].value
+        freq_ns = self.freq.value
+        n_bins = len(grid) // grid["room_id"].nunique()
+
+        # the resampled grid is ordered by room, every room has the same bins
+        room_offsets = {room_id:i * n_bins for i, room_id in enumerate(pd.unique(grid["room_id"]))}
+        offsets = pd.Series(room_ids).map(room_offsets).to_numpy(dtype=np.float64)
+        has_data = ~np.isnan(offsets)
+        offsets = np.nan_to_num(offsets).astype(np.int64)
+
+        first_bin = (window_start.to_numpy(dtype="datetime64[ns]").view(np.int64) - grid_start) // freq_ns
+        n_window = (window_end.to_numpy(dtype="datetime64[ns]").view(np.int64) - window_start.to_numpy(dtype="datetime64[ns]").view(np.int64)) // freq_ns
+        n_window = np.where(has_data, n_window, 0)
+
+        columns = np.arange(max(n_window.max(initial=0), 1))
+        mask = columns[None, :] < n_window[:, None]
+        rows = offsets[:, None] + np.minimum(first_bin[:, None] + columns[None, :], n_bins - 1)
+        return np.where(mask, rows, 0), mask
+
+    def predict(self, occupancy_end, occupancy_max, mask):
+        # one estimate per row of the (course dates x bins) matrices
+        # rows without data are all nan
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            maximum = np.where(mask, occupancy_max, -np.inf).max(axis=1)
+            samples = np.where(mask, occupancy_end, np.nan)
+
+            if self.prediction_mode == "max":
+                estimate = maximum
+            elif self.prediction_mode == "mean":
+                estimate = np.nanmean(samples, axis=1)
+            elif self.prediction_mode == "median":
+                estimate = np.nanmedian(samples, axis=1)
+            else:
+                threshold = (1 - self.max_mean_cutoff) * np.nanmax(samples, axis=1)
+                plateau = np.where(samples >= threshold[:, None], samples, np.nan)
+                estimate = np.nanmean(plateau, axis=1)
+
+        return np.where(mask.any(axis=1), estimate, np.nan)
+
+    ####### Application ########
+    def estimate(self, course_dates):
+        """
+        Returns the attendance table, one row per course date
+        course_dates: output of CoursePreprocessor (course_number, room_id, start_time, end_time)
+        """
+        course_dates = course_dates.reset_index(drop=True)
+        window_start, window_end = self.get_windows(course_dates)
+
+        attendance = pd.DataFrame({"course_date_id":np.arange(len(course_dates), dtype=np.int64),
+                                   "course_number":course_dates["course_number"].astype(object),
+                                   "room_id":course_dates["room_id"],
+                                   "start_time":course_dates["start_time"],
+                                   "end_time":course_dates["end_time"],
+                                   "window_start":window_start,
+                                   "window_end":window_end})
+        if len(course_dates) == 0 or len(self.occupancy.times) == 0:
+            attendance["n_in"] = np.zeros(len(course_dates), dtype=np.int64)
+            attendance["n_out"] = np.zeros(len(course_dates), dtype=np.int64)
+            attendance["attendance"] = np.full(len(course_dates), np.nan)
+            return self.aggregate_parts(attendance)
+
+        grid = self.occupancy.resample(self.freq, start=window_start.min(), end=window_end.max())
+        rows, mask = self.get_bin_matrix(grid, course_dates["room_id"].to_numpy(), window_start, window_end)
+
+        occupancy_end = grid["occupancy"].to_numpy(dtype=np.float64)[rows]
+        occupancy_max = grid["occupancy_max"].to_numpy(dtype=np.float64)[rows]
+        attendance["n_in"] = np.where(mask, grid["n_in"].to_numpy()[rows], 0).sum(axis=1)
+        attendance["n_out"] = np.where(mask, grid["n_out"].to_numpy()[rows], 0).sum(axis=1)
+        attendance["attendance"] = self.predict(occupancy_end, occupancy_max, mask)
+        return self.aggregate_parts(attendance)
+
+    def aggregate_parts(self, attendance):
+        if self.part_mode is not None:
+            attendance["course_attendance"] = attendance.groupby("course_number")["attendance"].transform(self.part_mode)
+        return attendance
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import pandas as pd
+
+class ResultCache:
+    """
+    On-disk cache of the cleaned light gate data of every data directory.
+
+    Layout: <cache_dir>/<parameter hash>/index.json and one pickle per data directory.
+
+    Invalidation rules:
+    - a different parameter set (hash of the parameters dict) uses its own sub directory
+    - a directory whose door1.csv, door2.csv or format.csv changed (size or content hash) is recomputed
+    - if only the mtime changed but the content hash is the same, the entry is kept
+    - entries of directories that are no longer in the archive are removed
+    - the neighbouring directories (same room) of changed or removed directories are
+      recomputed as well, since the filters look across day boundaries
+    - a different cache version invalidates everything
+
+    Eviction: only the max_parameter_sets most recently used parameter sets are kept,
+    the other parameter sets are removed when a parameter set is opened.
+
+    The merged results are sorted with SignalPreprocessor.sort_by_time, cached and
+    uncached runs give the same rows in the same order, also at identical timestamps.
+    """
+    version = 1
+    signature_files = ["door1.csv", "door2.csv", "format.csv"]
+
+    def __init__(self, cache_dir, max_parameter_sets=3):
+        self.cache_dir = cache_dir
+        self.max_parameter_sets = max_parameter_sets
+
+        self.params_hash = None
+        self.index = None
+
+    ####### Parameter Sets ########
+    def hash_parameters(self, params:dict):
+        # profiling does not change the results
+        params = {x:y for x, y in params.items() if x != "profiling_params"}
+        params_str = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(params_str.encode("utf-8")).hexdigest()[:16]
+
+    def get_parameter_set_dir(self, params_hash=None):
+        if params_hash is None:
+            params_hash = self.params_hash
+        return os.path.join(self.cache_dir, params_hash)
+
+    def open(self, params:dict):
+        # select the cache entries belonging to this parameter set
+        self.params_hash = self.hash_parameters(params)
+        os.makedirs(self.get_parameter_set_dir(), exist_ok=True)
+
+        index = self.read_index(self.params_hash)
+        if index is None or index["version"] != self.version:
+            index = {"version":self.version, "params":params, "directories":{}}
+        self.index = index
+        self.evict()
+        return self.index
+
+    def read_index(self, params_hash):
+        path = os.path.join(self.get_parameter_set_dir(params_hash), "index.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as file:
+                return json.load(file)
+        except (json.JSONDecodeError, OSError):
+            return None
+
+    def save_index(self):
+        # last_used drives the eviction of parameter sets
+        self.index["last_used"] = time.time()
+        path = os.path.join(self.get_parameter_set_dir(), "index.json")
+        with open(path, "w") as file:
+            json.dump(self.index, file, indent=4)
+
+    def evict(self):
+        # keep only the most recently used parameter sets, the open one is the most recent
+        parameter_sets = []
+        for params_hash in os.listdir(self.cache_dir):
+            if params_hash == self.params_hash or not os.path.isdir(self.get_parameter_set_dir(params_hash)):
+                continue
+            index = self.read_index(params_hash)
+            last_used = 0 if index is None else index.get("last_used", 0)
+            parameter_sets.append((last_used, params_hash))
+
+        parameter_sets = sorted(parameter_sets, reverse=True)
+        evicted = [x[1] for x in parameter_sets[max(self.max_parameter_sets - 1, 0):]]
+        for params_hash in evicted:
+            shutil.rmtree(self.get_parameter_set_dir(params_hash))
+        return evicted
+
+    ####### Directory Signatures ########
+    def hash_file(self, path_to_file):
+        sha = hashlib.sha256()
+        with open(path_to_file, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def directory_signature(self, path_to_dir, dir_name):
+        # size, mtime and content hash of the files, the hash is only
+        # recomputed if size or mtime differ from the cached signature
+        cached = self.index["directories"].get(dir_name, {})
+        signature = {}
+        for file_name in self.signature_files:
+            path_to_file = os.path.join(path_to_dir, file_name)
+            if not os.path.exists(path_to_file):
+                continue
+            stat = os.stat(path_to_file)
+            size, mtime = stat.st_size, stat.st_mtime_ns
+
+            cached_file = cached.get(file_name)
+            if cached_file is not None and cached_file["size"] == size and cached_file["mtime"] == mtime:
+                sha = cached_file["sha256"]
+            else:
+                sha = self.hash_file(path_to_file)
+            signature[file_name] = {"size":size, "mtime":mtime, "sha256":sha}
+        return signature
+
+    def is_valid(self, dir_name, signature):
+        cached = self.index["directories"].get(dir_name)
+        if cached is None or not os.path.exists(self.get_entry_path(dir_name)):
+            return False
+        if cached.keys() != signature.keys():
+            return False
+        for file_name, file_signature in signature.items():
+            if cached[file_name]["size"] != file_signature["size"] or cached[file_name]["sha256"] != file_signature["sha256"]:
+                return False
+        return True
+
+    def update_signature(self, dir_name, signature):
+        # e.g. only the mtime changed
+        self.index["directories"][dir_name] = signature
+
+    def cached_directories(self):
+        return list(self.index["directories"].keys())
+
+    ####### Entries ########
+    def get_entry_path(self, dir_name):
+        return os.path.join(self.get_parameter_set_dir(), dir_name + ".pkl")
+
+    def store(self, dir_name, signature, cleaned_data, raw_data):
+        pd.to_pickle((cleaned_data, raw_data), self.get_entry_path(dir_name))
+        self.index["directories"][dir_name] = signature
+
+    def load(self, dir_name):
+        cleaned_data, raw_data = pd.read_pickle(self.get_entry_path(dir_name))
+        return cleaned_data, raw_data
+
+    def remove(self, dir_name):
+        path = self.get_entry_path(dir_name)
+        if os.path.exists(path):
+            os.remove(path)
+        self.index["directories"].pop(dir_name, None)
@@ -0,0 +1,98 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+class CourseIntervalIndex:
+    """
+    Sorted interval index of the course dates of every room, used to assign the light gate
+    events to the course occurrence running in the room at the time of the event.
+
+    The occurrence [start_time - margin_before, end_time + margin_after] covers an event if
+    the room is the same and the time of the event lies within. If several occurrences cover
+    an event (e.g. overlapping margins) the one that started last is assigned
+    (for equal starts the later row of course_dates).
+
+    course_dates: output of CoursePreprocessor (start_time, end_time, room_id)
+    """
+    def __init__(self, course_dates, margin_before=timedelta(0), margin_after=timedelta(0)):
+        self.course_dates = course_dates.reset_index(drop=True)
+        self.margin_before = pd.Timedelta(margin_before).value
+        self.margin_after = pd.Timedelta(margin_after).value
+
+        # room -> (starts, ends, positions in course_dates, running max of the ends),
+        # sorted by start
+        self.rooms = {}
+        room_ids = self.course_dates["room_id"].to_numpy()
+        starts = self.time_to_int(self.course_dates["start_time"]) - self.margin_before
+        ends = self.time_to_int(self.course_dates["end_time"]) + self.margin_after
+        for room_id in pd.unique(room_ids):
+            positions = np.flatnonzero(room_ids == room_id)
+            positions = positions[np.argsort(starts[positions], kind="stable")]
+            room_ends = ends[positions]
+            self.rooms[room_id] = (starts[positions], room_ends, positions, np.maximum.accumulate(room_ends))
+
+    def time_to_int(self, series):
+        return series.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    ####### Assignment ########
+    def assign_room(self, room_id, times):
+        # position in course_dates of the covering occurrence, -1 if there is none
+        starts, ends, positions, max_ends = self.rooms[room_id]
+        idx = np.searchsorted(starts, times, side="right") - 1
+
+        # the last occurrence that started before the event might be over already,
+        # go back until an occurrence covers the event or none of the earlier ones can
+        unresolved = idx >= 0
+        while unresolved.any():
+            candidates = idx[unresolved]
+            covered = ends[candidates] >= times[unresolved]
+            hopeless = max_ends[candidates] < times[unresolved]
+            idx[np.flatnonzero(unresolved)[hopeless]] = -1
+
+            still_unresolved = ~covered & ~hopeless
+            idx[np.flatnonzero(unresolved)[still_unresolved]] -= 1
+            unresolved[np.flatnonzero(unresolved)[~still_unresolved]] = False
+
+        return np.where(idx >= 0, positions[np.maximum(idx, 0)], -1)
+
+    def assign(self, events):
+        """
+        Returns the position in course_dates of the occurrence assigned to every event, -1 if there is none.
+        events: output of SignalPreprocessor (time, room_id)
+        """
+        times = self.time_to_int(events["time"])
+        room_ids = events["room_id"].to_numpy()
+
+        assigned = np.full(len(events), -1, dtype=np.int64)
+        for room_id in self.rooms:
+            in_room = np.flatnonzero(room_ids == room_id)
+            if len(in_room) > 0:
+                assigned[in_room] = self.assign_room(room_id, times[in_room])
+        return assigned
+
+    def join(self, events, columns=None, how="left"):
+        """
+        Joins the columns of the assigned course occurrence to the events.
+        course_date_id is the position in course_dates (<NA> if no course is assigned),
+        the course columns use nullable dtypes so missing values keep the type.
+        how: "left" keeps all events, "inner" only the events with a course
+        """
+        if columns is None:
+            columns = ["course_number", "start_time", "end_time"]
+        if how not in ["left", "inner"]:
+            raise ValueError(f"Unknown join type {how}")
+
+        assigned = self.assign(events)
+        if how == "inner":
+            events = events[assigned >= 0]
+            assigned = assigned[assigned >= 0]
+
+        joined = events.reset_index(drop=True)
+        course_date_id = pd.array(assigned, dtype="Int64")
+        course_date_id[assigned < 0] = pd.NA
+        joined["course_date_id"] = course_date_id
+
+        course_columns = self.course_dates[columns].convert_dtypes(convert_string=False, convert_floating=False)
+        for column in columns:
+            joined[column] = course_columns[column].array.take(assigned, allow_fill=True)
+        return joined
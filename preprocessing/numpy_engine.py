@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# NumPy implementations of the relabelling loops in SignalPreprocessor.
+# They work on the sorted "time" column (int64 nanoseconds) and the
+# "event_type" column of a single room/door stream and reproduce the
+# results of the pandas implementations exactly.
+
+#######  Helper Functions ########
+def to_nanoseconds(**kwargs):
+    # same conversion as timedelta(**kwargs) in the pandas implementation
+    return pd.Timedelta(**kwargs).value
+
+def time_to_int(series:pd.Series):
+    return series.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+def neighborhood_bounds(positions, k, n_samples):
+    # rows x-k ... x+k (inclusive), as selected by get_neighborhood
+    lb = np.maximum(positions - k, 0)
+    ub = np.minimum(positions + k + 1, n_samples)
+    return lb, ub
+
+def window_bounds(times, positions, delta, lb, ub):
+    # rows with time in [t_x - delta, t_x + delta] inside the neighborhood,
+    # times are sorted so the rows form a contiguous block
+    x_times = times[positions]
+    w_lb = np.searchsorted(times, x_times - delta, side="left")
+    w_ub = np.searchsorted(times, x_times + delta, side="right")
+    return np.maximum(w_lb, lb), np.minimum(w_ub, ub)
+
+def nsmallest_positions(abs_diff, n):
+    # mirrors Series.nsmallest(n): stable selection if n < len,
+    # otherwise a (quicksort) sort_values of the whole series.
+    # The quicksort is done on timedelta64 like pandas does, since numpy
+    # uses a different (simd) algorithm for int64 which orders ties differently
+    if n <= 0:
+        return abs_diff[:0].astype(np.intp)
+    if n >= len(abs_diff):
+        return np.argsort(abs_diff.view("m8[ns]"), kind="quicksort")[:n]
+    return np.argsort(abs_diff, kind="stable")[:n]
+
+def majority_vote_closest(times, event_types, reference_time, n, target_removed):
+    # equivalent of SignalPreprocessor.event_type_majority_vote_closest
+    abs_diff = np.abs(times - reference_time)
+    if target_removed:
+        idx = nsmallest_positions(abs_diff, n)
+    else:
+        idx = nsmallest_positions(abs_diff, n + 1)[1:n + 1]
+
+    if len(idx) == 0:
+        # same behaviour as mode().iloc[0] on an empty selection
+        raise IndexError("single positional indexer is out-of-bounds")
+    # event types are small non-negative integers -> count them directly,
+    # argmax resolves ties by the smallest event type, like Series.mode
+    counts = np.bincount(event_types[idx])
+    return np.argmax(counts)
+
+#######  Relabelling Engines ########
+def relabel_time_window(times, event_types, low_support, k, ns, nm, s):
+    """
+    Relabels the low support samples of one room/door stream,
+    see SignalPreprocessor.filter_data_time_window
+    """
+    event_types = event_types.copy()
+    n_samples = len(times)
+    positions = np.flatnonzero(low_support)
+
+    # precompute the k-neighborhoods and +-s second windows of all samples
+    lb, ub = neighborhood_bounds(positions, k, n_samples)
+    w_lb, w_ub = window_bounds(times, positions, to_nanoseconds(seconds=s), lb, ub)
+    use_neighborhood = (w_ub - w_lb) == 1
+
+    # the votes have to be done in order since relabelled samples
+    # take part in the votes of the following samples
+    for x, i1, i2, j1, j2, fallback in zip(positions, lb, ub, w_lb, w_ub, use_neighborhood):
+        # a sample without neighbors keeps its event type
+        if i2 - i1 == 1:
+            continue
+        if fallback:
+            event_types[x] = majority_vote_closest(times[i1:i2], event_types[i1:i2], times[x], nm, target_removed=False)
+        else:
+            event_types[x] = majority_vote_closest(times[j1:j2], event_types[j1:j2], times[x], ns, target_removed=False)
+
+    return event_types
+
+def relabel_event_type_5_6(times, event_types, k, s, m, ns, nm, mask=None):
+    """
+    Relabels the event type 5 and 6 samples of one room/door stream,
+    invalid samples are marked with -1, see SignalPreprocessor.handle_event_type_5_6
+    If a mask is given only the samples in the mask are relabelled.
+    """
+    event_types = event_types.copy()
+    n_samples = len(times)
+    to_relabel = (event_types == 5) | (event_types == 6)
+    if mask is not None:
+        to_relabel = to_relabel & mask
+    positions = np.flatnonzero(to_relabel)
+
+    # precompute the k-neighborhoods, the +-s second windows and 
+    # the +-m minute windows of all samples
+    lb, ub = neighborhood_bounds(positions, k, n_samples)
+    s_lb, s_ub = window_bounds(times, positions, to_nanoseconds(seconds=s), lb, ub)
+    m_lb, m_ub = window_bounds(times, positions, to_nanoseconds(minutes=m), lb, ub)
+
+    # the votes have to be done in order since relabelled samples
+    # take part in the votes of the following samples
+    for x, j1, j2, l1, l2 in zip(positions, s_lb, s_ub, m_lb, m_ub):
+        # try the s second window first
+        valid = (event_types[j1:j2] == 0) | (event_types[j1:j2] == 1)
+        if valid.any():
+            window_times = times[j1:j2][valid]
+            window_event_types = event_types[j1:j2][valid]
+            if len(window_event_types) == 1:
+                event_types[x] = window_event_types[0]
+            else:
+                event_types[x] = majority_vote_closest(window_times, window_event_types, times[x], ns, target_removed=True)
+            continue
+        
+        # fall back to the m minute window
+        valid = (event_types[l1:l2] == 0) | (event_types[l1:l2] == 1)
+        if not valid.any():
+            # mark as invalid and discard later
+            event_types[x] = -1
+        else:
+            event_types[x] = majority_vote_closest(times[l1:l2][valid], event_types[l1:l2][valid], times[x], nm, target_removed=True)
+
+    return event_types
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+from preprocessing.preprocessor import CoursePreprocessor
+
+class OccupancyEngine:
+    """
+    Occupancy of the rooms computed from the cleaned light gate events
+    (output of SignalPreprocessor, event_type 1 = in, 0 = out, both doors of a room are combined).
+
+    correction:
+    - None: the counts are summed up over the whole period
+    - "reset": the counts are reset to 0 every day at reset_time (rooms are empty at night)
+    - "drift": the occupancy left at the end of a day is removed linearly over the day,
+      so the occupancy starts and ends every day at 0 (float values)
+
+    The occupancy is clipped to [0, room capacity] after every event if clip is set
+    (saturating sum), e.g. an out event in an empty room is ignored instead of lowering
+    the occupancy after the following in events. Rooms without a capacity in
+    room_capacities are only clipped at 0. n_in and n_out are not clipped.
+    """
+    corrections = [None, "reset", "drift"]
+    ns_per_day = 24 * 60 * 60 * 10**9
+
+    def __init__(self, events, room_capacities=None, correction="reset", reset_time="04:00:00", clip=True):
+        if correction not in self.corrections:
+            raise ValueError(f"Unknown correction {correction}, use one of {self.corrections}")
+        if room_capacities is None:
+            room_capacities = CoursePreprocessor.room_capacities
+
+        self.room_capacities = room_capacities
+        self.correction = correction
+        self.reset_offset = pd.Timedelta(reset_time).value
+        self.clip = clip
+
+        # events sorted by room and time (stable)
+        times = events["time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        room_ids = events["room_id"].to_numpy()
+        order = np.lexsort((times, room_ids))
+        self.events = events.iloc[order].reset_index(drop=True)
+        self.times = times[order]
+        self.room_ids = room_ids[order]
+
+        self.segments, self.segment_starts = self.get_segments()
+        self.n_in, self.n_out, self.occupancy = self.compute_occupancy()
+
+    ####### Helper Methods ########
+    def get_days(self, times):
+        # a day starts at reset_time
+        return (times - self.reset_offset) // self.ns_per_day
+
+    def get_boundaries(self, values):
+        # true where a new block of equal values starts
+        boundaries = np.ones(len(values), dtype=bool)
+        boundaries[1:] = values[1:] != values[:-1]
+        return boundaries
+
+    def get_segments(self):
+        # the counts are summed up per room (and per day for the corrections),
+        # returns the segment of every event and the first event of every segment
+        boundaries = self.get_boundaries(self.room_ids)
+        if self.correction is not None:
+            boundaries |= self.get_boundaries(self.get_days(self.times))
+        return np.cumsum(boundaries) - 1, np.flatnonzero(boundaries)
+
+    def segment_cumsum(self, values):
+        cumsum = np.cumsum(values)
+        offsets = (cumsum - values)[self.segment_starts]
+        return cumsum - offsets[self.segments]
+
+    def saturating_cumsum(self, occupancy, capacities):
+        """
+        Clips the running sum of every segment to [0, capacity] after every step,
+        occupancy is the unclipped running sum of the segments
+        """
+        if len(occupancy) == 0:
+            return occupancy
+        # clipping at 0 lifts the sum by its running minimum (if negative), the segments
+        # are shifted apart so that the running minimum does not cross segment boundaries
+        shift = 2 * np.abs(occupancy).max() + 1
+        running_min = np.minimum.accumulate(occupancy - self.segments * shift) + self.segments * shift
+        clipped = np.maximum(occupancy - np.minimum(running_min, 0), 0)
+
+        # segments that reach the capacity are continued step by step from the first event above it
+        above = np.flatnonzero(clipped > capacities)
+        if len(above) == 0:
+            return clipped
+        steps = np.diff(occupancy, prepend=0)
+        steps[self.segment_starts] = occupancy[self.segment_starts]
+        segment_stops = np.append(self.segment_starts[1:], len(occupancy))
+        segments, first = np.unique(self.segments[above], return_index=True)
+        for segment, start in zip(segments, above[first]):
+            stop = segment_stops[segment]
+            state = clipped[start - 1].item() if start > self.segment_starts[segment] else 0
+            states = []
+            # python scalars, indexing the arrays element by element is much slower
+            for step, capacity in zip(steps[start:stop].tolist(), capacities[start:stop].tolist()):
+                state = min(max(state + step, 0), capacity)
+                states.append(state)
+            clipped[start:stop] = states
+        return clipped
+
+    def get_capacities(self, room_ids):
+        capacities = pd.Series(room_ids).map(self.room_capacities).to_numpy(dtype=np.float64)
+        return np.where(np.isnan(capacities), np.inf, capacities)
+
+    ####### Occupancy ########
+    def compute_occupancy(self):
+        event_types = self.events["event_type"].to_numpy()
+        n_in = self.segment_cumsum((event_types == 1).astype(np.int64))
+        n_out = self.segment_cumsum((event_types == 0).astype(np.int64))
+        occupancy = n_in - n_out
+
+        if self.correction == "drift":
+            # remove the occupancy left at the end of the segment linearly in time
+            first = self.segment_starts
+            last = np.append(first[1:], len(self.times)) - 1
+            residual = occupancy[last][self.segments]
+            t_first = self.times[first][self.segments]
+            duration = (self.times[last] - self.times[first])[self.segments]
+            fraction = np.divide(self.times - t_first, duration, out=np.ones(len(self.times)), where=duration > 0)
+            occupancy = occupancy - residual * fraction
+
+        if self.clip:
+            occupancy = self.saturating_cumsum(occupancy, self.get_capacities(self.room_ids))
+        return n_in, n_out, occupancy
+
+    def event_occupancy(self):
+        """
+        Returns the events sorted by room and time with the cumulative
+        in/out counts and the occupancy after every event
+        """
+        df = self.events.copy()
+        df["n_in"] = self.n_in
+        df["n_out"] = self.n_out
+        df["occupancy"] = self.occupancy
+        return df
+
+    def state_at(self, room_slice, times):
+        # occupancy right before the given times (0 if the counts were reset since the last event)
+        room_times = self.times[room_slice]
+        idx = np.searchsorted(room_times, times, side="left") - 1
+        state = np.where(idx >= 0, self.occupancy[room_slice][np.maximum(idx, 0)], 0)
+        if self.correction is not None:
+            same_day = self.get_days(room_times[np.maximum(idx, 0)]) == self.get_days(times - 1)
+            state = np.where(same_day, state, 0)
+        return state
+
+    def resample(self, freq="5min", start=None, end=None):
+        """
+        Returns the occupancy per room on a regular grid of bins of size freq:
+        n_in/n_out: in/out events in the bin, occupancy: occupancy at the end of the bin,
+        occupancy_max: maximal occupancy during the bin
+        """
+        if start is None:
+            start = pd.Timestamp(self.times.min()).floor(freq)
+        if end is None:
+            end = pd.Timestamp(self.times.max()).floor(freq) + pd.Timedelta(freq)
+        edges = pd.date_range(start, end, freq=freq).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        n_bins = len(edges) - 1
+        is_in = self.events["event_type"].to_numpy() == 1
+        is_out = self.events["event_type"].to_numpy() == 0
+
+        frames = []
+        room_starts = np.flatnonzero(self.get_boundaries(self.room_ids))
+        room_stops = np.append(room_starts[1:], len(self.room_ids))
+        for room_start, room_stop in zip(room_starts, room_stops):
+            room_slice = slice(room_start, room_stop)
+            room_times = self.times[room_slice]
+            inside = (room_times >= edges[0]) & (room_times < edges[-1])
+            bins = np.searchsorted(edges, room_times[inside], side="right") - 1
+
+            n_in = np.bincount(bins, weights=is_in[room_slice][inside], minlength=n_bins).astype(np.int64)
+            n_out = np.bincount(bins, weights=is_out[room_slice][inside], minlength=n_bins).astype(np.int64)
+            state_start = self.state_at(room_slice, edges[:-1])
+            state_end = self.state_at(room_slice, edges[1:])
+
+            # maximum of the occupancy entering the bin, after the events in the bin
+            # and after a reset in the bin
+            occupancy_max = np.maximum(state_start, state_end).astype(np.float64)
+            np.maximum.at(occupancy_max, bins, self.occupancy[room_slice][inside])
+
+            frames.append(pd.DataFrame({"room_id":self.room_ids[room_start],
+                                        "time":edges[:-1].view("datetime64[ns]"),
+                                        "n_in":n_in, "n_out":n_out,
+                                        "occupancy":state_end,
+                                        "occupancy_max":occupancy_max.astype(self.occupancy.dtype)}))
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=["room_id", "time", "n_in", "n_out", "occupancy", "occupancy_max"])
+        return pd.concat(frames, axis=0).reset_index(drop=True)
@@ -1,16 +1,48 @@
 import os
+import re
+import copy
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
 
+from preprocessing import numpy_engine, time_parser
+from preprocessing.cache import ResultCache
+from preprocessing.streaming import StreamingRelabeller
+from preprocessing.profiling import StageProfiler, profile_stage
+
 class Preprocessor:
     
     time_format = "%a %b %d %H:%M:%S %Y"
     date_format = "%Y-%m-%d"
+    # time column used to derive the "date" partition
+    partition_time_column = None
+    
+    # preferred dtypes of the compact mode, used if the values fit
+    compact_schema = {}
+    # object columns stored as categoricals in the compact mode
+    categorical_columns = []
     
-    def __init__(self, room_to_id, door_to_id):
+    def __init__(self, room_to_id, door_to_id, profiler=None, compact_dtypes=False):
         self.room_to_id = room_to_id
         self.door_to_id = door_to_id
+        # StageProfiler that measures the stages, None -> no measurements
+        self.profiler = profiler
+        # compact_dtypes: smallest integer types and categoricals for the cleaned data
+        self.compact_dtypes = compact_dtypes
+    
+    def stage(self, name, rows_in=None):
+        # with self.stage("sort", len(df)) as record: ... record["rows_out"] = len(df)
+        return profile_stage(self.profiler, type(self).__name__, name, rows_in)
+    
+    def run_stage(self, name, method, dataframe, **kwargs):
+        # method(dataframe) -> dataframe measured as one stage
+        with self.stage(name, len(dataframe)) as record:
+            df = method(dataframe, **kwargs)
+            record["rows_out"] = len(df)
+        return df
            
     #######  File I/O Helper Methods ########
     def read_from_csv(self, path_to_file):
@@ -18,19 +50,104 @@ class Preprocessor:
         return data
     
     def save_to_csv(self, dataframe, path_to_file, file_name):
-        # store the data in the data directory
-        dataframe.to_csv(os.path.join(path_to_file, file_name) + ".csv", index=False)
-        # store the datatypes in the data directory
-        dataframe.dtypes.to_csv(os.path.join(path_to_file, file_name) + "_dtypes.csv", index=False)
+        with self.stage("save_csv", len(dataframe)) as record:
+            # store the data in the data directory
+            dataframe.to_csv(os.path.join(path_to_file, file_name) + ".csv", index=False)
+            # store the datatypes in the data directory
+            dataframe.dtypes.to_csv(os.path.join(path_to_file, file_name) + "_dtypes.csv", index=False)
+            record["rows_out"] = len(dataframe)
+        return True
+    
+    # columnar storage, needs pyarrow
+    def get_partitioning(self, partition_cols):
+        try:
+            import pyarrow as pa
+            import pyarrow.dataset as ds
+        except ImportError:
+            raise ImportError("Saving/loading parquet files requires pyarrow (pip install pyarrow)")
+        # partition values are read as strings and converted with the stored dtypes, 
+        # otherwise e.g. course number 340.100 would be inferred as float
+        return ds.partitioning(pa.schema([(x, pa.string()) for x in partition_cols]), flavor="hive")
+    
+    def save_to_parquet(self, dataframe, path_to_file, file_name, partition_cols=None, compression="zstd", append=False):
+        # append: add the data as new files to an existing partitioned dataset
+        with self.stage("save_parquet", len(dataframe)) as record:
+            record["rows_out"] = len(dataframe)
+            return self.write_to_parquet(dataframe, path_to_file, file_name, partition_cols, compression, append)
+    
+    def write_to_parquet(self, dataframe, path_to_file, file_name, partition_cols, compression, append):
+        df = dataframe.copy()
+        schema = {"dtypes":{col:str(dtype) for col, dtype in df.dtypes.items()}, 
+                  "partition_cols":partition_cols, "derived_cols":[]}
+        
+        if partition_cols is None:
+            df.to_parquet(os.path.join(path_to_file, file_name) + ".parquet", index=False, compression=compression)
+            return True
+        
+        # derive the date column from the time column of the data
+        if "date" in partition_cols and not "date" in df.columns:
+            df["date"] = df[self.partition_time_column].dt.strftime(self.date_format)
+            schema["derived_cols"].append("date")
+            
+        path = os.path.join(path_to_file, file_name)
+        if os.path.exists(path) and not append:
+            shutil.rmtree(path)
+        df.to_parquet(path, index=False, compression=compression, partition_cols=partition_cols)
+        
+        # store the datatypes and partitioning next to the data
+        with open(os.path.join(path, "_schema.json"), "w") as file:
+            json.dump(schema, file, indent=4)
+        return True
+    
+    def read_from_parquet(self, path_to_file, file_name, filters=None, columns=None):
+        # filters: list of (column, op, value) e.g. [("room_id", "==", 0), ("date", ">=", "2024-04-08")]
+        # only the partitions matching the filters on partition columns are read
+        path = os.path.join(path_to_file, file_name)
+        if not os.path.isdir(path):
+            return pd.read_parquet(path + ".parquet", filters=filters, columns=columns)
+        
+        with open(os.path.join(path, "_schema.json"), "r") as file:
+            schema = json.load(file)
+        partition_cols = schema["partition_cols"]
+        
+        # partition values are strings
+        if filters is not None:
+            filters = [(col, op, self.partition_filter_value(col, value) if col in partition_cols else value) 
+                       for col, op, value in filters]
+            
+        df = pd.read_parquet(path, filters=filters, columns=columns, 
+                             partitioning=self.get_partitioning(partition_cols))
+        
+        # restore column order and data types, partition columns are appended by pyarrow
+        df = df[[x for x in schema["dtypes"].keys() if x in df.columns]]
+        for col in df.columns:
+            df[col] = df[col].astype(schema["dtypes"][col])
+        return df
+    
+    def partition_filter_value(self, column_name, value):
+        if isinstance(value, (list, tuple, set)):
+            return [self.partition_filter_value(column_name, x) for x in value]
+        if column_name == "date":
+            return pd.Timestamp(value).strftime(self.date_format)
+        return str(value)
+    
+    def save_to_feather(self, dataframe, path_to_file, file_name, compression="zstd"):
+        dataframe.reset_index(drop=True).to_feather(os.path.join(path_to_file, file_name) + ".feather", compression=compression)
         return True
     
+    def read_from_feather(self, path_to_file, file_name, columns=None):
+        return pd.read_feather(os.path.join(path_to_file, file_name) + ".feather", columns=columns)
+    
     ####### Basic File Management Methods ########
     def get_all_sub_directories(self, path_to_dir):
-        sub_dirs = sorted(list(os.walk(path_to_dir))[0][1])
+        # only the top level, the sub directories are not walked
+        if not os.path.isdir(path_to_dir):
+            raise FileNotFoundError(f"Directory {path_to_dir} does not exist")
+        sub_dirs = sorted(next(os.walk(path_to_dir))[1])
         return sub_dirs
     
     def get_all_sub_files(self, path_to_dir): 
-        sub_files = sorted(list(os.walk(path_to_dir))[0][2])
+        sub_files = sorted(next(os.walk(path_to_dir))[2])
         return sub_files
     
     def get_and_filter_sub_files(self, path_to_files, name_pattern):
@@ -39,9 +156,33 @@ class Preprocessor:
     
     ####### Basic Data Manipulation ########
     def change_time_format(self, dataframe, column_name, format_str=time_format):
-        dataframe[column_name] = pd.to_datetime(dataframe[column_name], format=format_str)
+        # fixed width format of the light gate files -> fast parser
+        if format_str == time_parser.ctime_format:
+            dataframe[column_name] = time_parser.parse_ctime(dataframe[column_name])
+        else:
+            dataframe[column_name] = pd.to_datetime(dataframe[column_name], format=format_str)
         return dataframe
     
+    def downcast_integers(self, series, dtype=None):
+        # dtype if the values fit, otherwise the smallest integer type that holds them
+        if len(series) == 0:
+            return series.astype(dtype) if dtype is not None else series
+        if dtype is not None:
+            info = np.iinfo(dtype)
+            if info.min <= series.min() and series.max() <= info.max:
+                return series.astype(dtype)
+        return pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+    
+    def compact(self, dataframe):
+        # integer columns are downcast, the columns in categorical_columns become categoricals
+        df = dataframe.copy()
+        for col in df.columns:
+            if col in self.categorical_columns and df[col].dtype == object:
+                df[col] = df[col].astype("category")
+            elif pd.api.types.is_integer_dtype(df[col].dtype):
+                df[col] = self.downcast_integers(df[col], self.compact_schema.get(col))
+        return df
+    
     def rename_columns(self, dataframe, old_names, new_names):
         df = dataframe.copy(deep=True)
         df = df.rename(columns=dict(zip(old_names, new_names)))
@@ -50,17 +191,44 @@ class Preprocessor:
 # class CoursePreprocessor that inherits from Preprocessor
 class CoursePreprocessor(Preprocessor):
     room_capacities = {0:164, 1:152}
+    partition_time_column = "start_time"
+    compact_schema = {"room_id":"int8"}
+    # columns with few distinct values
+    categorical_columns = ["weekday", "room", "type", "kind", "semester", "level", 
+                           "study_area", "university", "language"]
 
-    def __init__(self, path_to_raw_courses, room_to_id, door_to_id):
-        super().__init__(room_to_id=room_to_id, door_to_id=door_to_id)
+    def __init__(self, path_to_raw_courses, room_to_id, door_to_id, profiler=None, rooms=None, compact_dtypes=False):
+        super().__init__(room_to_id=room_to_id, door_to_id=door_to_id, profiler=profiler, compact_dtypes=compact_dtypes)
         self.path_to_raw_courses = path_to_raw_courses
         self.time_format = "%d.%m.%y %H:%M"
+        # only the files of these rooms (names or ids) are read, None -> all rooms
+        self.rooms = rooms
         
-        ### Call the methods to read the data
-        self.raw_course_dates = self.read_course_dates_data(self.path_to_raw_courses)
-        self.raw_course_info = self.read_course_info_data(self.path_to_raw_courses)
+        ### The data is read on first use (get_raw_course_dates, get_raw_course_info)
+        self.raw_course_dates = None
+        self.raw_course_info = None
 
     ########## Read/Load Data ##########
+    def get_raw_course_dates(self):
+        if self.raw_course_dates is None:
+            with self.stage("ingest_course_dates") as record:
+                self.raw_course_dates = self.read_course_dates_data(self.path_to_raw_courses)
+                record["rows_out"] = len(self.raw_course_dates)
+        return self.raw_course_dates
+    
+    def get_raw_course_info(self):
+        if self.raw_course_info is None:
+            with self.stage("ingest_course_info") as record:
+                self.raw_course_info = self.read_course_info_data(self.path_to_raw_courses)
+                record["rows_out"] = len(self.raw_course_info)
+        return self.raw_course_info
+    
+    def filter_room_files(self, files):
+        if self.rooms is None:
+            return files
+        room_ids = [self.room_to_id.get(x, x) for x in self.rooms]
+        return [x for x in files if self.room_to_id[x.split("_")[0]] in room_ids]
+
     def read_and_assign_room(self, file, path_to_raw_data):
         
         df = self.read_from_csv(os.path.join(path_to_raw_data, file))
@@ -74,7 +242,7 @@ class CoursePreprocessor(Preprocessor):
     # data is structured differently so i decided to keep them separate
     def read_course_info_data(self, path_to_raw_data):
         # get all subfiles in the directory and filter them by the name pattern "courses"
-        sub_files = self.get_and_filter_sub_files(path_to_raw_data, "courses")
+        sub_files = self.filter_room_files(self.get_and_filter_sub_files(path_to_raw_data, "courses"))
         
         # read all the files and assign the room identifier stored in the file name
         dataframes = []
@@ -86,7 +254,7 @@ class CoursePreprocessor(Preprocessor):
     
     def read_course_dates_data(self, path_to_raw_data):
         # get all subfiles in the directory and filter them by the name pattern "dates"
-        sub_files = self.get_and_filter_sub_files(path_to_raw_data, "dates")
+        sub_files = self.filter_room_files(self.get_and_filter_sub_files(path_to_raw_data, "dates"))
         
         # read all the files and assign the room identifier stored in the file name
         dataframes = []
@@ -192,24 +360,155 @@ class CoursePreprocessor(Preprocessor):
         mask = ~dataframe["curriculum"].isna()
         dataframe.loc[mask, "curriculum"] = dataframe.loc[mask, "curriculum"].apply(lambda x: self.correct_curriculum_row(x))
         return dataframe
+    #######  Vectorized Methods ########
+    # same results as the methods above, without row-wise python functions
+    def format_course_number_vectorized(self, series):
+        # strings are kept, numbers are formatted with 3 decimals
+        values = series.to_numpy(dtype=object).copy()
+        is_str = series.str.len().notna().to_numpy() if series.dtype == object else np.zeros(len(series), dtype=bool)
+        if not is_str.all():
+            values[~is_str] = np.char.mod("%.3f", values[~is_str].astype(np.float64)).astype(object)
+        return pd.Series(values, index=series.index, name=series.name, dtype=object)
+    
+    def derive_timestamps_vectorized(self, dataframe, col_name_in, col_name_out):
+        dataframe["Datum"] = dataframe["Datum"].astype(str)
+        dataframe[col_name_in] = dataframe[col_name_in].astype(str)
+        
+        # dates and times repeat, parse the distinct dates and the distinct times once
+        # and add them, rows that do not parse are parsed as "date time" like in derive_timestamps
+        date_format, clock_format = self.time_format.split(" ")
+        date_codes, dates = pd.factorize(dataframe["Datum"])
+        clock_codes, clocks = pd.factorize(dataframe[col_name_in])
+        try:
+            dates = pd.to_datetime(pd.Series(dates, dtype=object), format=date_format).to_numpy()
+            clocks = (pd.to_datetime(pd.Series(clocks, dtype=object), format=clock_format) - pd.Timestamp("1900-01-01")).to_numpy()
+            # e.g. "nan" parses to NaT on its own but not as part of "date time"
+            if np.isnat(dates).any() or np.isnat(clocks).any():
+                raise ValueError("Missing dates or times")
+            dataframe[col_name_out] = dates[date_codes] + clocks[clock_codes]
+        except ValueError:
+            dataframe[col_name_out] = dataframe["Datum"] + " " + dataframe[col_name_in]
+            dataframe = self.change_time_format(dataframe, col_name_out, self.time_format)
+        return dataframe
+    
+    def format_dates_vectorized(self, dataframe):
+        dataframe = self.derive_timestamps_vectorized(dataframe, "Startzeit", "start_time")
+        dataframe = self.derive_timestamps_vectorized(dataframe, "Endzeit", "end_time")
+
+        dataframe.drop(["Datum", "Startzeit", "Endzeit"], axis=1, inplace=True)
+        return dataframe
+    
+    def add_room_capacity_vectorized(self, dataframe):
+        room_capacity = dataframe["room_id"].map(self.room_capacities)
+        if room_capacity.isna().any():
+            raise KeyError(dataframe.loc[room_capacity.isna(), "room_id"].iloc[0])
+        dataframe["room_capacity"] = room_capacity
+        return dataframe
+    
+    def get_digit_pattern(self, series):
+        # isdigit() is true for more characters than the regex \d (e.g. superscripts),
+        # add the ones that occur in the series
+        characters = set("".join(series.unique()))
+        digits = "".join(sorted(x for x in characters if x.isdigit() and not x.isdecimal()))
+        return "[\\d" + re.escape(digits) + "]"
+    
+    def correct_curriculum_vectorized(self, dataframe):
+        # remove all words that contain numbers together with the space in front of them,
+        # with a leading space every word has exactly one space in front of it
+        mask = ~dataframe["curriculum"].isna()
+        word = "[^ ]*" + self.get_digit_pattern(dataframe.loc[mask, "curriculum"]) + "[^ ]*"
+        corrected = (" " + dataframe.loc[mask, "curriculum"]).str.replace(" " + word, "", regex=True).str[1:]
+        dataframe.loc[mask, "curriculum"] = corrected
+        return dataframe
+    
+    def clean_raw_course_info_vectorized(self, dataframe):
+        df = dataframe.copy()
+        df.drop(["Nächster Termin", "SSt.", "Abhaltungssprache_subinfo", "Literatur", "Lehrinhalte wechselnd?"], axis=1, inplace=True)
+        
+        df = self.rename_columns(df, 
+                                 ["LVA-Nr.", "LVA-Titel", "Typ", "Art", "LeiterIn", "Sem.", "ECTS"], 
+                                 ["course_number", "course_name", "type", "kind", "lecturer", "semester", "ects"])
+        
+        df = self.rename_columns(df,
+                                 ["Institut", "E-Mail", "Ausbildungslevel", "Studienfachbereich", "Anbietende Uni", "Quellcurriculum", "Beurteilungskriterien", "Lehrmethoden", "Abhaltungssprache_studyhandbook", "Studienfach", "Sonstige Informationen"],
+                                 ["instute", "email", "level", "study_area", "university", "curriculum", "assessment_criteria", "teaching_methods", "language", "study_subject", "other_information"])
+        
+        df["course_number"] = self.format_course_number_vectorized(df["course_number"])
+        
+        df = df.drop_duplicates().reset_index(drop=True)
+        return df
+    
+    def clean_raw_course_dates_vectorized(self, dataframe):
+        df = dataframe.copy()
+        
+        df = self.format_dates_vectorized(df)
+        df = self.rename_columns(df,
+                                 ["LVA-Nummer", "Wochentag", "Ort", "Anmerkung"],
+                                 ["course_number", "weekday", "room", "note"])
+
+        df["note"] = df["note"].fillna("")  
+        df["course_number"] = self.format_course_number_vectorized(df["course_number"])
+        
+        df = df.drop_duplicates().reset_index(drop=True)
+        return df
+    
+    def enhance_dataset_vectorized(self, dataframe):
+        dataframe = self.add_room_capacity_vectorized(dataframe)
+        dataframe = self.add_calendar_week(dataframe, "start_time")
+        return dataframe
+    
     #######  Preprocessing Application ########
-    def apply_preprocessing(self):     
+    def apply_preprocessing(self, engine="pandas"):
+        # engine "vectorized" gives the same result without row-wise python functions
+        if engine == "vectorized":
+            return self.apply_preprocessing_vectorized()
+        
         # clean the raw dates 
-        cleaned_dates = self.clean_raw_course_dates(self.raw_course_dates)
-        cleaned_dates = self.enhance_dataset(cleaned_dates)
+        cleaned_dates = self.run_stage("clean_course_dates", self.clean_raw_course_dates, self.get_raw_course_dates())
+        cleaned_dates = self.run_stage("enhance_course_dates", self.enhance_dataset, cleaned_dates)
         # clean the raw course info
-        cleaned_courses = self.clean_raw_course_info(self.raw_course_info)
-        cleaned_courses = self.correct_curriculum(cleaned_courses)
+        cleaned_courses = self.run_stage("clean_course_info", self.clean_raw_course_info, self.get_raw_course_info())
+        cleaned_courses = self.run_stage("correct_curriculum", self.correct_curriculum, cleaned_courses)
         
+        if self.compact_dtypes:
+            cleaned_courses, cleaned_dates = self.compact(cleaned_courses), self.compact(cleaned_dates)
+        return cleaned_courses, cleaned_dates
+    
+    def apply_preprocessing_vectorized(self):
+        cleaned_dates = self.run_stage("clean_course_dates", self.clean_raw_course_dates_vectorized, self.get_raw_course_dates())
+        cleaned_dates = self.run_stage("enhance_course_dates", self.enhance_dataset_vectorized, cleaned_dates)
+        
+        cleaned_courses = self.run_stage("clean_course_info", self.clean_raw_course_info_vectorized, self.get_raw_course_info())
+        cleaned_courses = self.run_stage("correct_curriculum", self.correct_curriculum_vectorized, cleaned_courses)
+        
+        if self.compact_dtypes:
+            cleaned_courses, cleaned_dates = self.compact(cleaned_courses), self.compact(cleaned_dates)
         return cleaned_courses, cleaned_dates
     
 # class SignalPreprocessor that inherits from Preprocessor
 class SignalPreprocessor(Preprocessor):
+    partition_time_column = "time"
+    # daily windows in which samples are kept if discard_samples is set
+    discard_params = {"windows":[{"start":"07:40:00", "end":"22:00:00"}]}
+    # fixed types keep the dtypes of the chunks/directories consistent,
+    # event_type is signed since invalid samples are marked with -1
+    compact_schema = {"in_support_count":"uint16", "out_support_count":"uint16",
+                      "sensor_one_support_count":"uint16", "sensor_two_support_count":"uint16",
+                      "room_id":"int8", "door_id":"int8", "event_type":"int8"}
     
-    def __init__(self, path_to_data, room_to_id, door_to_id):
+    def __init__(self, path_to_data, room_to_id, door_to_id, n_workers=None, cache_dir=None, max_parameter_sets=3, profiler=None,
+                 start_date=None, end_date=None, rooms=None, compact_dtypes=False):
         
         # initialize the parent class
-        super().__init__(room_to_id=room_to_id, door_to_id=door_to_id)
+        super().__init__(room_to_id=room_to_id, door_to_id=door_to_id, profiler=profiler, compact_dtypes=compact_dtypes)
+        
+        # number of processes used to read the raw data, None -> serial
+        self.n_workers = n_workers
+        
+        # cache of cleaned results per data directory, None -> no caching
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ResultCache(cache_dir, max_parameter_sets=max_parameter_sets)
 
         self.date_lowerbound_signal = datetime.strptime("2024-04-07", self.date_format)
         self.raw_data_format_signal = ['Entering', 'Time', 
@@ -219,89 +518,282 @@ class SignalPreprocessor(Preprocessor):
     
         self.path_to_data = path_to_data 
         
-        # get all subdirectories in the data directory
-        self.list_dirs = self.get_list_of_data_dirs()
-        # extract all the raw data
-        self.raw_uncleaned_data = self.accumulate_raw_data(self.list_dirs)
+        # only the data directories of the days start_date <= day <= end_date ("YYYY-MM-DD")
+        # and of the rooms (names or ids) are read, None -> no restriction
+        self.start_date = start_date
+        self.end_date = end_date
+        self.rooms = rooms
+        
+        # nothing is read here, the archive is listed and the directories are read on first use,
+        # the door dataframes are kept in loaded_directories only until they are concatenated
+        self.list_dirs = None
+        self.loaded_directories = {}
+        self.raw_uncleaned_data = None
+        # directories of raw_uncleaned_data and the directory (position) of every sample
+        self.raw_directories = None
+        self.raw_directory_index = None
     
     #######  Data Extraction Helper Methods ########
-    def filter_directories(self, directories:list):
+    def matches_filters(self, dir_name, start_date=None, end_date=None, rooms=None):
+        day = datetime.strptime(dir_name.split("_")[2], self.date_format)
+        if not self.date_lowerbound_signal < day:
+            return False
+        if start_date is not None and day < pd.Timestamp(start_date).normalize():
+            return False
+        if end_date is not None and day > pd.Timestamp(end_date):
+            return False
+        if rooms is not None:
+            room_name = dir_name.split("_")[1]
+            room_ids = [self.room_to_id.get(x, x) for x in rooms]
+            if self.room_to_id.get(room_name, room_name) not in room_ids:
+                return False
+        return True
+    
+    def filter_directories(self, directories:list, start_date=None, end_date=None, rooms=None):
         filtered_dirs = []
         for x in directories:
-            day = datetime.strptime(x.split("_")[2], self.date_format)
-            if self.date_lowerbound_signal < day:
+            if self.matches_filters(x, start_date, end_date, rooms):
                 filtered_dirs.append(x)
         return filtered_dirs
       
-    def get_list_of_data_dirs(self):
+    def get_list_of_data_dirs(self, apply_filters=True):
+        # apply_filters=False: all directories after date_lowerbound_signal
         path = os.path.join(self.path_to_data)
         sub_dirs = self.get_all_sub_directories(path)
-        filtered = self.filter_directories(sub_dirs)
+        if not apply_filters:
+            return self.filter_directories(sub_dirs)
+        filtered = self.filter_directories(sub_dirs, self.start_date, self.end_date, self.rooms)
         return filtered
     
+    def get_data_dirs(self, start_date=None, end_date=None, rooms=None):
+        # directories selected in the constructor, optionally restricted further
+        if self.list_dirs is None:
+            self.list_dirs = self.get_list_of_data_dirs()
+        return self.filter_directories(self.list_dirs, start_date, end_date, rooms)
+    
+    def get_raw_data(self, start_date=None, end_date=None, rooms=None):
+        """
+        Returns the raw samples of the selected directories. Without arguments the result
+        is kept in raw_uncleaned_data, later calls with filters select their samples from
+        it instead of reading the directories again.
+        """
+        if start_date is None and end_date is None and rooms is None:
+            if self.raw_uncleaned_data is None:
+                self.raw_directories = self.get_data_dirs()
+                df = self.accumulate_raw_data(self.raw_directories, tag_directories=True)
+                self.raw_directory_index = df.pop("Dir_Index").to_numpy()
+                self.raw_uncleaned_data = df
+            return self.raw_uncleaned_data
+        
+        return self.get_raw_data_of_directories(self.get_data_dirs(start_date, end_date, rooms))
+    
+    def get_raw_data_of_directories(self, data_dirs, tag_directories=False):
+        # samples of the given directories, selected from raw_uncleaned_data if they are loaded,
+        # tag_directories: "Dir_Index" column with the position of the directory in data_dirs
+        if self.raw_uncleaned_data is not None:
+            positions = pd.Index(self.raw_directories).get_indexer(data_dirs)
+            if (positions >= 0).all():
+                mask = np.isin(self.raw_directory_index, positions)
+                df = self.raw_uncleaned_data[mask].reset_index(drop=True)
+                if tag_directories:
+                    dir_positions = np.full(len(self.raw_directories), -1)
+                    dir_positions[positions] = np.arange(len(data_dirs))
+                    df["Dir_Index"] = dir_positions[self.raw_directory_index[mask]]
+                return df
+        return self.accumulate_raw_data(data_dirs, tag_directories=tag_directories)
+    
+    def clear_loaded_data(self):
+        self.loaded_directories = {}
+        self.raw_uncleaned_data = None
+        self.raw_directories = None
+        self.raw_directory_index = None
+    
     #######  Data Extraction Methods ######## 
-    def accumulate_raw_data(self, data_directories):
+    def read_data_directory(self, data_dir_name):
         
-        accumulated_format = self.raw_data_format_signal + ["Room_ID", "Door_ID"]
-        df_accumulated = pd.DataFrame(columns=self.raw_data_format_signal)
-        samples = 0
-        for data_dir_name in data_directories:
-
-            path = os.path.join(self.path_to_data, data_dir_name)
-            file_list = self.get_all_sub_files(path)
-            
-            # sanity check
-            # check if the directory contains the correct files
-            #if "door1.csv", "door2.csv", "format.csv":
-            # delete all other files            
-            file_list = [x for x in file_list if x in ["door1.csv", "door2.csv", "format.csv"]]
-            
-            if not "door1.csv" in file_list or not "door2.csv" in file_list or not "format.csv" in file_list:
-                print(path)
-                print(file_list)
-                raise ValueError("Data directory does not contain the correct files")
-            
-            room_name = data_dir_name.split("_")[1]
-            room_id = self.room_to_id[room_name]
+        path = os.path.join(self.path_to_data, data_dir_name)
+        file_list = self.get_all_sub_files(path)
+        
+        # sanity check
+        # check if the directory contains the correct files
+        #if "door1.csv", "door2.csv", "format.csv":
+        # delete all other files            
+        file_list = [x for x in file_list if x in ["door1.csv", "door2.csv", "format.csv"]]
+        
+        if not "door1.csv" in file_list or not "door2.csv" in file_list or not "format.csv" in file_list:
+            print(path)
+            print(file_list)
+            raise ValueError("Data directory does not contain the correct files")
+        
+        dataframes = []
+        for x in file_list[:-1]:
+            dataframes.append(self.read_door_file(data_dir_name, x))
             
-            for x in file_list[:-1]:
-                
-                door_name = x.split(".")[0]
-                door_id = self.door_to_id[door_name]
-                
-                file_path = os.path.join(path, x) 
-
+        return dataframes
+    
+    def read_door_file(self, data_dir_name, door_file):
         
-                df = pd.read_csv(file_path, names=self.raw_data_format_signal)
-                
-                df = self.change_time_format(df, "Time", self.time_format).sort_values(by="Time", ascending=False)
-                df["Room_ID"] = room_id
-                df["Door_ID"] = door_id
+        room_name = data_dir_name.split("_")[1]
+        room_id = self.room_to_id[room_name]
+        
+        door_name = door_file.split(".")[0]
+        door_id = self.door_to_id[door_name]
+        
+        file_path = os.path.join(self.path_to_data, data_dir_name, door_file) 
 
-                samples += len(df)
-                df_accumulated = pd.concat([df_accumulated, df], axis=0)
+        df = pd.read_csv(file_path, names=self.raw_data_format_signal)
+        
+        df = self.change_time_format(df, "Time", self.time_format).sort_values(by="Time", ascending=False, kind="stable")
+        df["Room_ID"] = room_id
+        df["Door_ID"] = door_id
+        
+        if self.compact_dtypes:
+            df = self.compact(df)
+        return df
+    
+    def accumulate_raw_data(self, data_directories, tag_directories=False):
+        # rows_in of the ingest stage are the data directories
+        with self.stage("ingest", len(data_directories)) as record:
+            self.load_data_directories(data_directories)
+            df_accumulated, dir_index = self.concat_data_directories(data_directories)
+            # remember the directory (position in data_directories) of every sample
+            if tag_directories:
+                df_accumulated["Dir_Index"] = dir_index
+            record["rows_out"] = len(df_accumulated)
+        return df_accumulated
+    
+    def load_data_directories(self, data_directories):
+        # read the directories that are not loaded yet, either one after another or on a process pool
+        missing = [x for x in data_directories if x not in self.loaded_directories]
+        if len(missing) == 0:
+            return
+        if self.n_workers is None or self.n_workers <= 1:
+            dataframes = [self.read_data_directory(x) for x in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                dataframes = list(executor.map(self.get_worker().read_data_directory, missing))
         
-        return df_accumulated.reset_index(drop=True)
+        for dir_name, dir_dataframes in zip(missing, dataframes):
+            self.loaded_directories[dir_name] = dir_dataframes
+    
+    def concat_data_directories(self, data_directories):
+        # the door dataframes are released, only the concatenated samples are kept,
+        # returns them and the directory (position in data_directories) of every sample
+        dataframes = [self.loaded_directories.pop(x) for x in data_directories]
+        lengths = [sum([len(df) for df in dir_dataframes]) for dir_dataframes in dataframes]
+        dir_index = np.repeat(np.arange(len(data_directories)), lengths)
+        
+        # flatten the list of door dataframes and concatenate them once,
+        # the result has the dtypes of the door files (see read_door_file)
+        dataframes = [df for dir_dataframes in dataframes for df in dir_dataframes]
+        if len(dataframes) == 0:
+            return self.get_empty_raw_data(), dir_index
+        
+        df_accumulated = pd.concat(dataframes, axis=0)
+        return df_accumulated.reset_index(drop=True), dir_index
+    
+    def get_empty_raw_data(self):
+        # no samples, same columns and dtypes as a concatenation of door files
+        columns = self.raw_data_format_signal + ["Room_ID", "Door_ID"]
+        df = pd.DataFrame(columns=columns).astype("int64").astype({"Time":"datetime64[ns]"})
+        if self.compact_dtypes:
+            df = self.compact(df)
+        return df
       
     #######  Data Cleaning Methods ########    
+    def sort_by_time(self, dataframe):
+        # stable sort, samples with identical timestamps keep the order of the door file
+        # and are ordered by room and door -> the batch, streaming and cached runs agree
+        return dataframe.sort_values(by=["time", "room_id", "door_id"], kind="stable").reset_index(drop=True)
+    
+    def time_of_day(self, dataframe):
+        # time since midnight of every sample
+        return dataframe["time"] - dataframe["time"].dt.normalize()
+    
     def discard_samples(self, dataframe, lb, ub):
+        # keep samples with lb <= time of day <= ub (datetime.time)
         df = dataframe.copy()
-        mask  = df.apply(lambda x: (x["time"].time() >= lb) & (x["time"].time() <= ub), axis=1)
+        lb = timedelta(hours=lb.hour, minutes=lb.minute, seconds=lb.second, microseconds=lb.microsecond)
+        ub = timedelta(hours=ub.hour, minutes=ub.minute, seconds=ub.second, microseconds=ub.microsecond)
+        time_of_day = self.time_of_day(df)
+        mask = (time_of_day >= lb) & (time_of_day <= ub)
+        df = df[mask].reset_index(drop=True)
+        return df
+    
+    def discard_samples_by_windows(self, dataframe, windows:list):
+        # keep samples that lie in at least one of the daily windows of their room
+        # window: {"start":"07:40:00", "end":"22:00:00", "room_id":0 (optional), "weekdays":[5,6] (optional, 0=Monday)}
+        df = dataframe.copy()
+        time_of_day = self.time_of_day(df)
+        weekday = df["time"].dt.weekday
+        
+        mask = pd.Series(False, index=df.index)
+        for window in windows:
+            in_window = (time_of_day >= pd.Timedelta(window["start"])) & (time_of_day <= pd.Timedelta(window["end"]))
+            if window.get("room_id") is not None:
+                in_window &= df["room_id"] == window["room_id"]
+            if window.get("weekdays") is not None:
+                in_window &= weekday.isin(window["weekdays"])
+            mask |= in_window
+            
         df = df[mask].reset_index(drop=True)
         return df
 
-    def df_room_door_dict(self, df:pd.DataFrame):
-        room_door_dict = {}
-        for room in df["room_id"].unique():
-            room_dict = {}
-            for door in df["door_id"].unique():
-                mask = (df["room_id"] == room) & (df["door_id"] == door)
-                if mask.sum() == 0:
-                    continue
-                else:
-                    room_dict[door] = df[mask].reset_index(drop=True)
-            room_door_dict[room] = room_dict
-        return room_door_dict
+    def partition_room_door(self, df:pd.DataFrame):
+        # reorder the (time sorted) samples once so that every room/door stream is a contiguous block,
+        # the streams are ordered by first appearance of room and door and keep their time order
+        rooms = df["room_id"].unique()
+        doors = df["door_id"].unique()
+        stream_key = pd.Index(rooms).get_indexer(df["room_id"]) * len(doors) + pd.Index(doors).get_indexer(df["door_id"])
+        
+        order = np.argsort(stream_key, kind="stable")
+        df_sorted = df.take(order).reset_index(drop=True)
+        stream_key = stream_key[order]
+        
+        # start and stop of every stream
+        starts = np.flatnonzero(np.diff(stream_key, prepend=-1) != 0)
+        stops = np.append(starts[1:], len(stream_key))
+        partitions = [(rooms[stream_key[x] // len(doors)], doors[stream_key[x] % len(doors)], x, y) for x, y in zip(starts, stops)]
+        
+        return df_sorted, partitions
+    
+    def relabel_streams(self, df:pd.DataFrame, relabel_name, relabel_params:dict, n_workers=None):
+        # applies the relabel method (df_room_door -> event types) to the slices of every 
+        # room/door stream and writes the results into one event type array
+        # with n_workers > 1 the streams are relabelled on a process pool
+        df_sorted, partitions = self.partition_room_door(df)
+        slices = [df_sorted.iloc[start:stop] for room, door, start, stop in partitions]
+        
+        if n_workers is None or n_workers <= 1 or len(partitions) <= 1:
+            results = [self.relabel_stream(relabel_name, relabel_params, x) for x in slices]
+        else:
+            worker = self.get_worker()
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                # map keeps the order of the streams -> same result as the serial run
+                results = list(executor.map(worker.relabel_stream, [relabel_name] * len(slices), 
+                                            [relabel_params] * len(slices), slices))
+        
+        event_types = df_sorted["event_type"].to_numpy().copy()
+        for (room, door, start, stop), result in zip(partitions, results):
+            event_types[start:stop] = result
+        if self.profiler is not None:
+            self.profiler.add_relabelled((event_types != df_sorted["event_type"].to_numpy()).sum())
+        df_sorted["event_type"] = event_types
+        
+        return df_sorted
+    
+    def relabel_stream(self, relabel_name, relabel_params:dict, df_room_door):
+        return getattr(self, relabel_name)(df_room_door, **relabel_params)
+    
+    def get_worker(self):
+        # copy without the loaded data and the profiler, it is sent to every worker process
+        worker = copy.copy(self)
+        worker.raw_uncleaned_data = None
+        worker.raw_directories = None
+        worker.raw_directory_index = None
+        worker.loaded_directories = {}
+        worker.profiler = None
+        return worker
     
     def event_type_majority_vote_closest(self, dataframe, reference_time, n, target_removed):
         df = dataframe
@@ -345,7 +837,7 @@ class SignalPreprocessor(Preprocessor):
         
         return df
     
-    def filter_data_n_closest(self, dataframe, k, nm, lb_in, lb_out, handle_5, handle_6, **kwargs):
+    def filter_data_n_closest(self, dataframe, k, nm, lb_in, lb_out, handle_5, handle_6, n_workers=None, **kwargs):
         df = dataframe.copy()
         
         event_list = [0,1]
@@ -354,40 +846,44 @@ class SignalPreprocessor(Preprocessor):
         if handle_6:
             event_list.append(6)
             
-        df = df[df["event_type"].isin(event_list)].sort_values(by="time", ascending=True).reset_index(drop=True)
-         
-        dict_df_room_door = self.df_room_door_dict(df)
-        df_return = pd.DataFrame(columns=list(df.columns))
-        df_return = df_return.astype(df.dtypes)
-        
-        for room, room_dict in dict_df_room_door.items():
-            for door, df_room_door in room_dict.items():  
-                
-                # deal with events with low directional support! 
-                df_test = df_room_door.copy()
-            
-                # filter out samples with low support count
-                df_test = df_test[(df_test["in_support_count"] < lb_in) 
-                                & (df_test["out_support_count"] < lb_out)]
-            
+        df = self.sort_by_time(df[df["event_type"].isin(event_list)])
         
-                for x in df_test.index:
-                    # use index to get row
-                    x_row = df_room_door.loc[x]
-                    x_time = x_row["time"]
-                    #x_door = x_row["door_id"]
-                    #x_room = x_row["room_id"]
-                    # select neighborhood of sample
-                    rows = self.get_neighborhood(df_room_door, x, k)
-                    # from the neighborhood select the n with the closest time stamp 
-                    common_event_type = self.event_type_majority_vote_closest(rows, x_time, nm, targte_removed=False)
-                    df_room_door.loc[x, "event_type"] = common_event_type
-                    
-                df_return = pd.concat([df_return, df_room_door], axis=0)
+        df_return = self.relabel_streams(df, "relabel_n_closest", {"k":k, "nm":nm, "lb_in":lb_in, "lb_out":lb_out}, 
+                                         n_workers=n_workers)
             
         return df_return
+    
+    def relabel_n_closest(self, dataframe, k, nm, lb_in, lb_out, mask=None):
+        # mask: only these samples are relabelled (used by the streaming mode)
+        df_room_door = dataframe.copy().reset_index(drop=True)
+        
+        # deal with events with low directional support! 
+        df_test = df_room_door.copy()
+    
+        # filter out samples with low support count
+        low_support = (df_test["in_support_count"] < lb_in) & (df_test["out_support_count"] < lb_out)
+        if mask is not None:
+            low_support &= mask
+        df_test = df_test[low_support]
+    
+        for x in df_test.index:
+            # use index to get row
+            x_row = df_room_door.loc[x]
+            x_time = x_row["time"]
+            #x_door = x_row["door_id"]
+            #x_room = x_row["room_id"]
+            # select neighborhood of sample
+            rows = self.get_neighborhood(df_room_door, x, k)
+            # a sample without neighbors (e.g. the only sample of a stream) keeps its event type
+            if len(rows) == 1:
+                continue
+            # from the neighborhood select the n with the closest time stamp 
+            common_event_type = self.event_type_majority_vote_closest(rows, x_time, nm, target_removed=False)
+            df_room_door.loc[x, "event_type"] = common_event_type
+            
+        return df_room_door["event_type"].to_numpy()
             
-    def filter_data_time_window(self, dataframe, k, ns, nm, s, lb_in, lb_out, handle_5, handle_6, **kwargs):
+    def filter_data_time_window(self, dataframe, k, ns, nm, s, lb_in, lb_out, handle_5, handle_6, engine="pandas", n_workers=None, **kwargs):
         df = dataframe.copy()
         
         event_list = [0,1]
@@ -396,54 +892,78 @@ class SignalPreprocessor(Preprocessor):
         if handle_6:
             event_list.append(6)
             
+        df = self.sort_by_time(df[df["event_type"].isin(event_list)])
+        
+        relabel_name = "relabel_time_window_numpy" if engine == "numpy" else "relabel_time_window"
+        df_return = self.relabel_streams(df, relabel_name, {"k":k, "ns":ns, "nm":nm, "s":s, "lb_in":lb_in, "lb_out":lb_out}, 
+                                         n_workers=n_workers)
 
-        df = df[df["event_type"].isin(event_list)].sort_values(by="time", ascending=True).reset_index(drop=True)
-         
-        dict_df_room_door = self.df_room_door_dict(df)
-        df_return = pd.DataFrame(columns=list(df.columns))
-        df_return = df_return.astype(df.dtypes)
-       
-        
-        for room, room_dict in dict_df_room_door.items():
-            for door, df_room_door in room_dict.items():  
-                
-                # deal with events with low directional support!
-                df_test = df_room_door.copy()
-            
-                # filter out samples with low support count
-                df_test = df_test[(df_test["in_support_count"] < lb_in) 
-                                & (df_test["out_support_count"] < lb_out)]
-                
-                #handle the samples with low support count
-                for x in df_test.index:
-                    # use index to get row
-                    x_row = df_room_door.loc[x]
-                    x_time = x_row["time"]
-            
-                    # select neighborhood of sample
-                    rows = self.get_neighborhood(df_room_door, x, k)
-            
-                    # try time filter first -> more reliable
-                    x_time_lb = x_time - timedelta(seconds=s)
-                    x_time_ub = x_time + timedelta(seconds=s)
-                    rows_time_filtered = rows[(rows["time"] >= x_time_lb) & (rows["time"] <= x_time_ub)]
+        return df_return
+    
+    def relabel_time_window(self, dataframe, k, ns, nm, s, lb_in, lb_out):
+        df_room_door = dataframe.copy().reset_index(drop=True)
+        
+        # deal with events with low directional support!
+        df_test = df_room_door.copy()
+    
+        # filter out samples with low support count
+        df_test = df_test[(df_test["in_support_count"] < lb_in) 
+                        & (df_test["out_support_count"] < lb_out)]
+        
+        #handle the samples with low support count
+        for x in df_test.index:
+            # use index to get row
+            x_row = df_room_door.loc[x]
+            x_time = x_row["time"]
+    
+            # select neighborhood of sample
+            rows = self.get_neighborhood(df_room_door, x, k)
+            # a sample without neighbors (e.g. the only sample of a stream) keeps its event type
+            if len(rows) == 1:
+                continue
+    
+            # try time filter first -> more reliable
+            x_time_lb = x_time - timedelta(seconds=s)
+            x_time_ub = x_time + timedelta(seconds=s)
+            rows_time_filtered = rows[(rows["time"] >= x_time_lb) & (rows["time"] <= x_time_ub)]
+    
+            # if only one sample in time window
+            if len(rows_time_filtered) == 1:
+                # select make majority vote with the n closeste neighbors
+                common_event_type = self.event_type_majority_vote_closest(rows, x_time, nm, target_removed=False)
+            # if more than one sample in time window     
+            else:
+                # make majority vote with the samples in the time window
+                common_event_type = self.event_type_majority_vote_closest(rows_time_filtered, x_time, ns, target_removed=False)
+        
+            df_room_door.loc[x, "event_type"] = common_event_type
             
-                    # if only one sample in time window
-                    if len(rows_time_filtered) == 1:
-                        # select make majority vote with the n closeste neighbors
-                        common_event_type = self.event_type_majority_vote_closest(rows, x_time, nm, target_removed=False)
-                    # if more than one sample in time window     
-                    else:
-                        # make majority vote with the samples in the time window
-                        common_event_type = self.event_type_majority_vote_closest(rows_time_filtered, x_time, ns, target_removed=False)
-                
-                    df_room_door.loc[x, "event_type"] = common_event_type
-                    
-                df_return = pd.concat([df_return, df_room_door], axis=0)
+        return df_room_door["event_type"].to_numpy()
 
-        return df_return
+    def relabel_time_window_numpy(self, df_room_door, k, ns, nm, s, lb_in, lb_out, mask=None):
+        # same relabelling as the loop in filter_data_time_window, on numpy arrays
+        # mask: only these samples are relabelled (used by the streaming mode)
+        low_support = ((df_room_door["in_support_count"] < lb_in) 
+                       & (df_room_door["out_support_count"] < lb_out)).to_numpy()
+        if mask is not None:
+            low_support = low_support & mask
+        
+        event_types = numpy_engine.relabel_time_window(numpy_engine.time_to_int(df_room_door["time"]), 
+                                                       df_room_door["event_type"].to_numpy(), 
+                                                       low_support, k=k, ns=ns, nm=nm, s=s)
+        return event_types
 
     def handle_event_type_5_6(self, dataframe, k, s, m, ns, nm):
+        df = dataframe.copy().reset_index(drop=True)
+        df["event_type"] = self.relabel_event_type_5_6(df, k=k, s=s, m=m, ns=ns, nm=nm)
+        
+        # discard invalid samples
+        df = df[df["event_type"] != -1].reset_index(drop=True)   
+                
+        return df
+    
+    def relabel_event_type_5_6(self, dataframe, k, s, m, ns, nm):
+        # invalid samples are marked with -1
         df = dataframe.copy().reset_index(drop=True)
         mask = ((df["event_type"] == 6) | (df["event_type"] == 5))
         
@@ -480,12 +1000,27 @@ class SignalPreprocessor(Preprocessor):
                     common_event_type = self.event_type_majority_vote_closest(rows_time_filtered, x_time, nm, target_removed=True)
                     df.loc[x, "event_type"] = common_event_type
                     
+        return df["event_type"].to_numpy()
+    
+    def relabel_event_type_5_6_numpy(self, df_room_door, k, s, m, ns, nm, mask=None):
+        # invalid samples are marked with -1
+        # mask: only these samples are relabelled (used by the streaming mode)
+        event_types = numpy_engine.relabel_event_type_5_6(numpy_engine.time_to_int(df_room_door["time"]), 
+                                                          df_room_door["event_type"].to_numpy(), 
+                                                          k=k, s=s, m=m, ns=ns, nm=nm, mask=mask)
+        return event_types
+    
+    def handle_event_type_5_6_numpy(self, dataframe, k, s, m, ns, nm):
+        # same relabelling as handle_event_type_5_6, on numpy arrays
+        df = dataframe.copy().reset_index(drop=True)
+        
+        df["event_type"] = self.relabel_event_type_5_6_numpy(df, k=k, s=s, m=m, ns=ns, nm=nm)
         # discard invalid samples
-        df = df[df["event_type"] != -1].reset_index(drop=True)   
-                
+        df = df[df["event_type"] != -1].reset_index(drop=True)
+        
         return df
     
-    def filter_event_type_5_6(self, dataframe, k, s, m, ns, nm, handle_5, handle_6, **kwargs):
+    def filter_event_type_5_6(self, dataframe, k, s, m, ns, nm, handle_5, handle_6, engine="pandas", n_workers=None, **kwargs):
         df = dataframe.copy()
         
         event_types = [0,1]
@@ -494,22 +1029,20 @@ class SignalPreprocessor(Preprocessor):
         if handle_6:
             event_types.append(6)
             
-        df = df[df["event_type"].isin(event_types)].sort_values(by="time", ascending=True).reset_index(drop=True)
+        df = self.sort_by_time(df[df["event_type"].isin(event_types)])
         
-        #print("Take care of data: \n 14.05.2024, Event Type 5, HS18 Door1")
-        dict_df_room_door = self.df_room_door_dict(df)
-        df_return = pd.DataFrame(columns=list(df.columns))
-        df_return = df_return.astype(df.dtypes)
+        # deal with event type 4
+        # deal with event type 5 and 6
+        if not (handle_5 or handle_6):
+            df_return, _ = self.partition_room_door(df)
+            return df_return
         
-        for room, room_dict in dict_df_room_door.items():
-            for door, df_room_door in room_dict.items():  
-                
-                # deal with event type 4
-                # deal with event type 5 and 6
-                if handle_5 or handle_6:
-                    df_room_door = self.handle_event_type_5_6(df_room_door, k=k, s=s, m=m, ns=ns, nm=nm)
-                    
-                df_return = pd.concat([df_return, df_room_door], axis=0)
+        relabel_name = "relabel_event_type_5_6_numpy" if engine == "numpy" else "relabel_event_type_5_6"
+        df_return = self.relabel_streams(df, relabel_name, {"k":k, "s":s, "m":m, "ns":ns, "nm":nm}, 
+                                         n_workers=n_workers)
+        
+        # discard invalid samples
+        df_return = df_return[df_return["event_type"] != -1].reset_index(drop=True)
 
         return df_return       
         
@@ -542,70 +1075,283 @@ class SignalPreprocessor(Preprocessor):
 
         # drop unneccessary columns
         df = df.drop(columns=["entering", "people_in", "people_out"])   
+        
+        if self.compact_dtypes:
+            df = self.compact(df)
         return df
     
-    def clean_raw_data(self, dataframe:pd.DataFrame, params:dict):
+    def clean_raw_data(self, dataframe:pd.DataFrame, params:dict, n_workers=None):
+        # n_workers: number of processes used to filter the room/door streams, None -> serial
         
         # do basic cleaning and data type correction
-        
-    
-        df = self.basic_cleaning_and_data_type_correction(dataframe) # 0.1sec
+        df = self.run_stage("basic_cleaning", self.basic_cleaning_and_data_type_correction, dataframe)
         raw_data = df.copy()
         
         filtering_params = params["filtering_params"]
         
-        ## check if samples should be discarded or not
-        #if filtering_params["discard_samples"]:  # 0.8sec
-        #    # discard samples between 22:00 and 07:30
-        #    lb = time(hour=7, minute=40, second=0)
-        #    ub = time(hour=22, minute=00, second=0)
-        #    df = self.discard_samples(df, lb, ub)
+        # check if samples should be discarded or not
+        if filtering_params["discard_samples"]:
+            # by default discard samples between 22:00 and 07:40
+            df = self.run_stage("discard_windows", self.discard_samples_by_windows, df, 
+                                windows=params.get("discard_params", self.discard_params)["windows"])
             
 
         if filtering_params["apply_filter"]:
             filter_mode = filtering_params["filter_mode"]
-            if filter_mode == "discard":
+            if filter_mode not in ["discard", "n_closest", "time_window"]:
+                raise ValueError("Filter mode not supported") 
                 
-                if filtering_params["handle_5"] or filtering_params["handle_6"]:
-                    df = self.filter_event_type_5_6(dataframe=df, 
-                                                    handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
-                                                    **params["handle_56_params"])
-                    
-                df = self.filter_discard(dataframe=df, **filtering_params)
+            if filtering_params["handle_5"] or filtering_params["handle_6"]:
+                df = self.run_stage("handle_5_6", self.filter_event_type_5_6, df, 
+                                    handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
+                                    n_workers=n_workers, **params["handle_56_params"])
+            
+            if filter_mode == "discard":
+                df = self.run_stage("filter_discard", self.filter_discard, df, **filtering_params)
             
             elif filter_mode == "n_closest":
-                
-                if filtering_params["handle_5"] or filtering_params["handle_6"]:
-                    df = self.filter_event_type_5_6(dataframe=df, 
-                                                    handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
-                                                    **params["handle_56_params"])
-                
-                df = self.filter_data_n_closest(dataframe=df, **filtering_params) # most basic filterings
-                
+                df = self.run_stage("filter_n_closest", self.filter_data_n_closest, df, 
+                                    n_workers=n_workers, **filtering_params) # most basic filterings
 
             elif filter_mode == "time_window":
-                
-                if filtering_params["handle_5"] or filtering_params["handle_6"]:
-                    df = self.filter_event_type_5_6(dataframe=df, 
-                                                    handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
-                                                    **params["handle_56_params"])
-
-                df = self.filter_data_time_window(dataframe=df, **filtering_params)
-                
-            else:
-                raise ValueError("Filter mode not supported") 
+                df = self.run_stage("filter_time_window", self.filter_data_time_window, df, 
+                                    n_workers=n_workers, **filtering_params)
         else:
             event_types = [0,1]
             df = df[df["event_type"].isin(event_types)].reset_index(drop=True)
-                
-        df = df.sort_values(by="time", ascending=True).reset_index(drop=True)
+        
+        with self.stage("sort", len(df)) as record:
+            df = self.sort_by_time(df)
+            record["rows_out"] = len(df)
     
         return df, raw_data
 
+    ###### Streaming Preprocessing ########
+    def group_directories_by_room(self, data_directories):
+        room_dirs = {}
+        for dir_name in sorted(data_directories):
+            room_dirs.setdefault(dir_name.split("_")[1], []).append(dir_name)
+        return room_dirs
+    
+    def get_streaming_stages(self, params:dict):
+        # relabelling steps of clean_raw_data that need neighboring samples
+        filtering_params = params["filtering_params"]
+        handle_56_params = {x:params["handle_56_params"][x] for x in ["k", "s", "m", "ns", "nm"]}
+        
+        stages = []
+        if filtering_params["handle_5"] or filtering_params["handle_6"]:
+            relabel = lambda df, mask: self.relabel_event_type_5_6_numpy(df, mask=mask, **handle_56_params)
+            stages.append(StreamingRelabeller(relabel, k=handle_56_params["k"], drop_invalid=True))
+            
+        if filtering_params["filter_mode"] == "time_window":
+            time_window_params = {x:filtering_params[x] for x in ["k", "ns", "nm", "s", "lb_in", "lb_out"]}
+            relabel = lambda df, mask: self.relabel_time_window_numpy(df, mask=mask, **time_window_params)
+            stages.append(StreamingRelabeller(relabel, k=time_window_params["k"]))
+            
+        elif filtering_params["filter_mode"] == "n_closest":
+            n_closest_params = {x:filtering_params[x] for x in ["k", "nm", "lb_in", "lb_out"]}
+            relabel = lambda df, mask: self.relabel_n_closest(df, mask=mask, **n_closest_params)
+            stages.append(StreamingRelabeller(relabel, k=n_closest_params["k"]))
+        return stages
+    
+    def push_through_stages(self, stages, dataframe, final=False):
+        df = dataframe
+        for stage in stages:
+            if final:
+                # flush the stage, including the samples from the previous stage
+                finalized = stage.push(df, final=True) if df is not None else stage.flush()
+                df = finalized
+            else:
+                df = stage.push(df)
+        return df
+    
+    def iter_preprocessing(self, params:dict):
+        """
+        Same cleaning as clean_raw_data, but one room/door/day file at a time.
+        Yields the cleaned samples of one room/door stream in chunks, only the
+        samples needed for the k-neighborhoods are kept between chunks.
+        Uses the numpy engines (n_closest has only the pandas implementation).
+        """
+        filtering_params = params["filtering_params"]
+        apply_filter = filtering_params["apply_filter"]
+        filter_mode = filtering_params["filter_mode"]
+        if apply_filter and filter_mode not in ["discard", "n_closest", "time_window"]:
+            raise ValueError("Filter mode not supported")
+        
+        event_types = [0,1]
+        if filtering_params["handle_5"]:
+            event_types.append(5)
+        if filtering_params["handle_6"]:
+            event_types.append(6)
+        
+        for room_name, room_dirs in self.group_directories_by_room(self.get_data_dirs()).items():
+            for door_file in ["door1.csv", "door2.csv"]:
+                
+                stages = self.get_streaming_stages(params) if apply_filter else []
+                
+                for dir_name in room_dirs:
+                    df = self.read_door_file(dir_name, door_file)
+                    df = self.basic_cleaning_and_data_type_correction(df)
+                    if filtering_params["discard_samples"]:
+                        df = self.discard_samples_by_windows(df, params.get("discard_params", self.discard_params)["windows"])
+                    
+                    if apply_filter:
+                        df = self.sort_by_time(df[df["event_type"].isin(event_types)])
+                    else:
+                        df = self.sort_by_time(df[df["event_type"].isin([0,1])])
+                        
+                    df = self.push_through_stages(stages, df)
+                    df = self.filter_streaming_chunk(df, params)
+                    if len(df) > 0:
+                        yield df
+                
+                df = self.push_through_stages(stages, None, final=True)
+                if df is not None:
+                    df = self.filter_streaming_chunk(df, params)
+                    if len(df) > 0:
+                        yield df
+    
+    def filter_streaming_chunk(self, dataframe, params:dict):
+        # steps of clean_raw_data that only look at single samples
+        filtering_params = params["filtering_params"]
+        if filtering_params["apply_filter"] and filtering_params["filter_mode"] == "discard":
+            return self.filter_discard(dataframe, **filtering_params).reset_index(drop=True)
+        return dataframe
+    
+    def apply_preprocessing_streaming(self, params:dict, path_to_file, file_name):
+        # writes the cleaned data chunk by chunk to a parquet dataset partitioned by room, door and date
+        samples = 0
+        for i, df in enumerate(self.iter_preprocessing(params)):
+            self.save_to_parquet(df, path_to_file, file_name, 
+                                 partition_cols=["room_id", "door_id", "date"], append=(i > 0))
+            samples += len(df)
+        return samples
+    
     ###### Preprocessing Application ########
-    def apply_preprocessing(self, params:dict):
-        cleaned_data, raw_data = self.clean_raw_data(self.raw_uncleaned_data.copy(), params)
-        return cleaned_data, raw_data       
+    def apply_preprocessing(self, params:dict, n_workers=None, start_date=None, end_date=None, rooms=None):
+        """
+        Cleans the samples of the selected directories. start_date, end_date, rooms restrict
+        the directories selected in the constructor further. The filters look across day
+        boundaries, the neighboring directories (same room) of the selection are therefore
+        read as context: the result is the rows of the selected directories of a run on
+        the whole archive, with and without cache_dir.
+        Profiling can also be turned on in the parameters (profiling_params),
+        that profiler is only used for this call.
+        """
+        profiler = self.profiler
+        if profiler is None:
+            self.profiler = StageProfiler.from_params(params)
+        
+        try:
+            if self.cache is not None:
+                return self.apply_preprocessing_incremental(params, n_workers=n_workers, 
+                                                            start_date=start_date, end_date=end_date, rooms=rooms)
+            
+            data_dirs = self.get_data_dirs(start_date, end_date, rooms)
+            all_dirs = self.get_list_of_data_dirs(apply_filters=False)
+            context_dirs = self.get_neighbor_directories(data_dirs, all_dirs) - set(data_dirs)
+            if len(context_dirs) > 0:
+                return self.clean_with_context(data_dirs, sorted(set(data_dirs) | context_dirs), params, n_workers)
+            
+            raw_uncleaned_data = self.get_raw_data(start_date, end_date, rooms)
+            cleaned_data, raw_data = self.clean_raw_data(raw_uncleaned_data.copy(), params, n_workers=n_workers)
+            return cleaned_data, raw_data       
+        finally:
+            self.profiler = profiler
+    
+    def clean_with_context(self, data_dirs, context_dirs, params:dict, n_workers=None):
+        # cleans the samples of context_dirs (data_dirs and their neighbors),
+        # returns the cleaned and raw samples of data_dirs only
+        raw_uncleaned_data = self.get_raw_data_of_directories(context_dirs, tag_directories=True)
+        cleaned_data, raw_data = self.clean_raw_data(raw_uncleaned_data, params, n_workers=n_workers)
+        
+        selected = pd.Index(context_dirs).get_indexer(data_dirs)
+        cleaned_data = cleaned_data[cleaned_data["dir_index"].isin(selected)].drop(columns=["dir_index"])
+        # raw samples in the order of data_dirs, like get_raw_data
+        raw_data = pd.concat([raw_data[raw_data["dir_index"] == i] for i in selected], axis=0).drop(columns=["dir_index"])
+        return cleaned_data.reset_index(drop=True), raw_data.reset_index(drop=True)
+    
+    def get_neighbor_directories(self, dir_names, all_dir_names):
+        # closest existing directories (same room) before and after each of the given directories
+        neighbors = set()
+        for room_name in set([x.split("_")[1] for x in dir_names]):
+            room_dirs = sorted([x for x in set(all_dir_names) | set(dir_names) if x.split("_")[1] == room_name])
+            existing = set(all_dir_names)
+            
+            for dir_name in [x for x in dir_names if x.split("_")[1] == room_name]:
+                idx = room_dirs.index(dir_name)
+                
+                before = [x for x in room_dirs[:idx] if x in existing]
+                if len(before) > 0:
+                    neighbors.add(before[-1])
+                after = [x for x in room_dirs[idx+1:] if x in existing]
+                if len(after) > 0:
+                    neighbors.add(after[0])
+                    
+        return neighbors
+        
+    def apply_preprocessing_incremental(self, params:dict, n_workers=None, start_date=None, end_date=None, rooms=None):
+        cache = self.cache
+        # the compact mode stores other dtypes -> own parameter set
+        cache.open(dict(params, compact_dtypes=True) if self.compact_dtypes else params)
+        data_dirs = self.get_data_dirs(start_date, end_date, rooms)
+        # the cached results do not depend on the date and room filters,
+        # the neighbors are taken from all directories of the archive
+        all_dirs = self.get_list_of_data_dirs(apply_filters=False)
+        
+        # find new or changed directories (selected ones and their neighbors)
+        # and directories that were removed from the archive
+        signatures = {}
+        changed_dirs = []
+        for dir_name in sorted(set(data_dirs) | self.get_neighbor_directories(data_dirs, all_dirs)):
+            signatures[dir_name] = cache.directory_signature(os.path.join(self.path_to_data, dir_name), dir_name)
+            if cache.is_valid(dir_name, signatures[dir_name]):
+                cache.update_signature(dir_name, signatures[dir_name])
+            else:
+                changed_dirs.append(dir_name)
+        removed_dirs = [x for x in cache.cached_directories() if x not in all_dirs]
+        
+        # the filters look across day boundaries -> also recompute the neighbors
+        # and read their neighbors as context
+        recompute_dirs = set(changed_dirs) | self.get_neighbor_directories(changed_dirs + removed_dirs, all_dirs)
+        context_dirs = recompute_dirs | self.get_neighbor_directories(list(recompute_dirs), all_dirs)
+        recompute_dirs = sorted(recompute_dirs)
+        context_dirs = sorted(context_dirs)
+        for dir_name in recompute_dirs:
+            if dir_name not in signatures:
+                signatures[dir_name] = cache.directory_signature(os.path.join(self.path_to_data, dir_name), dir_name)
+        
+        if len(recompute_dirs) > 0:
+            raw_uncleaned_data = self.accumulate_raw_data(context_dirs, tag_directories=True)
+            cleaned_data, raw_data = self.clean_raw_data(raw_uncleaned_data, params, n_workers=n_workers)
+            
+            # split the results by directory and store them
+            for i, dir_name in enumerate(context_dirs):
+                if dir_name not in recompute_dirs:
+                    continue
+                cleaned_dir = cleaned_data[cleaned_data["dir_index"] == i].drop(columns=["dir_index"])
+                raw_dir = raw_data[raw_data["dir_index"] == i].drop(columns=["dir_index"])
+                cache.store(dir_name, signatures[dir_name], cleaned_dir, raw_dir)
+                
+        for dir_name in removed_dirs:
+            cache.remove(dir_name)
+            
+        cache.save_index()
+        
+        # merge the cached results of the selected directories
+        cleaned_list, raw_list = [], []
+        for dir_name in data_dirs:
+            cleaned_dir, raw_dir = cache.load(dir_name)
+            cleaned_list.append(cleaned_dir)
+            raw_list.append(raw_dir)
+        
+        if len(cleaned_list) == 0:
+            return self.clean_raw_data(self.accumulate_raw_data([]), params, n_workers=n_workers)
+        
+        cleaned_data = self.sort_by_time(pd.concat(cleaned_list, axis=0))
+        raw_data = pd.concat(raw_list, axis=0).reset_index(drop=True)
+        
+        return cleaned_data, raw_data
     
     
     
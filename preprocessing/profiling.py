@@ -0,0 +1,154 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+class StageProfiler:
+    """
+    Measurements of the preprocessing stages (ingest, cleaning, filters, sort, save, ...).
+    Every finished stage is a record (dict) with the wall time, rows in/out, rows relabelled
+    and the memory delta, it is kept in records, passed to callback and appended to log_path
+    (one json object per line).
+
+    trace_memory: memory delta (and peak) from tracemalloc, slower but only counts the
+    allocations of python/numpy, otherwise the change of the resident set size.
+    Tracing started by the profiler is stopped when the outermost stage ends
+    profile: None or "cprofile", profiles all stages with cProfile, the stats are
+    written to profile_path (pstats format) and can be printed with print_profile
+    """
+    profile_modes = [None, "cprofile"]
+
+    def __init__(self, callback=None, log_path=None, trace_memory=False, profile=None, profile_path=None):
+        if profile not in self.profile_modes:
+            raise ValueError(f"Unknown profile mode {profile}, use one of {self.profile_modes}")
+
+        self.callback = callback
+        self.log_path = log_path
+        self.trace_memory = trace_memory
+        self.profile_path = profile_path
+        self.profiler = cProfile.Profile() if profile == "cprofile" else None
+
+        self.records = []
+        # open stages, rows relabelled are counted for the innermost one
+        self.stack = []
+        # traced memory peaks (bytes) of the open stages, reset_peak of a nested stage
+        # would lose the peak of the enclosing stages otherwise
+        self.peaks = []
+        # tracemalloc was started by the profiler (and not by the caller)
+        self.started_tracing = False
+
+    @classmethod
+    def from_params(cls, params:dict, **kwargs):
+        # profiling_params section of preprocessing_parameters.json, None if profiling is disabled
+        profiling_params = dict(params.get("profiling_params", {}))
+        if not profiling_params.pop("enabled", False):
+            return None
+        return cls(**profiling_params, **kwargs)
+
+    ####### Helper Methods ########
+    def get_memory(self):
+        # bytes, None if unavailable
+        if self.trace_memory:
+            return tracemalloc.get_traced_memory()[0]
+        try:
+            with open("/proc/self/statm", "r") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    ####### Stages ########
+    @contextmanager
+    def stage(self, preprocessor, name, rows_in=None):
+        """
+        Measures the code in the with block, set record["rows_out"] inside:
+            with profiler.stage("SignalPreprocessor", "sort", len(df)) as record:
+                df = df.sort_values(by="time")
+                record["rows_out"] = len(df)
+        """
+        record = {"preprocessor":preprocessor, "stage":name, "rows_in":rows_in, "rows_out":None,
+                  "rows_relabelled":None, "seconds":None, "memory_delta_mb":None}
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.trace_memory:
+            if len(self.peaks) > 0:
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.peaks.append(0)
+        if self.profiler is not None and len(self.stack) == 0:
+            self.profiler.enable()
+
+        self.stack.append(record)
+        memory = self.get_memory()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            memory_end = self.get_memory()
+            if memory is not None and memory_end is not None:
+                record["memory_delta_mb"] = (memory_end - memory) / 1024**2
+            if self.trace_memory:
+                peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record["peak_memory_mb"] = peak / 1024**2
+                if len(self.peaks) > 0:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+
+            self.stack.pop()
+            if self.profiler is not None and len(self.stack) == 0:
+                self.profiler.disable()
+                self.save_profile()
+            if self.started_tracing and len(self.stack) == 0:
+                tracemalloc.stop()
+                self.started_tracing = False
+            self.finish(record)
+
+    def add_relabelled(self, n_relabelled):
+        if len(self.stack) > 0:
+            record = self.stack[-1]
+            record["rows_relabelled"] = (record["rows_relabelled"] or 0) + int(n_relabelled)
+
+    def finish(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        if self.log_path is not None:
+            with open(self.log_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+
+    ####### Results ########
+    def summary(self):
+        columns = ["preprocessor", "stage", "rows_in", "rows_out", "rows_relabelled", "seconds", "memory_delta_mb"]
+        if self.trace_memory:
+            columns.append("peak_memory_mb")
+        return pd.DataFrame(self.records, columns=columns)
+
+    def save_profile(self, path=None):
+        path = self.profile_path if path is None else path
+        if self.profiler is None or path is None:
+            return False
+        self.profiler.dump_stats(path)
+        return True
+
+    def print_profile(self, sort_by="cumulative", n_lines=30):
+        if self.profiler is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort_by).print_stats(n_lines)
+        print(stream.getvalue())
+        return stream.getvalue()
+
+@contextmanager
+def profile_stage(profiler, preprocessor, name, rows_in=None):
+    # no-op record if profiling is disabled (profiler is None)
+    if profiler is None:
+        yield {}
+    else:
+        with profiler.stage(preprocessor, name, rows_in) as record:
+            yield record
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+class StreamingRelabeller:
+    """
+    Applies a relabelling step (e.g. the 5/6 handling or the time window filter)
+    chunk by chunk to one room/door stream.
+
+    A sample is relabelled as soon as the k following samples are available, its k-neighborhood
+    is then complete. The last k relabelled samples are kept as lookback for the next chunk,
+    so the result is the same as relabelling the whole stream at once.
+
+    relabel: function(dataframe, mask) -> event types, only relabels the samples in mask
+    """
+    def __init__(self, relabel, k, drop_invalid=False):
+        self.relabel = relabel
+        self.k = k
+        self.drop_invalid = drop_invalid
+
+        # lookback rows (already relabelled) followed by rows waiting for more neighbors
+        self.buffer = None
+        self.n_lookback = 0
+
+    def push(self, dataframe, final=False):
+        if self.buffer is None:
+            buffer = dataframe.reset_index(drop=True)
+        else:
+            buffer = pd.concat([self.buffer, dataframe], axis=0).reset_index(drop=True)
+        n_samples = len(buffer)
+
+        # samples whose neighborhood is complete
+        stop = n_samples if final else max(n_samples - self.k, self.n_lookback)
+        mask = np.zeros(n_samples, dtype=bool)
+        mask[self.n_lookback:stop] = True
+        if mask.any():
+            buffer["event_type"] = self.relabel(buffer, mask)
+
+        finalized = buffer.iloc[self.n_lookback:stop]
+
+        # keep the last k relabelled samples and the waiting samples
+        lookback_start = max(stop - self.k, 0)
+        self.buffer = buffer.iloc[lookback_start:]
+        self.n_lookback = stop - lookback_start
+
+        if self.drop_invalid:
+            finalized = finalized[finalized["event_type"] != -1]
+        return finalized.reset_index(drop=True)
+
+    def flush(self):
+        if self.buffer is None:
+            return None
+        finalized = self.push(self.buffer.iloc[:0], final=True)
+        self.buffer = None
+        self.n_lookback = 0
+        return finalized
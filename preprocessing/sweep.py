@@ -0,0 +1,176 @@
+import copy
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+def run_preprocessor_method(preprocessor, method_name, dataframe, kwargs):
+    # executed in the worker processes
+    return getattr(preprocessor, method_name)(dataframe, **kwargs)
+
+class ParameterSweep:
+    """
+    Runs SignalPreprocessor.clean_raw_data for many parameter sets. The intermediate
+    results are memoized by the parameters every stage depends on, e.g. changing
+    only lb_in reuses the ingest, basic cleaning and 5/6 handling results.
+    The independent 5/6 handlings and filters are run on a process pool (n_workers).
+
+    grid: {"filtering_params.k":[1, 2, 3], "handle_56_params.s":[2, 3], ...}, every
+    combination of the values is a configuration, keys are "<section>.<parameter>"
+    of the parameters JSON
+    evaluate: optional function (cleaned_data, params) -> dict of metrics added to the results
+    """
+    # filtering_params used by the filters, see clean_raw_data
+    filter_dependencies = {"discard":["lb_in", "lb_out"],
+                           "n_closest":["k", "nm", "lb_in", "lb_out", "handle_5", "handle_6"],
+                           "time_window":["k", "ns", "nm", "s", "lb_in", "lb_out", "handle_5", "handle_6", "engine"]}
+    filter_methods = {"discard":"filter_discard",
+                      "n_closest":"filter_data_n_closest",
+                      "time_window":"filter_data_time_window"}
+
+    def __init__(self, preprocessor, base_params:dict, n_workers=None, evaluate=None):
+        self.preprocessor = preprocessor
+        self.base_params = base_params
+        self.n_workers = n_workers
+        self.evaluate = evaluate
+
+        # stage key -> result, kept between runs
+        self.basic_cleaned = None
+        self.discarded = {}
+        self.handled = {}
+        self.cleaned = {}
+
+    ####### Parameter Sets ########
+    def expand_grid(self, grid:dict):
+        # one parameter set per combination of the grid values
+        names = list(grid.keys())
+        param_sets = []
+        for values in itertools.product(*[grid[x] for x in names]):
+            params = copy.deepcopy(self.base_params)
+            for name, value in zip(names, values):
+                section, parameter = name.split(".")
+                params[section][parameter] = value
+            param_sets.append(params)
+        return names, param_sets
+
+    def get_key(self, *parts):
+        return json.dumps(parts, sort_keys=True, default=str)
+
+    def get_stage_keys(self, params:dict):
+        # key of every stage, made of the parameters the stage and the stages before depend on
+        filtering_params = params["filtering_params"]
+
+        windows = None
+        if filtering_params["discard_samples"]:
+            windows = params.get("discard_params", self.preprocessor.discard_params)["windows"]
+        discard_key = self.get_key(windows)
+
+        handle_56 = filtering_params["apply_filter"] and (filtering_params["handle_5"] or filtering_params["handle_6"])
+        handle_56_key = discard_key
+        if handle_56:
+            handle_56_key = self.get_key(discard_key, filtering_params["handle_5"], filtering_params["handle_6"],
+                                         params["handle_56_params"])
+
+        if not filtering_params["apply_filter"]:
+            filter_key = self.get_key(handle_56_key, None)
+        else:
+            filter_mode = filtering_params["filter_mode"]
+            if filter_mode not in self.filter_methods:
+                raise ValueError("Filter mode not supported")
+            dependencies = {x:filtering_params.get(x) for x in self.filter_dependencies[filter_mode]}
+            filter_key = self.get_key(handle_56_key, filter_mode, dependencies)
+        return discard_key, handle_56, handle_56_key, filter_key
+
+    ####### Stages ########
+    def map_stage(self, tasks):
+        # tasks: key -> (method name, dataframe, kwargs), returns key -> result
+        keys = list(tasks.keys())
+        if self.n_workers is None or self.n_workers <= 1 or len(keys) <= 1:
+            return {x:run_preprocessor_method(self.preprocessor, *tasks[x]) for x in keys}
+
+        worker = self.preprocessor.get_worker()
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            results = executor.map(run_preprocessor_method, [worker] * len(keys),
+                                   *zip(*[tasks[x] for x in keys]))
+            return dict(zip(keys, results))
+
+    def run_stages(self, param_sets):
+        preprocessor = self.preprocessor
+        stage_keys = [self.get_stage_keys(x) for x in param_sets]
+
+        if self.basic_cleaned is None:
+            self.basic_cleaned = preprocessor.basic_cleaning_and_data_type_correction(preprocessor.get_raw_data())
+
+        for params, (discard_key, handle_56, handle_56_key, filter_key) in zip(param_sets, stage_keys):
+            if discard_key in self.discarded:
+                continue
+            if params["filtering_params"]["discard_samples"]:
+                windows = params.get("discard_params", preprocessor.discard_params)["windows"]
+                self.discarded[discard_key] = preprocessor.discard_samples_by_windows(self.basic_cleaned, windows)
+            else:
+                self.discarded[discard_key] = self.basic_cleaned
+
+        # 5/6 handling of the distinct parameter sets
+        tasks = {}
+        for params, (discard_key, handle_56, handle_56_key, filter_key) in zip(param_sets, stage_keys):
+            if handle_56_key in self.handled or handle_56_key in tasks:
+                continue
+            if not handle_56:
+                self.handled[handle_56_key] = self.discarded[discard_key]
+                continue
+            filtering_params = params["filtering_params"]
+            tasks[handle_56_key] = ("filter_event_type_5_6", self.discarded[discard_key],
+                                    dict(handle_5=filtering_params["handle_5"], handle_6=filtering_params["handle_6"],
+                                         **params["handle_56_params"]))
+        self.handled.update(self.map_stage(tasks))
+
+        # filters of the distinct parameter sets
+        tasks, filtered = {}, {}
+        for params, (discard_key, handle_56, handle_56_key, filter_key) in zip(param_sets, stage_keys):
+            if filter_key in self.cleaned or filter_key in tasks or filter_key in filtered:
+                continue
+            filtering_params = params["filtering_params"]
+            if filtering_params["apply_filter"]:
+                method_name = self.filter_methods[filtering_params["filter_mode"]]
+                tasks[filter_key] = (method_name, self.handled[handle_56_key], filtering_params)
+            else:
+                df = self.handled[handle_56_key]
+                filtered[filter_key] = df[df["event_type"].isin([0,1])].reset_index(drop=True)
+        filtered.update(self.map_stage(tasks))
+
+        for filter_key, df in filtered.items():
+            self.cleaned[filter_key] = self.preprocessor.sort_by_time(df)
+        return stage_keys
+
+    ####### Application ########
+    def get_cleaned_data(self, params:dict):
+        # same result as preprocessor.apply_preprocessing(params)[0]
+        filter_key = self.run_stages([params])[0][3]
+        return self.cleaned[filter_key]
+
+    def run(self, grid:dict):
+        """
+        Returns one row per configuration: the swept parameters, the number of
+        raw/cleaned samples, in/out events and the metrics of evaluate
+        """
+        names, param_sets = self.expand_grid(grid)
+        stage_keys = self.run_stages(param_sets)
+
+        rows = []
+        for i, (params, keys) in enumerate(zip(param_sets, stage_keys)):
+            cleaned_data = self.cleaned[keys[3]]
+            row = {"config_id":i}
+            row.update({x:params[x.split(".")[0]][x.split(".")[1]] for x in names})
+            row.update({"rows_raw":len(self.basic_cleaned), "rows_cleaned":len(cleaned_data),
+                        "n_in":int((cleaned_data["event_type"] == 1).sum()),
+                        "n_out":int((cleaned_data["event_type"] == 0).sum())})
+            if self.evaluate is not None:
+                row.update(self.evaluate(cleaned_data, params))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def clear(self):
+        self.basic_cleaned = None
+        self.discarded = {}
+        self.handled = {}
+        self.cleaned = {}
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Fast parser for the timestamps of the light gate files, e.g. "Mon Apr 08 06:30:17 2024"
+# (format "%a %b %d %H:%M:%S %Y"). The fields have fixed positions, so all rows are
+# parsed at once on the character codes instead of going through strptime row by row.
+# Rows that do not match the layout are parsed with pd.to_datetime.
+
+ctime_format = "%a %b %d %H:%M:%S %Y"
+ctime_length = 24
+# rows parsed at once, bounds the memory of the character arrays
+block_size = 1 << 20
+
+weekdays = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+#######  Helper Functions ########
+def name_code(chars, start):
+    # three letters -> single integer
+    return (chars[:, start].astype(np.int64) << 16) | (chars[:, start + 1].astype(np.int64) << 8) | chars[:, start + 2]
+
+def name_codes(names):
+    chars = np.array([[ord(c) for c in x] for x in names], dtype=np.uint32)
+    return name_code(chars, 0)
+
+weekday_codes = np.sort(name_codes(weekdays))
+# month lookup table: sorted codes and the month number of each code
+month_codes = name_codes(months)
+month_order = np.argsort(month_codes)
+month_codes_sorted = month_codes[month_order]
+
+def to_number(chars, start, stop):
+    number = np.zeros(len(chars), dtype=np.int64)
+    for i in range(start, stop):
+        number = number * 10 + (chars[:, i].astype(np.int64) - ord("0"))
+    return number
+
+def is_digit(chars, start, stop):
+    digits = chars[:, start:stop]
+    return ((digits >= ord("0")) & (digits <= ord("9"))).all(axis=1)
+
+#######  Parser ########
+def parse_ctime_block(values):
+    # returns the parsed timestamps and a mask of the rows that match the layout
+    # one character code per column, one more column to detect longer strings
+    chars = values.astype(f"U{ctime_length + 1}").view(np.uint32).reshape(len(values), ctime_length + 1)
+
+    valid = (chars[:, ctime_length] == 0) & (chars[:, ctime_length - 1] != 0)
+    for position, char in [(3, " "), (7, " "), (10, " "), (13, ":"), (16, ":"), (19, " ")]:
+        valid &= chars[:, position] == ord(char)
+    for start, stop in [(8, 10), (11, 13), (14, 16), (17, 19), (20, 24)]:
+        valid &= is_digit(chars, start, stop)
+
+    valid &= np.isin(name_code(chars, 0), weekday_codes)
+    month_code = name_code(chars, 4)
+    idx = np.minimum(np.searchsorted(month_codes_sorted, month_code), len(months) - 1)
+    valid &= month_codes_sorted[idx] == month_code
+    month = month_order[idx] + 1
+
+    day = to_number(chars, 8, 10)
+    hour = to_number(chars, 11, 13)
+    minute = to_number(chars, 14, 16)
+    second = to_number(chars, 17, 19)
+    year = to_number(chars, 20, 24)
+    valid &= (day >= 1) & (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # build the dates from year, month and day, invalid days (e.g. Feb 30) roll over
+    # into the next month and are detected by comparing the month
+    year_month = np.where(valid, (year - 1970) * 12 + (month - 1), 0)
+    day = np.where(valid, day, 1)
+    dates = year_month.astype("M8[M]").astype("M8[D]") + (day - 1).astype("m8[D]")
+    valid &= dates.astype("M8[M]").astype(np.int64) == year_month
+
+    seconds = hour * 3600 + minute * 60 + second
+    timestamps = dates.astype("M8[ns]") + seconds.astype("m8[s]").astype("m8[ns]")
+    return timestamps, valid
+
+def parse_ctime(series:pd.Series):
+    """
+    Parses a series of "%a %b %d %H:%M:%S %Y" strings to datetime64[ns],
+    same result as pd.to_datetime(series, format="%a %b %d %H:%M:%S %Y")
+    """
+    values = series.to_numpy(dtype=object)
+    timestamps = np.empty(len(values), dtype="M8[ns]")
+    valid = np.empty(len(values), dtype=bool)
+    for start in range(0, len(values), block_size):
+        stop = start + block_size
+        timestamps[start:stop], valid[start:stop] = parse_ctime_block(values[start:stop])
+
+    result = pd.Series(timestamps, index=series.index, name=series.name)
+    if not valid.all():
+        # rows that do not match the fixed layout (e.g. nan or malformed rows) go
+        # through pandas and raise the same errors as pd.to_datetime
+        result[~valid] = pd.to_datetime(series[~valid], format=ctime_format)
+    return result
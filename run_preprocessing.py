@@ -1,4 +1,7 @@
 from preprocessing.preprocessor import SignalPreprocessor, CoursePreprocessor
+from preprocessing.occupancy import OccupancyEngine
+from preprocessing.attendance import AttendanceEstimator
+from preprocessing.profiling import StageProfiler
 import json
 
 room_to_id ={"HS18":0, "HS 18":0, "HS19":1, "HS 19": 1}
@@ -9,22 +12,45 @@ door_to_id = {"door1":0, "door2":1}
 # Due to its size the raw light gate data is not included in the repository.
 # The preprocessed data can be found in the data folder.
 data_path = "/home/berni/data_06_06/archive"
+# cleaned results are cached per data directory, only new or changed directories are reprocessed
+cache_dir = "/home/berni/data_06_06/preprocessing_cache"
 # load parameters
 path_to_json = "parameters/preprocessing_parameters.json"
 params = json.load(open(path_to_json, "r"))
-# apply preprocessing
-preprocessor = SignalPreprocessor(data_path, room_to_id, door_to_id)
+# stage measurements (and cProfile) are turned on with "profiling_params" in the parameters,
+# or directly e.g. profiler = StageProfiler(callback=print, profile="cprofile", profile_path="data/preprocessing.prof")
+profiler = StageProfiler.from_params(params)
+# apply preprocessing, the archive is read on first use
+# (start_date, end_date and rooms restrict the data directories that are read)
+preprocessor = SignalPreprocessor(data_path, room_to_id, door_to_id, cache_dir=cache_dir, profiler=profiler)
 cleaned_data, raw_data = preprocessor.apply_preprocessing(params)
 # save data
 preprocessor.save_to_csv(cleaned_data, "data", "frequency_data")
+preprocessor.save_to_parquet(cleaned_data, "data", "frequency_data", partition_cols=["room_id", "door_id", "date"])
 
 
 ################ Course Preprocessing ################
 path_to_raw_courses = "data/raw"
 preprocessor = CoursePreprocessor(path_to_raw_courses, 
-                                  room_to_id=room_to_id, door_to_id=door_to_id)
+                                  room_to_id=room_to_id, door_to_id=door_to_id, profiler=profiler)
 
-cleaned_course_info, cleaned_course_dates = preprocessor.apply_preprocessing()
+cleaned_course_info, cleaned_course_dates = preprocessor.apply_preprocessing(engine="vectorized")
 
 preprocessor.save_to_csv(cleaned_course_info, "data", "course_info")
 preprocessor.save_to_csv(cleaned_course_dates, "data", "course_dates")
+# one file, a partition per course would only give tiny files
+preprocessor.save_to_parquet(cleaned_course_info, "data", "course_info")
+preprocessor.save_to_parquet(cleaned_course_dates, "data", "course_dates", partition_cols=["date"])
+
+
+################ Attendance ################
+# occupancy of the rooms from the cleaned events and attendance of every course date
+occupancy = OccupancyEngine(cleaned_data, room_capacities=CoursePreprocessor.room_capacities)
+estimator = AttendanceEstimator.from_params(occupancy, params["signal_params"])
+attendance = estimator.estimate(cleaned_course_dates)
+
+preprocessor.save_to_csv(attendance, "data", "attendance")
+preprocessor.save_to_parquet(attendance, "data", "attendance")
+
+if profiler is not None:
+    print(profiler.summary().to_string(index=False))
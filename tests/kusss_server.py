@@ -0,0 +1,118 @@
+import os
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for KUSSS, serves the recorded pages in tests/fixtures/kusss.
+# "{server_url}" in the pages (e.g. the study handbook links) is replaced by the url of the server.
+
+path_to_fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "kusss")
+
+class KusssServer():
+    """
+    HTTP server in a background thread, use it as a context manager.
+
+    - every page is sent with an ETag, a request with the current ETag in If-None-Match gets a 304
+    - the next fail_next requests are answered with a 503
+    - pages: file name -> html, replaces the recorded page (e.g. to simulate a changed page)
+    - log: (time, path, If-None-Match header, status code) of every request
+    """
+    def __init__(self, path_to_pages=path_to_fixtures):
+        self.path_to_pages = path_to_pages
+        self.fail_next = 0
+        self.pages = {}
+        self.log = []
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def get_file_name(self, url):
+        # request path -> file name of the recorded page
+        url = urlparse(url)
+        query = parse_qs(url.query)
+        if url.path == "/kusss/coursecatalogue-start.action":
+            return "coursecatalogue-start.html"
+        if url.path == "/kusss/coursecatalogue-search.action":
+            return f"coursecatalogue-search_{query['room'][0]}.html"
+        if url.path == "/kusss/courseclass.action":
+            return f"courseclass_{query['courseclassid'][0]}.html"
+        if url.path.startswith("/studyhandbook/"):
+            return f"studyhandbook_{url.path.split('/')[-1]}.html"
+        return None
+
+    def get_page(self, file_name):
+        if file_name in self.pages:
+            html = self.pages[file_name]
+        else:
+            path = os.path.join(self.path_to_pages, file_name)
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as file:
+                html = file.read()
+        return html.replace("{server_url}", self.url).encode("utf-8")
+
+    def respond(self, url, if_none_match):
+        """
+        Returns the status code, headers and body of the response to the url
+        """
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return 503, {}, b""
+
+        file_name = self.get_file_name(url)
+        content = None if file_name is None else self.get_page(file_name)
+        if content is None:
+            return 404, {}, b""
+
+        etag = '"' + hashlib.sha256(content).hexdigest()[:16] + '"'
+        if if_none_match == etag:
+            return 304, {"ETag":etag}, b""
+        return 200, {"ETag":etag, "Content-Type":"text/html; charset=utf-8"}, content
+
+    def get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # keep-alive responses are not delayed
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if_none_match = self.headers.get("If-None-Match")
+                status, headers, content = server.respond(self.path, if_none_match)
+                with server.lock:
+                    server.log.append((time.monotonic(), urlparse(self.path).path, if_none_match, status))
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+        return Handler
+
+    ####### Request Log ########
+    def get_statuses(self, path=None):
+        with self.lock:
+            return [x[3] for x in self.log if path is None or x[1] == path]
+
+    def clear_log(self):
+        with self.lock:
+            self.log = []
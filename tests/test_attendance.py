@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.occupancy import OccupancyEngine
+from preprocessing.attendance import AttendanceEstimator
+
+# attendance of a few course dates with known occupancy, and the
+# (course dates x bins) matrix against a loop over the resampled grid
+
+@pytest.fixture
+def occupancy():
+    # room 0: occupancy 1, 2, 3, 2, 3 after the events
+    events = pd.DataFrame({"time":pd.to_datetime(["2024-04-08 07:58:30", "2024-04-08 08:01:30", "2024-04-08 08:02:30",
+                                                  "2024-04-08 08:05:30", "2024-04-08 08:12:00"]),
+                           "room_id":0, "door_id":0, "event_type":[1, 1, 1, 0, 1]})
+    return OccupancyEngine(events, room_capacities={0:100})
+
+@pytest.fixture
+def course_dates():
+    # two dates of course A in room 0, one date of course B in room 1 (no events)
+    return pd.DataFrame({"course_number":["A", "A", "B"], "room_id":[0, 0, 1],
+                         "start_time":pd.to_datetime(["2024-04-08 08:00:00", "2024-04-08 09:00:00", "2024-04-08 08:00:00"]),
+                         "end_time":pd.to_datetime(["2024-04-08 08:10:00", "2024-04-08 09:05:00", "2024-04-08 09:00:00"])})
+
+# occupancy at the end of the bins 08:00 ... 08:09: 1, 2, 3, 3, 3, 2, 2, 2, 2, 2
+@pytest.mark.parametrize("prediction_mode, expected", [("max", 3), ("mean", 2.2), ("median", 2), ("max_mean", 3)])
+def test_estimate(occupancy, course_dates, prediction_mode, expected):
+    estimator = AttendanceEstimator(occupancy, prediction_mode=prediction_mode)
+    attendance = estimator.estimate(course_dates)
+    assert attendance["attendance"].iloc[0] == pytest.approx(expected)
+    assert list(attendance["n_in"]) == [2, 0, 0] and list(attendance["n_out"]) == [1, 0, 0]
+    # nothing happens after 08:12 -> 3 in the second date, room 1 has no data
+    assert attendance["attendance"].iloc[1] == 3
+    assert np.isnan(attendance["attendance"].iloc[2])
+    assert attendance["course_attendance"].iloc[0] == pytest.approx(np.median([expected, 3]))
+
+def test_estimate_margins(occupancy, course_dates):
+    # the window starts a minute earlier (end of 07:59 -> 1) and ends 5 minutes later (08:12 in -> 3)
+    estimator = AttendanceEstimator.from_params(occupancy, {"prediction_mode":"mean", "m_before":1, "m_after":5,
+                                                            "part_mode":None, "max_mean_cutoff":0.3})
+    attendance = estimator.estimate(course_dates)
+    assert attendance["window_start"].iloc[0] == pd.Timestamp("2024-04-08 07:59:00")
+    assert attendance["attendance"].iloc[0] == pytest.approx((1 + 22 + 2 + 2 + 3 + 3 + 3) / 16)
+    assert list(attendance["n_in"]) == [3, 0, 0]
+    assert "course_attendance" not in attendance.columns
+
+####### Bin Matrix ########
+def estimate_loop(estimator, course_dates):
+    # one course date after another on the resampled grid of its room
+    grid = estimator.occupancy.resample(estimator.freq)
+    estimates = []
+    for _, course_date in course_dates.iterrows():
+        start = (course_date["start_time"] - estimator.m_before).floor(estimator.freq)
+        end = (course_date["end_time"] + estimator.m_after).ceil(estimator.freq)
+        window = grid[(grid["room_id"] == course_date["room_id"]) & (grid["time"] >= start) & (grid["time"] < end)]
+        samples = window["occupancy"].to_numpy(dtype=np.float64)
+        if estimator.prediction_mode == "max":
+            estimates.append(window["occupancy_max"].max())
+        elif estimator.prediction_mode == "mean":
+            estimates.append(samples.mean())
+        elif estimator.prediction_mode == "median":
+            estimates.append(np.median(samples))
+        else:
+            estimates.append(samples[samples >= (1 - estimator.max_mean_cutoff) * samples.max()].mean())
+    return np.array(estimates)
+
+@pytest.mark.parametrize("prediction_mode", ["max", "mean", "median", "max_mean"])
+def test_estimate_matrix(prediction_mode):
+    rng = np.random.default_rng(0)
+    n_events = 2000
+    times = pd.Timestamp("2024-04-08 07:00:00") + pd.to_timedelta(rng.integers(0, 14 * 3600, n_events), unit="s")
+    events = pd.DataFrame({"time":times, "room_id":rng.integers(0, 2, n_events), "door_id":0,
+                           "event_type":rng.integers(0, 2, n_events)})
+    starts = pd.Timestamp("2024-04-08 08:00:00") + pd.to_timedelta(rng.integers(0, 40, 30) * 15, unit="min")
+    course_dates = pd.DataFrame({"course_number":[str(i % 10) for i in range(30)], "room_id":rng.integers(0, 2, 30),
+                                 "start_time":starts, "end_time":starts + pd.to_timedelta(rng.integers(1, 7, 30) * 15, unit="min")})
+
+    estimator = AttendanceEstimator(OccupancyEngine(events), prediction_mode=prediction_mode, m_before=3, m_after=7)
+    attendance = estimator.estimate(course_dates)
+    np.testing.assert_allclose(attendance["attendance"].to_numpy(), estimate_loop(estimator, course_dates))
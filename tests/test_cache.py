@@ -0,0 +1,222 @@
+import os
+import copy
+import json
+import shutil
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor
+from benchmarks.synthetic_archive import generate_archive
+
+# ResultCache through SignalPreprocessor.apply_preprocessing, every cached result
+# has to equal the uncached result of the same archive.
+
+room_to_id = {"HS18":0, "HS19":1}
+door_to_id = {"door1":0, "door2":1}
+
+path_to_params = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "parameters", "preprocessing_parameters.json")
+with open(path_to_params, "r") as file:
+    base_params = json.load(file)
+
+@pytest.fixture(scope="module")
+def template(tmp_path_factory):
+    # four days, the fifth day of HS19 is kept aside to be added later
+    path = str(tmp_path_factory.mktemp("template") / "archive")
+    # open around the clock and many 5/6 events -> the relabelling looks across the day boundaries
+    generate_archive(path, days=5, events_per_day=300, p_5=0.3, p_6=0.3, p_low_support=0.3,
+                     opening_hours=("00:00:00", "23:59:59"), seed=2)
+    shutil.rmtree(os.path.join(path, "data_HS18_2024-04-12"))
+    shutil.move(os.path.join(path, "data_HS19_2024-04-12"), os.path.dirname(path))
+    return path
+
+@pytest.fixture
+def archive(template, tmp_path):
+    # every test changes its own copy
+    path = str(tmp_path / "archive")
+    shutil.copytree(template, path)
+    return path
+
+def get_params(**filtering_params):
+    params = copy.deepcopy(base_params)
+    params["filtering_params"].update(filtering_params)
+    return params
+
+def apply(archive, params, cache_dir=None, **kwargs):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, cache_dir=cache_dir, **kwargs)
+    return preprocessor.apply_preprocessing(params)
+
+def assert_uncached_equal(archive, params, cache_dir, **kwargs):
+    cleaned_data, raw_data = apply(archive, params, cache_dir, **kwargs)
+    expected_cleaned, expected_raw = apply(archive, params, **kwargs)
+    pd.testing.assert_frame_equal(cleaned_data, expected_cleaned)
+    pd.testing.assert_frame_equal(raw_data, expected_raw)
+
+def entry_dir(cache_dir, params):
+    # sub directory of the parameter set, it has to exist
+    preprocessor = SignalPreprocessor(".", room_to_id, door_to_id, cache_dir=cache_dir)
+    params_hash = preprocessor.cache.hash_parameters(params)
+    assert params_hash in os.listdir(cache_dir)
+    return os.path.join(cache_dir, params_hash)
+
+def reset_entries(path_to_entries):
+    # entries that are written again get a new mtime
+    for file_name in os.listdir(path_to_entries):
+        if file_name.endswith(".pkl"):
+            os.utime(os.path.join(path_to_entries, file_name), ns=(0, 0))
+
+def recomputed(path_to_entries):
+    return {x[:-len(".pkl")] for x in os.listdir(path_to_entries)
+            if x.endswith(".pkl") and os.stat(os.path.join(path_to_entries, x)).st_mtime_ns != 0}
+
+def cached_directories(path_to_entries):
+    with open(os.path.join(path_to_entries, "index.json"), "r") as file:
+        return set(json.load(file)["directories"].keys())
+
+####### Invalidation ########
+def test_cache_unchanged(archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    assert_uncached_equal(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+    assert len(recomputed(path_to_entries)) == 8
+
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == set()
+
+def test_cache_changed_directory(archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    # the changed directory and its neighbors (same room) are recomputed
+    path = os.path.join(archive, "data_HS18_2024-04-09", "door1.csv")
+    df = pd.read_csv(path)
+    df.iloc[:len(df) // 2].to_csv(path, index=False)
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == {"data_HS18_2024-04-08", "data_HS18_2024-04-09", "data_HS18_2024-04-10"}
+
+def test_cache_same_size_change(archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    # same size and mtime as before, the content hash is only compared if size or mtime differ
+    path = os.path.join(archive, "data_HS19_2024-04-11", "door2.csv")
+    stat = os.stat(path)
+    with open(path, "r") as file:
+        content = file.read()
+    index = content.index("\n1,") + 1
+    with open(path, "w") as file:
+        file.write(content[:index] + "0" + content[index + 1:])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert os.path.getsize(path) == stat.st_size
+
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == {"data_HS19_2024-04-10", "data_HS19_2024-04-11"}
+
+def test_cache_mtime_only(archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    # touched but not changed -> the content hash is the same
+    os.utime(os.path.join(archive, "data_HS18_2024-04-09", "door1.csv"))
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == set()
+
+def test_cache_added_directory(template, archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    # a new day after the last day of HS19, the last day is its neighbor
+    shutil.copytree(os.path.join(os.path.dirname(template), "data_HS19_2024-04-12"), os.path.join(archive, "data_HS19_2024-04-12"))
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == {"data_HS19_2024-04-11", "data_HS19_2024-04-12"}
+
+def test_cache_removed_directory(archive, tmp_path):
+    params = get_params()
+    cache_dir = str(tmp_path / "cache")
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    # the entry is removed, the former neighbors are recomputed
+    shutil.rmtree(os.path.join(archive, "data_HS18_2024-04-10"))
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, params, cache_dir)
+    assert recomputed(path_to_entries) == {"data_HS18_2024-04-09", "data_HS18_2024-04-11"}
+    assert not os.path.exists(os.path.join(path_to_entries, "data_HS18_2024-04-10.pkl"))
+    assert "data_HS18_2024-04-10" not in cached_directories(path_to_entries)
+
+####### Parameter Sets ########
+def test_cache_parameter_change(archive, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    params = get_params()
+    apply(archive, params, cache_dir)
+
+    # other parameters -> own parameter set, the first one is kept
+    other_params = get_params(filter_mode="discard")
+    assert_uncached_equal(archive, other_params, cache_dir)
+    assert entry_dir(cache_dir, other_params) != entry_dir(cache_dir, params)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_cache_profiling_params(archive, tmp_path):
+    # profiling does not change the results -> same parameter set
+    cache_dir = str(tmp_path / "cache")
+    params = get_params()
+    apply(archive, params, cache_dir)
+    path_to_entries = entry_dir(cache_dir, params)
+
+    profiled_params = copy.deepcopy(params)
+    profiled_params["profiling_params"]["enabled"] = True
+    reset_entries(path_to_entries)
+    assert_uncached_equal(archive, profiled_params, cache_dir)
+    assert entry_dir(cache_dir, profiled_params) == path_to_entries
+    assert recomputed(path_to_entries) == set()
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_cache_eviction(archive, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    params_list = [get_params(filter_mode=x) for x in ["time_window", "discard", "n_closest"]]
+    for params in params_list:
+        apply(archive, params, cache_dir, max_parameter_sets=2)
+
+    # the least recently used parameter set is removed
+    assert len(os.listdir(cache_dir)) == 2
+    with pytest.raises(AssertionError):
+        entry_dir(cache_dir, params_list[0])
+    entry_dir(cache_dir, params_list[1])
+    entry_dir(cache_dir, params_list[2])
+
+    # using the second one again evicts the third one next
+    apply(archive, params_list[1], cache_dir, max_parameter_sets=2)
+    apply(archive, params_list[0], cache_dir, max_parameter_sets=2)
+    assert set(os.listdir(cache_dir)) == {os.path.basename(entry_dir(cache_dir, params_list[i])) for i in [0, 1]}
+
+####### Date and Room Filters ########
+@pytest.mark.parametrize("kwargs", [{"start_date":"2024-04-09", "end_date":"2024-04-10", "rooms":["HS18"]},
+                                    {"start_date":"2024-04-11"},
+                                    {"end_date":"2024-04-08", "rooms":["HS19"]}])
+def test_filtered_preprocessing(archive, tmp_path, kwargs):
+    # filtered runs give the rows of the selected directories of a run on the whole archive,
+    # with and without cache_dir
+    params = get_params()
+    assert_uncached_equal(archive, params, str(tmp_path / "cache"), **kwargs)
+
+    cleaned_data, _ = apply(archive, params, **kwargs)
+    expected, _ = apply(archive, params)
+    days = expected["time"].dt.strftime("%Y-%m-%d")
+    mask = (days >= kwargs.get("start_date", "0")) & (days <= kwargs.get("end_date", "9"))
+    if "rooms" in kwargs:
+        mask &= expected["room_id"].isin([room_to_id[x] for x in kwargs["rooms"]])
+    pd.testing.assert_frame_equal(cleaned_data, expected[mask].reset_index(drop=True))
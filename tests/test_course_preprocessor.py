@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import CoursePreprocessor
+from benchmarks.synthetic_courses import generate_courses
+
+# The vectorized cleaning path (apply_preprocessing(engine="vectorized")) has to
+# give exactly the same frames as the row-wise pandas path.
+
+path_to_raw_courses = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "raw")
+room_to_id = {"HS18":0, "HS 18":0, "HS19":1, "HS 19":1}
+door_to_id = {"door1":0, "door2":1}
+
+def apply_engines(path, **kwargs):
+    results = []
+    for engine in ["pandas", "vectorized"]:
+        preprocessor = CoursePreprocessor(path, room_to_id, door_to_id, **kwargs)
+        results.append(preprocessor.apply_preprocessing(engine=engine))
+    return results
+
+def assert_results_equal(results):
+    (info_pandas, dates_pandas), (info_vectorized, dates_vectorized) = results
+    pd.testing.assert_frame_equal(info_pandas, info_vectorized, check_exact=True)
+    pd.testing.assert_frame_equal(dates_pandas, dates_vectorized, check_exact=True)
+
+def test_apply_preprocessing_engines():
+    # crawled course data of the repository
+    results = apply_engines(path_to_raw_courses)
+    assert len(results[0][0]) > 0 and len(results[0][1]) > 0
+    assert_results_equal(results)
+
+@pytest.mark.parametrize("rooms", [["HS 18"], ["HS 19"]])
+def test_apply_preprocessing_engines_single_room(rooms):
+    assert_results_equal(apply_engines(path_to_raw_courses, rooms=rooms))
+
+def test_apply_preprocessing_engines_compact():
+    assert_results_equal(apply_engines(path_to_raw_courses, compact_dtypes=True))
+
+def test_apply_preprocessing_engines_multi_semester(tmp_path):
+    # several semesters with irregular curricula
+    generate_courses(str(tmp_path), path_to_raw_courses=path_to_raw_courses, semesters=3, p_irregular=0.3)
+    results = apply_engines(str(tmp_path))
+    assert results[0][1]["start_time"].dt.year.nunique() > 1
+    assert_results_equal(results)
+
+def test_compact_dtypes():
+    # categoricals and small integer types, same values as the default dtypes
+    (info, dates), (info_compact, dates_compact) = [CoursePreprocessor(path_to_raw_courses, room_to_id, door_to_id,
+                                                                       compact_dtypes=x).apply_preprocessing(engine="vectorized")
+                                                    for x in [False, True]]
+    for df, df_compact in [(info, info_compact), (dates, dates_compact)]:
+        assert df_compact["room_id"].dtype == "int8"
+        categoricals = [x for x in df_compact.columns if isinstance(df_compact[x].dtype, pd.CategoricalDtype)]
+        assert len(categoricals) > 0
+        df_compact = df_compact.astype({x:object for x in categoricals})
+        pd.testing.assert_frame_equal(df_compact, df, check_dtype=False)
+
+####### Lazy Loading ########
+def test_lazy_loading(monkeypatch):
+    # the files are read on first use, only the files of the selected rooms, and kept
+    read_files = []
+    read_from_csv = CoursePreprocessor.read_from_csv
+    def read(self, path_to_file):
+        read_files.append(os.path.basename(path_to_file))
+        return read_from_csv(self, path_to_file)
+    monkeypatch.setattr(CoursePreprocessor, "read_from_csv", read)
+
+    preprocessor = CoursePreprocessor(path_to_raw_courses, room_to_id, door_to_id, rooms=["HS 19"])
+    assert read_files == []
+    course_info, course_dates = preprocessor.apply_preprocessing()
+    assert sorted(read_files) == ["HS 19_courses.csv", "HS 19_dates.csv"]
+    assert (course_info["room_id"] == 1).all() and (course_dates["room_id"] == 1).all()
+
+    preprocessor.apply_preprocessing(engine="vectorized")
+    assert len(read_files) == 2
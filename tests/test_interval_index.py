@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.interval_index import CourseIntervalIndex
+
+# CourseIntervalIndex has to assign the events like a loop over all course dates
+
+def make_course_dates(seed, n_dates=60, p_overlap=0.3):
+    # course dates of rooms 0 and 1 over three days, some of them overlap
+    rng = np.random.default_rng(seed)
+    starts = pd.Timestamp("2024-04-08 08:00:00") + pd.to_timedelta(rng.integers(0, 3 * 24 * 4, n_dates) * 15, unit="min")
+    durations = np.where(rng.random(n_dates) < p_overlap, rng.integers(2, 12, n_dates) * 15, rng.integers(1, 4, n_dates) * 15)
+    # identical starts in the same room
+    starts = starts.where(rng.random(n_dates) > 0.1, starts[0])
+    return pd.DataFrame({"course_number":[f"{i:03d}.{rng.integers(100, 999)}" for i in range(n_dates)],
+                         "room_id":rng.integers(0, 2, n_dates), "start_time":starts,
+                         "end_time":starts + pd.to_timedelta(durations, unit="min")})
+
+def make_events(seed, n_events=3000):
+    # rooms 0, 1 and 2 (no course dates), also before and after all course dates
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp("2024-04-08 06:00:00") + pd.to_timedelta(rng.integers(0, 4 * 86400, n_events), unit="s")
+    return pd.DataFrame({"time":times, "room_id":rng.integers(0, 3, n_events), "event_type":rng.integers(0, 2, n_events)})
+
+def assign_loop(course_dates, events, margin_before, margin_after):
+    # covering occurrence that started last, the later row for equal starts
+    assigned = []
+    for _, event in events.iterrows():
+        best = -1
+        for i, course_date in course_dates.iterrows():
+            covers = (course_date["room_id"] == event["room_id"]
+                      and course_date["start_time"] - margin_before <= event["time"] <= course_date["end_time"] + margin_after)
+            if covers and (best < 0 or course_date["start_time"] >= course_dates.loc[best, "start_time"]):
+                best = i
+        assigned.append(best)
+    return np.array(assigned)
+
+@pytest.mark.parametrize("margin_before, margin_after", [("0min", "0min"), ("10min", "5min"), ("2h", "1h")])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_assign(seed, margin_before, margin_after):
+    course_dates = make_course_dates(seed)
+    events = make_events(seed, n_events=500)
+    margin_before, margin_after = pd.Timedelta(margin_before), pd.Timedelta(margin_after)
+    index = CourseIntervalIndex(course_dates, margin_before=margin_before, margin_after=margin_after)
+    assigned = index.assign(events)
+    np.testing.assert_array_equal(assigned, assign_loop(course_dates, events, margin_before, margin_after))
+    assert (assigned >= 0).any() and (assigned < 0).any()
+
+def test_assign_nested():
+    # a long course date around two short ones, the short ones started last
+    course_dates = pd.DataFrame({"course_number":["long", "short_1", "short_2"], "room_id":0,
+                                 "start_time":pd.to_datetime(["2024-04-08 08:00", "2024-04-08 09:00", "2024-04-08 11:00"]),
+                                 "end_time":pd.to_datetime(["2024-04-08 13:00", "2024-04-08 10:00", "2024-04-08 12:00"])})
+    events = pd.DataFrame({"time":pd.to_datetime(["2024-04-08 08:30:00", "2024-04-08 09:30:00", "2024-04-08 10:30:00",
+                                                  "2024-04-08 11:00:00", "2024-04-08 12:30:00", "2024-04-08 13:00:01"]),
+                           "room_id":0})
+    index = CourseIntervalIndex(course_dates)
+    assert list(index.assign(events)) == [0, 1, 0, 2, 0, -1]
+    np.testing.assert_array_equal(index.assign(events), assign_loop(course_dates, events, pd.Timedelta(0), pd.Timedelta(0)))
+
+####### Join ########
+def test_join():
+    course_dates = make_course_dates(2)
+    events = make_events(2, n_events=200)
+    index = CourseIntervalIndex(course_dates, margin_before=pd.Timedelta("10min"))
+    assigned = index.assign(events)
+
+    joined = index.join(events)
+    assert len(joined) == len(events)
+    assert list(joined["course_date_id"].isna()) == list(assigned < 0)
+    with_course = assigned >= 0
+    assert list(joined.loc[with_course, "course_number"]) == list(course_dates["course_number"].iloc[assigned[with_course]])
+    assert joined.loc[~with_course, "start_time"].isna().all()
+
+    inner = index.join(events, how="inner")
+    assert len(inner) == with_course.sum() and inner["course_date_id"].notna().all()
+    with pytest.raises(ValueError):
+        index.join(events, how="outer")
@@ -0,0 +1,211 @@
+import copy
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor
+from preprocessing import numpy_engine
+
+# The numpy engines (filtering_params.engine / handle_56_params.engine = "numpy")
+# have to relabel exactly like the pandas implementations.
+
+room_to_id = {"HS18":0, "HS19":1}
+door_to_id = {"door1":0, "door2":1}
+
+handle_56_params = {"k":3, "m":1, "s":3, "ns":2, "nm":4}
+filtering_params = {"discard_samples":False, "apply_filter":True, "filter_mode":"time_window",
+                    "k":2, "nm":3, "ns":1, "s":2, "lb_in":4, "lb_out":3, "handle_5":True, "handle_6":True}
+
+####### Synthetic Streams ########
+def make_stream(rng, n_samples, room_id=0, door_id=0, start="2024-04-08 08:00:00", p_tie=0.1,
+                event_types=(1, 0, 5, 6), p_event_types=(0.45, 0.4, 0.1, 0.05)):
+    """
+    Basic cleaned samples of one room/door stream, gaps of 0 seconds (tied timestamps)
+    with probability p_tie, otherwise 1 second up to 3 minutes
+    """
+    gaps = rng.choice([0, 1, 2, 3, 5, 10, 30, 60, 180], size=n_samples,
+                      p=[p_tie] + [(1 - p_tie) / 8] * 8)
+    times = pd.Timestamp(start) + pd.to_timedelta(np.cumsum(gaps), unit="s")
+    return pd.DataFrame({"time":times,
+                         "in_support_count":rng.integers(0, 9, n_samples),
+                         "out_support_count":rng.integers(0, 7, n_samples),
+                         "sensor_one_support_count":rng.integers(0, 5, n_samples),
+                         "sensor_two_support_count":rng.integers(0, 5, n_samples),
+                         "room_id":room_id, "door_id":door_id,
+                         "event_type":rng.choice(event_types, size=n_samples, p=p_event_types)})
+
+def make_streams(seed, n_samples=300, p_tie=0.1):
+    # all room/door streams, interleaved in time
+    rng = np.random.default_rng(seed)
+    streams = [make_stream(rng, n_samples, room_id, door_id, p_tie=p_tie)
+               for room_id, door_id in itertools.product([0, 1], [0, 1])]
+    return pd.concat(streams, axis=0).sort_values(by="time", kind="stable").reset_index(drop=True)
+
+def to_raw(dataframe):
+    # basic cleaned samples -> raw samples as read from the door files
+    return pd.DataFrame({"Entering":dataframe["event_type"], "Time":dataframe["time"],
+                         "People_IN":0, "People_OUT":0,
+                         "IN_Support_Count":dataframe["in_support_count"],
+                         "OUT_Support_Count":dataframe["out_support_count"],
+                         "One_Count_1":dataframe["sensor_one_support_count"],
+                         "One_Count_2":dataframe["sensor_two_support_count"],
+                         "Room_ID":dataframe["room_id"], "Door_ID":dataframe["door_id"]})
+
+@pytest.fixture
+def preprocessor():
+    # nothing is read from path_to_data
+    return SignalPreprocessor("unused", room_to_id, door_to_id)
+
+def get_params(filter_mode, handle_5, handle_6, engine):
+    params = {"filtering_params":dict(filtering_params, filter_mode=filter_mode, handle_5=handle_5,
+                                      handle_6=handle_6, engine=engine),
+              "handle_56_params":dict(handle_56_params, engine=engine)}
+    return copy.deepcopy(params)
+
+####### Event Type 5/6 ########
+@pytest.mark.parametrize("handle_5, handle_6", list(itertools.product([True, False], repeat=2)))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_filter_event_type_5_6(preprocessor, seed, handle_5, handle_6):
+    df = make_streams(seed)
+    results = [preprocessor.filter_event_type_5_6(df, handle_5=handle_5, handle_6=handle_6, engine=engine,
+                                                  **handle_56_params)
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+@pytest.mark.parametrize("p_tie", [0.5, 0.9])
+def test_filter_event_type_5_6_tied_timestamps(preprocessor, p_tie):
+    df = make_streams(3, p_tie=p_tie)
+    assert df["time"].duplicated().any()
+    results = [preprocessor.filter_event_type_5_6(df, handle_5=True, handle_6=True, engine=engine, **handle_56_params)
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+def test_filter_event_type_5_6_invalid_samples(preprocessor):
+    # only 5/6 events in the m minute window -> marked invalid (-1) and removed by both engines
+    rng = np.random.default_rng(4)
+    df = make_stream(rng, 200, event_types=(1, 5, 6), p_event_types=(0.05, 0.6, 0.35))
+    results = [preprocessor.filter_event_type_5_6(df, handle_5=True, handle_6=True, engine=engine, **handle_56_params)
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert len(results[1]) < len(df)
+
+def test_relabel_event_type_5_6_mask(preprocessor):
+    # the streaming mode only relabels the samples in the mask
+    df = make_stream(np.random.default_rng(5), 300)
+    times = numpy_engine.time_to_int(df["time"])
+    event_types = df["event_type"].to_numpy()
+    mask = np.zeros(len(df), dtype=bool)
+    mask[:200] = True
+
+    relabelled = numpy_engine.relabel_event_type_5_6(times, event_types, mask=mask, **handle_56_params)
+    np.testing.assert_array_equal(relabelled[~mask], event_types[~mask])
+
+    # the samples are relabelled in order, the first ones do not depend on the following ones
+    full = numpy_engine.relabel_event_type_5_6(times, event_types, **handle_56_params)
+    np.testing.assert_array_equal(relabelled[mask], full[mask])
+
+####### Whole Cleaning ########
+@pytest.mark.parametrize("handle_5, handle_6", list(itertools.product([True, False], repeat=2)))
+@pytest.mark.parametrize("filter_mode", ["time_window", "n_closest"])
+def test_clean_raw_data(preprocessor, filter_mode, handle_5, handle_6):
+    raw = to_raw(make_streams(6, n_samples=200, p_tie=0.3))
+    results = [preprocessor.clean_raw_data(raw, get_params(filter_mode, handle_5, handle_6, engine))[0]
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+####### Time Window Filter ########
+def filter_time_window(preprocessor, dataframe, engine, **kwargs):
+    params = dict(filtering_params, **kwargs)
+    return preprocessor.filter_data_time_window(dataframe, engine=engine, **params)
+
+@pytest.mark.parametrize("handle_5, handle_6", list(itertools.product([True, False], repeat=2)))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_filter_data_time_window(preprocessor, seed, handle_5, handle_6):
+    # 5/6 events are part of the votes if they are handled (and not relabelled before)
+    df = make_streams(seed)
+    results = [filter_time_window(preprocessor, df, engine, handle_5=handle_5, handle_6=handle_6)
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+@pytest.mark.parametrize("k, s, ns, nm", [(1, 1, 1, 1), (2, 2, 1, 3), (5, 10, 3, 4), (10, 60, 5, 9)])
+def test_filter_data_time_window_parameters(preprocessor, k, s, ns, nm):
+    df = make_streams(7, p_tie=0.3)
+    results = [filter_time_window(preprocessor, df, engine, k=k, s=s, ns=ns, nm=nm)
+               for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+@pytest.mark.parametrize("p_tie", [0.5, 0.9])
+def test_filter_data_time_window_tied_timestamps(preprocessor, p_tie):
+    df = make_streams(8, p_tie=p_tie)
+    assert df["time"].duplicated().any()
+    results = [filter_time_window(preprocessor, df, engine) for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+def test_filter_data_time_window_empty(preprocessor):
+    df = make_streams(9).iloc[:0]
+    results = [filter_time_window(preprocessor, df, engine) for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert len(results[1]) == 0
+
+@pytest.mark.parametrize("in_support_count", [0, 8])
+def test_filter_data_time_window_single_sample(preprocessor, in_support_count):
+    # the single sample has no neighbors to vote, it keeps its event type
+    df = make_stream(np.random.default_rng(10), 1, event_types=(0,), p_event_types=(1,))
+    df["in_support_count"] = in_support_count
+    df["out_support_count"] = 0
+    results = [filter_time_window(preprocessor, df, engine) for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+    pd.testing.assert_frame_equal(results[1], df)
+
+def test_filter_data_time_window_single_sample_streams(preprocessor):
+    # one door with a single sample next to regular streams
+    df = make_streams(11)
+    single = make_stream(np.random.default_rng(12), 1, room_id=1, door_id=1, event_types=(1,), p_event_types=(1,))
+    df = pd.concat([df[(df["room_id"] != 1) | (df["door_id"] != 1)], single.assign(in_support_count=0, out_support_count=0)])
+    df = df.sort_values(by="time", kind="stable").reset_index(drop=True)
+    results = [filter_time_window(preprocessor, df, engine) for engine in ["pandas", "numpy"]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+
+####### Room/Door Streams ########
+def df_room_door_dict(df):
+    # the partitioning before partition_room_door: one copy per room/door stream
+    room_door_dict = {}
+    for room in df["room_id"].unique():
+        room_dict = {}
+        for door in df["door_id"].unique():
+            mask = (df["room_id"] == room) & (df["door_id"] == door)
+            if mask.sum() > 0:
+                room_dict[door] = df[mask].reset_index(drop=True)
+        room_door_dict[room] = room_dict
+    return room_door_dict
+
+@pytest.mark.parametrize("seed", [13, 14])
+def test_partition_room_door(preprocessor, seed):
+    # streams ordered by first appearance of room and door (here room 1 and door 1 first),
+    # every stream keeps its time order
+    df = make_streams(seed)
+    first = make_stream(np.random.default_rng(seed), 1, room_id=1, door_id=1, start="2024-04-08 07:00:00")
+    df = pd.concat([first, df[(df["room_id"] != 0) | (df["door_id"] != 0)]]).reset_index(drop=True)
+
+    df_sorted, partitions = preprocessor.partition_room_door(df)
+    expected = df_room_door_dict(df)
+    assert [(room, door) for room, door, start, stop in partitions] == \
+           [(room, door) for room, room_dict in expected.items() for door in room_dict]
+    assert partitions[0][:2] == (1, 1)
+    for room, door, start, stop in partitions:
+        pd.testing.assert_frame_equal(df_sorted.iloc[start:stop].reset_index(drop=True), expected[room][door])
+    assert partitions[-1][3] == len(df)
+
+@pytest.mark.parametrize("relabel_name, relabel_params", [
+    ("relabel_time_window", {"k":2, "ns":1, "nm":3, "s":2, "lb_in":4, "lb_out":3}),
+    ("relabel_time_window_numpy", {"k":2, "ns":1, "nm":3, "s":2, "lb_in":4, "lb_out":3}),
+    ("relabel_n_closest", {"k":2, "nm":3, "lb_in":4, "lb_out":3}),
+    ("relabel_event_type_5_6_numpy", handle_56_params)])
+def test_relabel_streams_workers(preprocessor, relabel_name, relabel_params):
+    # the streams relabelled on a process pool give the serial result
+    df = make_streams(15, p_tie=0.3)
+    results = [preprocessor.relabel_streams(df, relabel_name, relabel_params, n_workers=n_workers)
+               for n_workers in [1, 2]]
+    pd.testing.assert_frame_equal(results[0], results[1])
+    assert len(results[1]) == len(df)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.occupancy import OccupancyEngine
+
+# the saturating clip of OccupancyEngine has to give the occupancy of an
+# event by event loop that clips after every event
+
+room_capacities = {0:20, 1:15}
+
+def make_events(seed, n_events=3000, p_in=0.55):
+    # rooms 0, 1 and 2 (no capacity) over three days, more in than out events -> the capacity is reached
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp("2024-04-08 06:00:00") + pd.to_timedelta(rng.integers(0, 3 * 86400, n_events), unit="s")
+    return pd.DataFrame({"time":times, "room_id":rng.integers(0, 3, n_events), "door_id":rng.integers(0, 2, n_events),
+                         "event_type":(rng.random(n_events) < p_in).astype(np.int64)})
+
+def clip_loop(engine, occupancy):
+    # the steps of the unclipped occupancy, clipped to [0, capacity] one event after another
+    clipped = np.zeros(len(occupancy))
+    for i in range(len(occupancy)):
+        capacity = room_capacities.get(engine.room_ids[i], np.inf)
+        new_segment = i == 0 or engine.segments[i] != engine.segments[i - 1]
+        state = 0 if new_segment else clipped[i - 1]
+        step = occupancy[i] if new_segment else occupancy[i] - occupancy[i - 1]
+        clipped[i] = min(max(state + step, 0), capacity)
+    return clipped
+
+@pytest.mark.parametrize("correction", [None, "reset", "drift"])
+@pytest.mark.parametrize("p_in", [0.3, 0.5, 0.7])
+def test_saturating_clip(correction, p_in):
+    events = make_events(int(p_in * 10), p_in=p_in)
+    unclipped = OccupancyEngine(events, room_capacities=room_capacities, correction=correction, clip=False)
+    engine = OccupancyEngine(events, room_capacities=room_capacities, correction=correction)
+
+    expected = clip_loop(unclipped, unclipped.occupancy)
+    np.testing.assert_allclose(engine.occupancy, expected, rtol=0, atol=1e-9)
+    if correction != "drift":
+        assert engine.occupancy.dtype == np.int64
+    # n_in and n_out are not clipped
+    np.testing.assert_array_equal(engine.n_in, unclipped.n_in)
+    np.testing.assert_array_equal(engine.n_out, unclipped.n_out)
+
+def test_saturating_clip_bounds():
+    engine = OccupancyEngine(make_events(7, p_in=0.8), room_capacities=room_capacities, correction=None)
+    df = engine.event_occupancy()
+    assert (df["occupancy"] >= 0).all()
+    for room_id, capacity in room_capacities.items():
+        assert df.loc[df["room_id"] == room_id, "occupancy"].max() == capacity
+    # room 2 has no capacity, it is only clipped at 0
+    assert df.loc[df["room_id"] == 2, "occupancy"].max() > max(room_capacities.values())
+
+def test_saturating_clip_empty_room():
+    # an out event in an empty room is ignored
+    events = pd.DataFrame({"time":pd.date_range("2024-04-08 08:00:00", periods=5, freq="1min"),
+                           "room_id":0, "door_id":0, "event_type":[0, 1, 1, 0, 1]})
+    engine = OccupancyEngine(events, room_capacities=room_capacities, correction=None)
+    assert list(engine.occupancy) == [0, 1, 2, 1, 2]
+    engine = OccupancyEngine(events, room_capacities=room_capacities, correction=None, clip=False)
+    assert list(engine.occupancy) == [-1, 0, 1, 0, 1]
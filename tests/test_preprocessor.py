@@ -0,0 +1,218 @@
+import os
+import copy
+import json
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor
+from benchmarks.synthetic_archive import generate_archive
+
+# SignalPreprocessor on a small synthetic archive, the streaming mode has to give
+# the same cleaned samples as the batch mode.
+
+room_to_id = {"HS18":0, "HS19":1}
+door_to_id = {"door1":0, "door2":1}
+
+path_to_params = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "parameters", "preprocessing_parameters.json")
+with open(path_to_params, "r") as file:
+    base_params = json.load(file)
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("archive"))
+    generate_archive(path, days=3, events_per_day=300, seed=1)
+    return path
+
+def get_params(**filtering_params):
+    params = copy.deepcopy(base_params)
+    params["filtering_params"].update(filtering_params)
+    return params
+
+####### Ingest ########
+@pytest.mark.parametrize("compact_dtypes", [False, True])
+def test_get_raw_data_dtypes(archive, compact_dtypes):
+    # the concatenation keeps the dtypes of the door files, without pandas warnings
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        df = preprocessor.get_raw_data()
+    dtypes = preprocessor.read_door_file("data_HS18_2024-04-08", "door1.csv").dtypes
+    pd.testing.assert_series_equal(df.dtypes, dtypes)
+    assert df["Room_ID"].tolist() == sorted(df["Room_ID"].tolist())
+
+def test_get_raw_data_empty(archive):
+    # no selected directories -> no samples, same columns and dtypes
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    dtypes = preprocessor.get_raw_data().dtypes
+    df = SignalPreprocessor(archive, room_to_id, door_to_id, start_date="2030-01-01").get_raw_data()
+    assert len(df) == 0
+    pd.testing.assert_series_equal(df.dtypes, dtypes)
+    cleaned_data, _ = SignalPreprocessor(archive, room_to_id, door_to_id, start_date="2030-01-01").apply_preprocessing(get_params())
+    assert len(cleaned_data) == 0
+
+####### Lazy Loading ########
+@pytest.fixture
+def read_files(monkeypatch):
+    # (directory, door file) of every file read
+    read_files = []
+    read_door_file = SignalPreprocessor.read_door_file
+    def read(self, data_dir_name, door_file):
+        read_files.append((data_dir_name, door_file))
+        return read_door_file(self, data_dir_name, door_file)
+    monkeypatch.setattr(SignalPreprocessor, "read_door_file", read)
+    return read_files
+
+def test_lazy_constructor(tmp_path):
+    # nothing is read or listed in the constructor
+    preprocessor = SignalPreprocessor(str(tmp_path / "missing"), room_to_id, door_to_id)
+    assert preprocessor.list_dirs is None and preprocessor.raw_uncleaned_data is None
+    with pytest.raises(OSError, match="missing"):
+        preprocessor.get_raw_data()
+
+def test_lazy_filters(archive, read_files):
+    # only the directories of the date range and rooms are read
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, start_date="2024-04-09", rooms=["HS19"])
+    assert read_files == []
+    df = preprocessor.get_raw_data()
+    assert sorted(set(x[0] for x in read_files)) == ["data_HS19_2024-04-09", "data_HS19_2024-04-10"]
+    assert len(read_files) == 4
+    assert (df["Room_ID"] == 1).all() and (df["Time"] >= pd.Timestamp("2024-04-09")).all()
+
+def test_lazy_reuse(archive, read_files):
+    # the loaded samples are kept for later calls, also with filters
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    params = get_params()
+    cleaned_data, _ = preprocessor.apply_preprocessing(params)
+    assert len(read_files) == 12
+    pd.testing.assert_frame_equal(preprocessor.apply_preprocessing(params)[0], cleaned_data)
+    filtered, _ = preprocessor.apply_preprocessing(params, start_date="2024-04-10", rooms=["HS18"])
+    assert len(read_files) == 12
+    assert len(filtered) > 0 and (filtered["room_id"] == 0).all()
+
+    # without loaded samples a filtered call reads the selected days and their neighbors only
+    read_files.clear()
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    pd.testing.assert_frame_equal(preprocessor.apply_preprocessing(params, start_date="2024-04-10", rooms=["HS18"])[0],
+                                  filtered)
+    assert sorted(set(x[0] for x in read_files)) == ["data_HS18_2024-04-09", "data_HS18_2024-04-10"]
+
+####### Discard Samples ########
+def make_samples(seed, n_rows=2000):
+    # random times of day over two weeks, plus the window bounds and the samples next to them
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp("2024-04-08") + pd.to_timedelta(rng.integers(0, 14 * 86400 * 10**6, n_rows), unit="us")
+    bounds = pd.to_datetime(["2024-04-09 07:40:00", "2024-04-09 22:00:00", "2024-04-13 08:00:00"])
+    times = times.append(bounds).append(bounds - pd.Timedelta("1us")).append(bounds + pd.Timedelta("1us"))
+    return pd.DataFrame({"time":times, "room_id":rng.integers(0, 2, len(times)), "door_id":0, "event_type":1})
+
+def in_window_loop(row, windows):
+    # row-wise reference, the time of day compared as datetime.time
+    for window in windows:
+        in_window = pd.Timestamp(window["start"]).time() <= row["time"].time() <= pd.Timestamp(window["end"]).time()
+        if window.get("room_id") is not None:
+            in_window &= row["room_id"] == window["room_id"]
+        if window.get("weekdays") is not None:
+            in_window &= row["time"].weekday() in window["weekdays"]
+        if in_window:
+            return True
+    return False
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_discard_samples(archive, seed):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    df = make_samples(seed)
+    lb, ub = pd.Timestamp("07:40:00").time(), pd.Timestamp("22:00:00").time()
+    expected = df[df.apply(lambda x: lb <= x["time"].time() <= ub, axis=1)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(preprocessor.discard_samples(df, lb, ub), expected)
+    # the bounds are kept, the samples a microsecond outside are not
+    assert expected["time"].isin(pd.to_datetime(["2024-04-09 07:40:00", "2024-04-09 22:00:00"])).sum() == 2
+    assert not expected["time"].isin(pd.to_datetime(["2024-04-09 07:39:59.999999", "2024-04-09 22:00:00.000001"])).any()
+
+@pytest.mark.parametrize("windows", [[{"start":"07:40:00", "end":"22:00:00"}],
+                                     [{"start":"07:40:00", "end":"12:00:00", "room_id":0},
+                                      {"start":"10:00:00", "end":"22:00:00", "room_id":1}],
+                                     [{"start":"07:40:00", "end":"22:00:00", "weekdays":[0, 1, 2, 3, 4]},
+                                      {"start":"08:00:00", "end":"18:00:00", "weekdays":[5], "room_id":1}],
+                                     []])
+def test_discard_samples_by_windows(archive, windows):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    df = make_samples(2)
+    expected = df[df.apply(lambda x: in_window_loop(x, windows), axis=1).astype(bool)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(preprocessor.discard_samples_by_windows(df, windows), expected)
+
+####### Compact Dtypes ########
+@pytest.mark.parametrize("filter_mode", ["discard", "n_closest", "time_window"])
+@pytest.mark.parametrize("discard_samples", [False, True])
+def test_compact_dtypes(archive, filter_mode, discard_samples):
+    # same values as the default dtypes, in the types of compact_schema
+    params = get_params(filter_mode=filter_mode, discard_samples=discard_samples)
+    expected_cleaned, expected_raw = SignalPreprocessor(archive, room_to_id, door_to_id).apply_preprocessing(params)
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=True)
+    cleaned_data, raw_data = preprocessor.apply_preprocessing(params)
+
+    for df, expected in [(cleaned_data, expected_cleaned), (raw_data, expected_raw)]:
+        for column, dtype in preprocessor.compact_schema.items():
+            assert df[column].dtype == dtype
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+        assert df.memory_usage(deep=True).sum() < expected.memory_usage(deep=True).sum() / 2
+
+def test_compact_dtypes_large_values(archive):
+    # values that do not fit into the type of compact_schema get the smallest type that holds them
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=True)
+    df = pd.DataFrame({"in_support_count":[0, 70000], "event_type":[-1, 1], "room_id":[0, 300], "door_id":[0, 1]})
+    df_compact = preprocessor.compact(df)
+    assert df_compact["in_support_count"].dtype == np.uint32
+    assert df_compact["event_type"].dtype == np.int8
+    assert df_compact["room_id"].dtype == np.uint16
+    pd.testing.assert_frame_equal(df_compact, df, check_dtype=False)
+
+def test_compact_dtypes_csv(archive, tmp_path):
+    # the saved csv files are the same
+    params = get_params()
+    for compact_dtypes, file_name in [(False, "default"), (True, "compact")]:
+        preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+        preprocessor.save_to_csv(preprocessor.apply_preprocessing(params)[0], str(tmp_path), file_name)
+    assert (tmp_path / "default.csv").read_bytes() == (tmp_path / "compact.csv").read_bytes()
+
+####### Streaming ########
+def apply_streaming(preprocessor, params):
+    # the chunks are per room/door stream, the batch result is sorted by time
+    return preprocessor.sort_by_time(pd.concat(list(preprocessor.iter_preprocessing(params)), axis=0))
+
+@pytest.mark.parametrize("compact_dtypes", [False, True])
+@pytest.mark.parametrize("discard_samples", [False, True])
+@pytest.mark.parametrize("handle_6", [False, True])
+@pytest.mark.parametrize("filter_mode", ["discard", "time_window"])
+def test_iter_preprocessing(archive, filter_mode, handle_6, discard_samples, compact_dtypes):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+    params = get_params(filter_mode=filter_mode, handle_6=handle_6, discard_samples=discard_samples)
+    pd.testing.assert_frame_equal(apply_streaming(preprocessor, params), preprocessor.apply_preprocessing(params)[0])
+
+@pytest.mark.parametrize("handle_6", [False, True])
+def test_iter_preprocessing_n_closest(archive, handle_6):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    params = get_params(filter_mode="n_closest", handle_6=handle_6)
+    pd.testing.assert_frame_equal(apply_streaming(preprocessor, params), preprocessor.apply_preprocessing(params)[0])
+
+def test_iter_preprocessing_no_filter(archive):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    params = get_params(apply_filter=False)
+    pd.testing.assert_frame_equal(apply_streaming(preprocessor, params), preprocessor.apply_preprocessing(params)[0])
+
+def test_apply_preprocessing_streaming(archive, tmp_path):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    params = get_params()
+    expected = preprocessor.apply_preprocessing(params)[0]
+    assert preprocessor.apply_preprocessing_streaming(params, str(tmp_path), "cleaned") == len(expected)
+
+def test_sort_by_time_ties(archive):
+    # identical timestamps are ordered by room and door, otherwise the order is kept
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id)
+    df = pd.DataFrame({"time":pd.to_datetime(["2024-04-08 10:00:01"] * 3 + ["2024-04-08 10:00:00"]),
+                       "room_id":[1, 0, 0, 1], "door_id":[0, 1, 1, 0], "event_type":[0, 1, 0, 1]})
+    df_sorted = preprocessor.sort_by_time(df)
+    assert list(df_sorted["event_type"]) == [1, 1, 0, 0]
+    assert list(df_sorted["room_id"]) == [1, 0, 0, 1]
@@ -0,0 +1,102 @@
+import os
+import copy
+import json
+import tracemalloc
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor
+from preprocessing.profiling import StageProfiler
+from benchmarks.synthetic_archive import generate_archive
+
+# records and summary of StageProfiler, on its own and in apply_preprocessing
+
+room_to_id = {"HS18":0, "HS19":1}
+door_to_id = {"door1":0, "door2":1}
+
+path_to_params = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "parameters", "preprocessing_parameters.json")
+with open(path_to_params, "r") as file:
+    base_params = json.load(file)
+
+summary_columns = ["preprocessor", "stage", "rows_in", "rows_out", "rows_relabelled", "seconds", "memory_delta_mb"]
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("archive"))
+    generate_archive(path, days=2, events_per_day=300, seed=4)
+    return path
+
+####### Stages ########
+@pytest.mark.parametrize("trace_memory", [False, True])
+def test_summary(tmp_path, trace_memory):
+    log_path = str(tmp_path / "stages.jsonl")
+    records = []
+    profiler = StageProfiler(callback=records.append, log_path=log_path, trace_memory=trace_memory)
+    with profiler.stage("Test", "outer", 10) as outer:
+        with profiler.stage("Test", "inner", 10) as inner:
+            profiler.add_relabelled(3)
+            inner["rows_out"] = 8
+        outer["rows_out"] = 8
+
+    summary = profiler.summary()
+    columns = summary_columns + (["peak_memory_mb"] if trace_memory else [])
+    assert list(summary.columns) == columns
+    # the records are finished from the inside out
+    assert list(summary["stage"]) == ["inner", "outer"]
+    assert list(summary["rows_relabelled"].fillna(0)) == [3, 0]
+    assert list(summary["rows_out"]) == [8, 8]
+    assert (summary["seconds"] >= 0).all() and summary["memory_delta_mb"].notna().all()
+    assert records == profiler.records
+
+    with open(log_path, "r") as file:
+        logged = [json.loads(x) for x in file]
+    assert logged == profiler.records
+    assert set(logged[0].keys()) == set(columns)
+
+def test_trace_memory_stopped():
+    # the profiler stops the tracing it started when the outermost stage ends
+    assert not tracemalloc.is_tracing()
+    profiler = StageProfiler(trace_memory=True)
+    with profiler.stage("Test", "outer"):
+        with profiler.stage("Test", "inner"):
+            data = [0] * 100000
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    assert profiler.records[0]["peak_memory_mb"] > 0.5
+    del data
+
+def test_trace_memory_started_by_caller():
+    # tracing started outside of the profiler keeps running
+    tracemalloc.start()
+    try:
+        profiler = StageProfiler(trace_memory=True)
+        with profiler.stage("Test", "outer"):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+####### Preprocessing ########
+def test_from_params():
+    assert StageProfiler.from_params(base_params) is None
+    params = copy.deepcopy(base_params)
+    params["profiling_params"]["enabled"] = True
+    assert isinstance(StageProfiler.from_params(params), StageProfiler)
+
+def test_apply_preprocessing_stages(archive):
+    params = copy.deepcopy(base_params)
+    profiler = StageProfiler()
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, profiler=profiler)
+    cleaned_data, _ = preprocessor.apply_preprocessing(params)
+
+    summary = profiler.summary()
+    assert list(summary.columns) == summary_columns
+    assert (summary["preprocessor"] == "SignalPreprocessor").all()
+    stages = list(summary["stage"])
+    assert stages[0] == "ingest" and "basic_cleaning" in stages
+    # the rows of the ingest are the data directories
+    ingest = summary[summary["stage"] == "ingest"].iloc[0]
+    assert ingest["rows_in"] == 4 and ingest["rows_out"] > 0
+    assert summary["rows_relabelled"].notna().any()
+    assert summary["seconds"].notna().all()
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,91 @@
+import os
+import json
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor, CoursePreprocessor
+from benchmarks.synthetic_archive import generate_archive
+
+# parquet (partitioned or not) and feather files have to give back the saved frames
+
+pytest.importorskip("pyarrow")
+
+room_to_id = {"HS18":0, "HS 18":0, "HS19":1, "HS 19":1}
+door_to_id = {"door1":0, "door2":1}
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+path_to_raw_courses = os.path.join(root, "data", "raw")
+with open(os.path.join(root, "parameters", "preprocessing_parameters.json"), "r") as file:
+    params = json.load(file)
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("archive"))
+    generate_archive(path, days=3, events_per_day=300, seed=3)
+    return path
+
+@pytest.fixture(scope="module", params=[False, True], ids=["default", "compact"])
+def cleaned_data(request, archive):
+    preprocessor = SignalPreprocessor(archive, room_to_id, door_to_id, compact_dtypes=request.param)
+    return preprocessor, preprocessor.apply_preprocessing(params)[0]
+
+####### Round Trips ########
+@pytest.mark.parametrize("partition_cols", [None, ["room_id", "door_id", "date"]])
+def test_parquet_round_trip(cleaned_data, tmp_path, partition_cols):
+    preprocessor, df = cleaned_data
+    preprocessor.save_to_parquet(df, str(tmp_path), "frequency_data", partition_cols=partition_cols)
+    df_read = preprocessor.read_from_parquet(str(tmp_path), "frequency_data")
+    # the partitions are read in partition order
+    df_read = preprocessor.sort_by_time(df_read)
+    pd.testing.assert_frame_equal(df_read, df)
+
+def test_feather_round_trip(cleaned_data, tmp_path):
+    preprocessor, df = cleaned_data
+    preprocessor.save_to_feather(df, str(tmp_path), "frequency_data")
+    pd.testing.assert_frame_equal(preprocessor.read_from_feather(str(tmp_path), "frequency_data"), df)
+
+def sort_courses(df):
+    columns = [x for x in ["start_time", "course_number", "room_id"] if x in df.columns]
+    return df.sort_values(by=columns).reset_index(drop=True)
+
+@pytest.mark.parametrize("compact_dtypes", [False, True])
+def test_parquet_round_trip_courses(tmp_path, compact_dtypes):
+    # course number (340.100) as partition value stays a string, categoricals are kept
+    preprocessor = CoursePreprocessor(path_to_raw_courses, room_to_id, door_to_id, compact_dtypes=compact_dtypes)
+    course_info, course_dates = preprocessor.apply_preprocessing(engine="vectorized")
+    preprocessor.save_to_parquet(course_info, str(tmp_path), "course_info", partition_cols=["course_number"])
+    preprocessor.save_to_parquet(course_dates, str(tmp_path), "course_dates", partition_cols=["date"])
+
+    for file_name, df in [("course_info", course_info), ("course_dates", course_dates)]:
+        # the partitions are read in partition order
+        df_read = sort_courses(preprocessor.read_from_parquet(str(tmp_path), file_name))
+        pd.testing.assert_frame_equal(df_read, sort_courses(df))
+
+####### Partition Pruning ########
+def test_parquet_partition_pruning(cleaned_data, tmp_path):
+    preprocessor, df = cleaned_data
+    preprocessor.save_to_parquet(df, str(tmp_path), "frequency_data", partition_cols=["room_id", "door_id", "date"])
+    path = tmp_path / "frequency_data"
+    assert sorted(os.listdir(path)) == ["_schema.json", "room_id=0", "room_id=1"]
+
+    # the files of the other partitions are not read (they are broken now)
+    for dir_path, _, file_names in os.walk(path / "room_id=1"):
+        for file_name in file_names:
+            with open(os.path.join(dir_path, file_name), "wb") as file:
+                file.write(b"broken")
+    filters = [("room_id", "==", 0), ("date", ">=", "2024-04-09")]
+    df_read = preprocessor.sort_by_time(preprocessor.read_from_parquet(str(tmp_path), "frequency_data", filters=filters))
+
+    expected = df[(df["room_id"] == 0) & (df["time"] >= pd.Timestamp("2024-04-09"))].reset_index(drop=True)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(df_read, expected)
+
+def test_parquet_append(cleaned_data, tmp_path):
+    # the days are written one after another to the same dataset
+    preprocessor, df = cleaned_data
+    days = df["time"].dt.strftime("%Y-%m-%d")
+    for i, day in enumerate(sorted(days.unique())):
+        preprocessor.save_to_parquet(df[days == day], str(tmp_path), "frequency_data",
+                                     partition_cols=["room_id", "door_id", "date"], append=(i > 0))
+    df_read = preprocessor.sort_by_time(preprocessor.read_from_parquet(str(tmp_path), "frequency_data"))
+    pd.testing.assert_frame_equal(df_read, df)
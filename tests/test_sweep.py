@@ -0,0 +1,70 @@
+import os
+import copy
+import json
+import pandas as pd
+import pytest
+
+from preprocessing.preprocessor import SignalPreprocessor
+from preprocessing.sweep import ParameterSweep
+from benchmarks.synthetic_archive import generate_archive
+
+# every configuration of a sweep has to give the result of apply_preprocessing
+
+room_to_id = {"HS18":0, "HS19":1}
+door_to_id = {"door1":0, "door2":1}
+
+path_to_params = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "parameters", "preprocessing_parameters.json")
+with open(path_to_params, "r") as file:
+    base_params = json.load(file)
+
+grid = {"filtering_params.filter_mode":["discard", "n_closest", "time_window"],
+        "filtering_params.discard_samples":[False, True],
+        "filtering_params.handle_6":[False, True],
+        "handle_56_params.s":[2, 3]}
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("archive"))
+    generate_archive(path, days=2, events_per_day=300, seed=5)
+    return path
+
+def apply_preprocessing(archive, params):
+    return SignalPreprocessor(archive, room_to_id, door_to_id).apply_preprocessing(copy.deepcopy(params))[0]
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_run(archive, n_workers):
+    sweep = ParameterSweep(SignalPreprocessor(archive, room_to_id, door_to_id), base_params, n_workers=n_workers,
+                           evaluate=lambda df, params: {"n_events":len(df)})
+    results = sweep.run(grid)
+    names, param_sets = sweep.expand_grid(grid)
+    assert len(results) == len(param_sets) == 24
+    assert list(results.columns) == ["config_id"] + names + ["rows_raw", "rows_cleaned", "n_in", "n_out", "n_events"]
+
+    for (_, row), params in zip(results.iterrows(), param_sets):
+        expected = apply_preprocessing(archive, params)
+        pd.testing.assert_frame_equal(sweep.get_cleaned_data(params), expected)
+        assert row["rows_cleaned"] == row["n_events"] == len(expected)
+        assert row["n_in"] == (expected["event_type"] == 1).sum()
+        assert row["n_out"] == (expected["event_type"] == 0).sum()
+
+def test_shared_stages(archive):
+    # lb_in/lb_out only change the filters, the 5/6 handling is run once
+    sweep = ParameterSweep(SignalPreprocessor(archive, room_to_id, door_to_id), base_params)
+    sweep.run({"filtering_params.lb_in":[2, 3, 4], "filtering_params.lb_out":[2, 3]})
+    assert len(sweep.discarded) == 1 and len(sweep.handled) == 1 and len(sweep.cleaned) == 6
+
+    # the memoized stages are reused by the next run
+    basic_cleaned = sweep.basic_cleaned
+    sweep.run({"filtering_params.lb_in":[4, 5]})
+    assert sweep.basic_cleaned is basic_cleaned and len(sweep.handled) == 1 and len(sweep.cleaned) == 7
+
+    params = copy.deepcopy(base_params)
+    params["filtering_params"]["lb_in"] = 5
+    pd.testing.assert_frame_equal(sweep.get_cleaned_data(params), apply_preprocessing(archive, params))
+
+def test_no_filter(archive):
+    sweep = ParameterSweep(SignalPreprocessor(archive, room_to_id, door_to_id), base_params)
+    params = copy.deepcopy(base_params)
+    params["filtering_params"]["apply_filter"] = False
+    pd.testing.assert_frame_equal(sweep.get_cleaned_data(params), apply_preprocessing(archive, params))
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing import time_parser
+from preprocessing.time_parser import parse_ctime, ctime_format
+
+# parse_ctime has to give the result of pd.to_datetime(series, format=ctime_format)
+
+def random_ctimes(seed, n_rows, start="1970-01-01", end="2100-12-31"):
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds(), n_rows)
+    times = pd.Timestamp(start) + pd.to_timedelta(seconds, unit="s")
+    return pd.Series(times.strftime(ctime_format), name="Time")
+
+def assert_parsed_equal(series):
+    try:
+        expected = pd.to_datetime(series, format=ctime_format)
+    except ValueError:
+        with pytest.raises(ValueError):
+            parse_ctime(series)
+        return
+    pd.testing.assert_series_equal(parse_ctime(series), expected)
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_parse_ctime(seed):
+    assert_parsed_equal(random_ctimes(seed, 10000))
+
+def test_parse_ctime_calendar():
+    # month ends, leap days and the turn of the year
+    days = pd.to_datetime(["2024-02-29", "2023-02-28", "2000-02-29", "2024-12-31", "2025-01-01", "2024-04-30"])
+    times = pd.Series(days + pd.Timedelta("23:59:59")).dt.strftime(ctime_format)
+    assert_parsed_equal(times)
+
+def test_parse_ctime_blocks(monkeypatch):
+    # the rows are parsed in blocks of block_size rows
+    monkeypatch.setattr(time_parser, "block_size", 7)
+    series = random_ctimes(2, 100)
+    series.index = np.arange(100) * 3
+    assert_parsed_equal(series)
+
+####### Invalid Rows ########
+@pytest.mark.parametrize("value", [None, np.nan, "Mon Apr  8 06:30:17 2024", "Mon Apr 08 6:30:17 2024",
+                                   " Mon Apr 08 06:30:17 2024", "Mon Apr 08 06:30:17 2024 ", "Mon Apr 08 06:30:17 24",
+                                   "Mon Apx 08 06:30:17 2024", "Mon Feb 30 06:30:17 2024", "Mon Apr 08 24:00:00 2024",
+                                   "Mon Apr 00 06:30:17 2024", "Xyz Apr 08 06:30:17 2024", "2024-04-08 06:30:17"])
+def test_parse_ctime_invalid_rows(value):
+    # rows that do not match the layout go through pd.to_datetime: same value or same error
+    series = pd.concat([random_ctimes(3, 5), pd.Series([value], name="Time")], ignore_index=True)
+    assert_parsed_equal(series)
+
+def test_parse_ctime_missing_values():
+    series = pd.concat([random_ctimes(4, 5), pd.Series([np.nan, None], name="Time")], ignore_index=True)
+    result = parse_ctime(series)
+    assert result[:5].notna().all() and result[5:].isna().all()
+    pd.testing.assert_series_equal(result, pd.to_datetime(series, format=ctime_format))
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+from webcrawler.webcrawler import Snail, RateLimiter, ResponseCache, SearchResultError
+from tests.kusss_server import KusssServer
+
+# The crawler runs against a local server (tests/kusss_server.py) that serves
+# the recorded KUSSS pages in tests/fixtures/kusss.
+
+rooms = ["HS 18", "HS 19", "HS 1"]
+n_lvas = 7
+
+# parsing restricted to the used tags, see Snail
+tag_attributes = ["catalogue_tags", "search_result_tags", "lva_page_tags", "studyhandbook_tags"]
+
+@pytest.fixture
+def server(monkeypatch):
+    with KusssServer() as server:
+        monkeypatch.setattr(Snail, "base_url", server.url + "/kusss/")
+        yield server
+
+def crawl(room_names=rooms, **kwargs):
+    snail = Snail(**kwargs)
+    return snail.get_courses_by_rooms(room_names)
+
+def assert_results_equal(results, expected):
+    assert list(results.keys()) == list(expected.keys())
+    for room in expected:
+        for df, df_expected in zip(results[room], expected[room]):
+            pd.testing.assert_frame_equal(df, df_expected)
+
+def age_cache(cache_dir, seconds):
+    # the cached pages were fetched the given number of seconds earlier
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(".json"):
+            path = os.path.join(cache_dir, file_name)
+            with open(path, "r") as file:
+                meta = json.load(file)
+            meta["fetched"] -= seconds
+            with open(path, "w") as file:
+                json.dump(meta, file)
+
+def assert_spacing(times, interval, tolerance=0.02):
+    # request j is sent at least (j - i) intervals after request i, the threads
+    # can only wake up late, which shortens the gap after a late request by the delay
+    times = np.sort(times)
+    positions = np.arange(len(times))
+    gaps = times[None, :] - times[:, None]
+    min_gaps = (positions[None, :] - positions[:, None]) * interval - tolerance
+    later = positions[None, :] > positions[:, None]
+    assert (gaps[later] >= min_gaps[later]).all()
+
+####### Crawling ########
+def test_get_courses_by_rooms(server):
+    results = crawl()
+    df_courses, df_dates = results["HS 18"]
+    assert list(df_courses["LVA-Nr."]) == ["340.100", "531.163", "239.141", "364.000", "361.001"]
+    assert (df_dates["Ort"] == "HS 18").all()
+    assert df_courses.loc[0, "max_students"] == 200 and df_courses.loc[0, "registered_students"] == 194
+    assert df_courses.loc[0, "Quellcurriculum"] == "Bachelorstudium Informatik 2021S"
+    # study handbook entry not found
+    assert df_courses.loc[1, "Studienfach"] == "Not available"
+
+    # empty search result
+    df_courses, df_dates = results["HS 1"]
+    assert len(df_courses) == 0 and len(df_dates) == 0
+
+    # courses held in both rooms are crawled once
+    assert len(server.get_statuses("/kusss/courseclass.action")) == n_lvas
+
+def test_get_courses_by_rooms_concurrent(server):
+    assert_results_equal(crawl(n_workers=4), crawl(n_workers=1))
+
+####### Retries ########
+def test_retry_server_errors(server):
+    server.fail_next = 2
+    Snail(max_retries=3, backoff_factor=0)
+    assert server.get_statuses() == [503, 503, 200]
+
+def test_retry_server_errors_exhausted(server):
+    server.fail_next = 3
+    with pytest.raises(requests.exceptions.RetryError):
+        Snail(max_retries=2, backoff_factor=0)
+
+def test_retry_crawl(server):
+    expected = crawl()
+    server.clear_log()
+    server.fail_next = 1
+    assert_results_equal(crawl(max_retries=1, backoff_factor=0), expected)
+    assert server.get_statuses()[0] == 503
+
+def test_search_result_errors(server):
+    file_name = "coursecatalogue-search_518.html"
+    with open(os.path.join(server.path_to_pages, file_name), "r", encoding="utf-8") as file:
+        html = file.read()
+
+    # a page without the result table names the room id and the url
+    server.pages[file_name] = html[:html.index('<table border="0"')] + "</body></html>"
+    with pytest.raises(SearchResultError, match="room 518 at .*coursecatalogue-search.action"):
+        crawl(["HS 18"])
+
+    # a row with a missing cell names the room and the row
+    server.pages[file_name] = html.replace("<td>VO</td>", "", 1)
+    with pytest.raises(SearchResultError, match="room HS 18: row 1 has"):
+        crawl(["HS 18"])
+
+####### Incremental Re-crawl ########
+def update(path_to_raw_data, **kwargs):
+    os.makedirs(path_to_raw_data, exist_ok=True)
+    return Snail().update_courses_by_rooms(rooms, str(path_to_raw_data), **kwargs)
+
+def read_files(path_to_raw_data, suffixes=(".csv", ".json")):
+    return {x:(path_to_raw_data / x).read_bytes() for x in sorted(os.listdir(path_to_raw_data)) if x.endswith(suffixes)}
+
+def test_update_unchanged(server, tmp_path):
+    update(tmp_path)
+    files = read_files(tmp_path)
+    assert len(server.get_statuses("/kusss/courseclass.action")) == n_lvas
+
+    # only the search results are requested again, the files stay the same
+    server.clear_log()
+    update(tmp_path)
+    assert server.get_statuses("/kusss/courseclass.action") == []
+    assert not any(x[1].startswith("/studyhandbook/") for x in server.log)
+    assert read_files(tmp_path) == files
+
+def test_update_forced(server, tmp_path):
+    update(tmp_path / "full")
+    file_name = "courseclass_340.100.html"
+    with open(os.path.join(server.path_to_pages, file_name), "r", encoding="utf-8") as file:
+        server.pages[file_name] = file.read().replace("<td>194</td>", "<td>199</td>")
+
+    # max_age=0 crawls every lva again -> same files as a crawl without previous files
+    server.clear_log()
+    update(tmp_path / "full", max_age=0)
+    assert len(server.get_statuses("/kusss/courseclass.action")) == n_lvas
+    update(tmp_path / "new")
+    assert read_files(tmp_path / "full", ".csv") == read_files(tmp_path / "new", ".csv")
+    df_courses = pd.read_csv(tmp_path / "full" / "HS 18_courses.csv", dtype=str)
+    assert df_courses.loc[0, "registered_students"] == "199"
+
+def test_update_changed_lva(server, tmp_path):
+    update(tmp_path)
+    file_name = "courseclass_340.100.html"
+    with open(os.path.join(server.path_to_pages, file_name), "r", encoding="utf-8") as file:
+        server.pages[file_name] = file.read().replace("<td>194</td>", "<td>199</td>")
+
+    # only the lva crawled more than max_age seconds ago is crawled again
+    path = tmp_path / "HS 18_crawl_times.json"
+    crawl_times = json.loads(path.read_text())
+    crawl_times["340.100"] -= 7200
+    path.write_text(json.dumps(crawl_times))
+    server.clear_log()
+    df_courses, _ = update(tmp_path, max_age=3600)["HS 18"]
+    assert server.get_statuses("/kusss/courseclass.action") == [200]
+    assert df_courses.loc[0, "registered_students"] == 199
+
+    # the merged files equal a full crawl of the changed pages
+    update(tmp_path / "new")
+    assert read_files(tmp_path, ".csv") == read_files(tmp_path / "new", ".csv")
+
+####### Rate Limiter ########
+def test_rate_limiter_spacing():
+    rate_limiter = RateLimiter(requests_per_second=50)
+    times = []
+    lock = threading.Lock()
+
+    def request(url):
+        rate_limiter.wait(url)
+        with lock:
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=request, args=("http://a.test/page",)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert_spacing(times, 0.02)
+
+def test_rate_limiter_hosts():
+    # the hosts are limited independently
+    rate_limiter = RateLimiter(requests_per_second=1)
+    start = time.monotonic()
+    rate_limiter.wait("http://a.test/page")
+    rate_limiter.wait("http://b.test/page")
+    assert time.monotonic() - start < 0.5
+
+def test_rate_limited_crawl(server):
+    crawl(n_workers=4, requests_per_second=40)
+    assert_spacing([x[0] for x in server.log], 0.025)
+
+####### Response Cache ########
+def test_cache_hit_miss(server, tmp_path):
+    expected = crawl(cache_dir=str(tmp_path), cache_ttl=3600)
+    n_requests = len(server.log)
+    assert set(server.get_statuses()) == {200}
+
+    # everything is cached and fresh
+    assert_results_equal(crawl(cache_dir=str(tmp_path), cache_ttl=3600), expected)
+    assert len(server.log) == n_requests
+
+    # a missing page is requested again
+    cached = [x for x in os.listdir(tmp_path) if x.endswith(".html.gz")]
+    os.remove(os.path.join(tmp_path, cached[0]))
+    assert_results_equal(crawl(cache_dir=str(tmp_path), cache_ttl=3600), expected)
+    assert len(server.log) == n_requests + 1
+
+def test_cache_ttl_expiry(server, tmp_path):
+    expected = crawl(cache_dir=str(tmp_path), cache_ttl=3600)
+    n_requests = len(server.log)
+
+    # expired entries are revalidated with their ETag, 304 -> served from the cache
+    age_cache(tmp_path, 7200)
+    server.clear_log()
+    assert_results_equal(crawl(cache_dir=str(tmp_path), cache_ttl=3600), expected)
+    assert len(server.log) == n_requests
+    assert all(x[2] is not None for x in server.log)
+    assert set(server.get_statuses()) == {304}
+
+    # the revalidation restarts the ttl
+    server.clear_log()
+    crawl(cache_dir=str(tmp_path), cache_ttl=3600)
+    assert len(server.log) == 0
+
+def test_cache_changed_page(server, tmp_path):
+    crawl(cache_dir=str(tmp_path), cache_ttl=3600)
+
+    # the page of an lva changed after the entries expired
+    file_name = "courseclass_340.100.html"
+    with open(os.path.join(server.path_to_pages, file_name), "r", encoding="utf-8") as file:
+        server.pages[file_name] = file.read().replace("<td>194</td>", "<td>199</td>")
+    age_cache(tmp_path, 7200)
+    server.clear_log()
+
+    df_courses, _ = crawl(cache_dir=str(tmp_path), cache_ttl=3600)["HS 18"]
+    assert df_courses.loc[0, "registered_students"] == 199
+    assert server.get_statuses("/kusss/courseclass.action").count(200) == 1
+    assert server.get_statuses().count(304) == len(server.log) - 1
+
+    # the changed page is cached
+    df_courses, _ = crawl(cache_dir=str(tmp_path), cache_ttl=3600, offline=True)["HS 18"]
+    assert df_courses.loc[0, "registered_students"] == 199
+
+def test_cache_offline(server, tmp_path):
+    expected = crawl(cache_dir=str(tmp_path))
+    server.clear_log()
+
+    # expired entries are replayed without requests
+    age_cache(tmp_path, 7200)
+    assert_results_equal(crawl(cache_dir=str(tmp_path), cache_ttl=3600, offline=True), expected)
+    assert len(server.log) == 0
+
+    with pytest.raises(KeyError):
+        Snail(cache_dir=str(tmp_path / "empty"), offline=True)
+
+def test_cache_max_size(server, tmp_path):
+    crawl(cache_dir=str(tmp_path))
+    sizes = [os.path.getsize(os.path.join(tmp_path, x)) for x in os.listdir(tmp_path) if x.endswith(".html.gz")]
+
+    # the least recently used entries are removed when the cache is opened
+    cache = ResponseCache(str(tmp_path), max_size=sum(sizes) // 2)
+    remaining = [os.path.getsize(os.path.join(tmp_path, x)) for x in os.listdir(tmp_path) if x.endswith(".html.gz")]
+    assert 0 < len(remaining) < len(sizes)
+    assert sum(remaining) <= cache.max_size
+    assert len(os.listdir(tmp_path)) == 2 * len(remaining)
+
+def test_cache_evict_after_stores(tmp_path):
+    # the size is also checked while crawling, every evict_every stores
+    cache = ResponseCache(str(tmp_path), max_size=2500, evict_every=2)
+    for i in range(10):
+        cache.store("http://a.test/page", {"i":i}, os.urandom(1000), {})
+    sizes = [os.path.getsize(os.path.join(tmp_path, x)) for x in os.listdir(tmp_path) if x.endswith(".html.gz")]
+    assert 0 < len(sizes) < 10 and sum(sizes) <= cache.max_size
+    # the most recent entry is kept
+    assert cache.load("http://a.test/page", {"i":9})[0] is not None
+
+def test_cache_atomic_store(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("http://a.test/page", {}, b"old", {"ETag":'"1"'})
+
+    # a failed write keeps the previous entry and leaves no temporary files
+    def write(*args):
+        raise OSError("disk full")
+    with monkeypatch.context() as context:
+        context.setattr(os, "replace", write)
+        with pytest.raises(OSError):
+            cache.store("http://a.test/page", {}, b"new", {"ETag":'"2"'})
+    content, meta = cache.load("http://a.test/page", {})
+    assert content == b"old" and meta["etag"] == '"1"'
+    assert not any(x.endswith(".tmp") for x in os.listdir(tmp_path))
+
+    # concurrent stores and loads, a load returns a complete entry
+    bodies = [bytes([i]) * 100000 for i in range(4)]
+    errors = []
+    def store(body):
+        for _ in range(20):
+            cache.store("http://a.test/page", {}, body, {"ETag":str(body[0])})
+    def load():
+        for _ in range(50):
+            content, meta = cache.load("http://a.test/page", {})
+            if content not in bodies + [b"old"]:
+                errors.append(content)
+    threads = [threading.Thread(target=store, args=(x,)) for x in bodies] + [threading.Thread(target=load) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    # temporary files of an interrupted crawl are removed when the cache is opened
+    open(os.path.join(tmp_path, "entry.tmp"), "w").close()
+    ResponseCache(str(tmp_path))
+    assert not any(x.endswith(".tmp") for x in os.listdir(tmp_path))
+
+####### Parser Backends ########
+def test_select_parser(server):
+    # lxml is installed (requirements.txt)
+    assert Snail().parser == "lxml"
+    assert Snail(parser="html.parser").parser == "html.parser"
+
+@pytest.mark.parametrize("parser, strained", [("lxml", True), ("lxml", False), ("html.parser", True)])
+def test_parser_backends(server, monkeypatch, parser, strained):
+    # HS 2 has legacy markup (upper case tags, unquoted attributes, tbody, comments, entities)
+    room_names = rooms + ["HS 2"]
+
+    # reference: html.parser on the whole pages
+    with monkeypatch.context() as context:
+        for name in tag_attributes:
+            context.setattr(Snail, name, None)
+        expected = crawl(room_names, parser="html.parser")
+
+    with monkeypatch.context() as context:
+        if not strained:
+            for name in tag_attributes:
+                context.setattr(Snail, name, None)
+        results = crawl(room_names, parser=parser)
+    assert_results_equal(results, expected)
+
+def test_parser_legacy_markup(server):
+    df_courses, df_dates = crawl(["HS 2"])["HS 2"]
+    assert list(df_courses["LVA-Titel"]) == ["Theoretische Informatik & Logik", 'Übung zu "Theoretische Informatik"']
+    assert list(df_courses["registered_students"]) == [211, 40]
+    assert df_courses.loc[0, "Institut"] == "I. Formale Modelle & Verifikation"
+    assert df_courses.loc[1, "Studienfach"] == "Not available"
+    assert list(df_dates["Anmerkung"]) == ["", "Vorlesung entfällt Ersatztermin folgt", "Prüfung", "Tutorium", "Test 2"]
+    assert list(df_dates["exam"]) == [False, False, True, False, False]
@@ -9,13 +9,25 @@ Webcrawler worked on 15.6.2024 for HS 19 and HS 18.
 Due to changes on the website, the webcrawler might not work anymore.
 """
 
-snail = Snail()
+# pages are cached for one day, offline=True replays the cached pages only
+snail = Snail(n_workers=8, requests_per_second=10, 
+              cache_dir="data/http_cache", cache_ttl=24*60*60, cache_max_size=500*1024**2)
 
-for room in ["HS 18", "HS 19"]:
-    df_courses, df_dates = snail.get_courses_by_room(room)
+rooms = ["HS 18", "HS 19"]
+# incremental: only crawl new lvas and lvas crawled more than max_age seconds ago
+# and merge them into the existing csv files
+incremental = False
 
-    snail.export_to_csv(df_courses, f"data/raw/{room}_courses.csv")
-    snail.export_to_csv(df_dates, f"data/raw/{room}_dates.csv")
+if incremental:
+    results = snail.update_courses_by_rooms(rooms, "data/raw", max_age=7*24*60*60)
+
+else:
+    # courses held in both rooms are only crawled once
+    results = snail.get_courses_by_rooms(rooms)
+
+    for room, (df_courses, df_dates) in results.items():
+        snail.export_to_csv(df_courses, f"data/raw/{room}_courses.csv")
+        snail.export_to_csv(df_dates, f"data/raw/{room}_dates.csv")
 
 
 
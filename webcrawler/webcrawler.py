@@ -1,8 +1,177 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
+from bs4.builder import builder_registry
 import re
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+class SearchResultError(ValueError):
+    """
+    The search result page of a room has no result table or rows that do not fit its header
+    """
+
+class RateLimiter():
+    """
+    Limits the number of requests per second sent to each host
+    """
+    def __init__(self, requests_per_second=None):
+        if requests_per_second is None:
+            self.interval = 0
+        else:
+            self.interval = 1 / requests_per_second
+        self.next_request = {}
+        self.lock = threading.Lock()
+        
+    def wait(self, url):
+        """
+        Blocks until the next request to the host of the url is allowed
+        """
+        if self.interval == 0:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_request.get(host, now), now)
+            self.next_request[host] = slot + self.interval
+        time.sleep(slot - now)
+
+class ResponseCache():
+    """
+    On-disk cache of the crawled pages, one gzip compressed body and one json
+    file with the headers per url and parameters.
+    
+    - entries younger than ttl seconds are used without a request (ttl=None: never expire)
+    - older entries are revalidated with If-None-Match/If-Modified-Since if the
+      server sent an ETag/Last-Modified header, a 304 response refreshes the entry
+    - if the bodies exceed max_size bytes the least recently used entries are removed,
+      the size is checked when the cache is opened (Snail is constructed) and after every
+      evict_every stores
+    - offline=True only replays cached pages, missing pages raise a KeyError
+    - the files are written to temporary files and moved into place, an interrupted
+      crawl leaves no partially written entries
+    """
+    def __init__(self, cache_dir, ttl=None, max_size=None, offline=False, evict_every=50):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.evict_every = evict_every
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.n_stores = 0
+        self.remove_temporary_files()
+        self.evict()
+        
+    def get_key(self, url, parameters):
+        key = json.dumps([url, parameters], sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+    
+    def get_paths(self, key):
+        path = os.path.join(self.cache_dir, key)
+        return path + ".html.gz", path + ".json"
+    
+    def load(self, url, parameters):
+        """
+        Returns the cached body and meta information or (None, None)
+        """
+        body_path, meta_path = self.get_paths(self.get_key(url, parameters))
+        with self.lock:
+            try:
+                with open(meta_path, "r") as file:
+                    meta = json.load(file)
+                with gzip.open(body_path, "rb") as file:
+                    content = file.read()
+                # access time drives the eviction
+                os.utime(body_path)
+            except (OSError, EOFError, json.JSONDecodeError):
+                return None, None
+        return content, meta
+    
+    def is_fresh(self, meta):
+        return self.ttl is None or time.time() - meta["fetched"] < self.ttl
+        
+    def revalidation_headers(self, meta):
+        headers = {}
+        if meta.get("etag") is not None:
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified") is not None:
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+    
+    def store(self, url, parameters, content, headers):
+        key = self.get_key(url, parameters)
+        body_path, meta_path = self.get_paths(key)
+        meta = {"url":url, "parameters":parameters, "fetched":time.time(), 
+                "etag":headers.get("ETag"), "last_modified":headers.get("Last-Modified")}
+        body = gzip.compress(content)
+        with self.lock:
+            self.write_file(body_path, body)
+            self.write_file(meta_path, json.dumps(meta).encode("utf-8"))
+            self.n_stores += 1
+            if self.n_stores % self.evict_every == 0:
+                self.evict()
+        
+    def refresh(self, url, parameters, meta):
+        # the page did not change (304), restart the ttl
+        meta["fetched"] = time.time()
+        _, meta_path = self.get_paths(self.get_key(url, parameters))
+        with self.lock:
+            self.write_file(meta_path, json.dumps(meta).encode("utf-8"))
+    
+    def write_file(self, path, data):
+        # write a temporary file and replace the entry file with it
+        fd, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+    
+    def remove_temporary_files(self):
+        # left over by a crawl that was killed while writing
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".tmp"):
+                os.remove(os.path.join(self.cache_dir, file_name))
+    
+    def evict(self):
+        """
+        Removes the least recently used entries until the bodies fit into max_size
+        """
+        if self.max_size is None:
+            return []
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".html.gz"):
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+                entries.append((stat.st_mtime, stat.st_size, file_name[:-len(".html.gz")]))
+        
+        total_size = sum(x[1] for x in entries)
+        evicted = []
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for path in self.get_paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total_size -= size
+            evicted.append(key)
+        return evicted
 
 class Snail():
     """
@@ -10,7 +179,38 @@ class Snail():
     """
     base_url = "https://www.kusss.jku.at/kusss/"
     
-    def __init__(self):
+    retry_status_codes = [429, 500, 502, 503, 504]
+    
+    # columns of the dates of an lva
+    dates_columns = ["LVA-Nummer", "Wochentag", "Datum", "Startzeit", "Endzeit", "Ort", "Anmerkung"]
+    
+    # parser backends in order of preference, html.parser is always available
+    parsers = ["lxml", "html.parser"]
+    
+    # only the tags (and their content) that are used are parsed from the pages
+    catalogue_tags = SoupStrainer(["form", "select"])
+    search_result_tags = SoupStrainer("table")
+    lva_page_tags = SoupStrainer(["a", "tr", "table"])
+    studyhandbook_tags = SoupStrainer(["li", "table"])
+    
+    def __init__(self, n_workers=1, requests_per_second=None, max_retries=3, backoff_factor=0.5,
+                 cache_dir=None, cache_ttl=None, cache_max_size=None, offline=False, parser=None):
+        
+        # html parser backend, by default the fastest installed one
+        self.parser = self.select_parser(parser)
+        
+        # n_workers > 1 crawls the lva pages concurrently
+        self.n_workers = n_workers
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = self.get_session(max_retries, backoff_factor)
+        
+        # optional response cache, offline replays the cached pages only
+        if cache_dir is None:
+            if offline:
+                raise ValueError("Offline mode requires a cache_dir")
+            self.cache = None
+        else:
+            self.cache = ResponseCache(cache_dir, cache_ttl, cache_max_size, offline)
         
         # get course catalogue
         self.course_catalogue = self.get_detailed_course_catalogue()
@@ -23,17 +223,81 @@ class Snail():
         self.room_dict = {x.text.strip():x["value"] for x in dropdown_entries}                                    
     
     ####### Basic Methods #######
-    def crawl(self, url, parameters=None, parse=True):
+    def select_parser(self, parser=None):
+        """
+        Returns the given parser backend or the first installed one of self.parsers
         """
-        Crawls the given URL and extracts the data
+        if parser is not None:
+            if builder_registry.lookup(parser) is None:
+                raise FeatureNotFound(f"Parser {parser} is not installed")
+            return parser
+        for parser in self.parsers:
+            if builder_registry.lookup(parser) is not None:
+                return parser
+        return "html.parser"
+    
+    def get_session(self, max_retries, backoff_factor):
+        """
+        Returns a keep-alive session that retries failed requests with exponential backoff
+        """
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, 
+                      status_forcelist=self.retry_status_codes, allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=max(self.n_workers, 10), pool_maxsize=max(self.n_workers, 10), max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def crawl(self, url, parameters=None, parse=True, parse_only=None):
+        """
+        Crawls the given URL and extracts the data,
+        parse_only (SoupStrainer) restricts parsing to the given tags
         """
         if parameters is None:
             parameters = {}
-            
-        response = requests.get(url, params=parameters)
+        
+        if self.cache is None:
+            response = self.request(url, parameters)
+        else:
+            response = self.crawl_cached(url, parameters)
         
         if parse:
-            response = BeautifulSoup(response.content, "html.parser")
+            response = BeautifulSoup(response.content, self.parser, parse_only=parse_only)
+        return response
+    
+    def request(self, url, parameters, headers=None):
+        self.rate_limiter.wait(url)
+        return self.session.get(url, params=parameters, headers=headers)
+    
+    def crawl_cached(self, url, parameters):
+        """
+        Returns the page from the response cache, the page is only 
+        requested if it is not cached or expired
+        """
+        # copy, the payload is changed between searches
+        parameters = dict(parameters)
+        content, meta = self.cache.load(url, parameters)
+        
+        if meta is not None and (self.cache.offline or self.cache.is_fresh(meta)):
+            return self.cached_response(url, content)
+        if self.cache.offline:
+            raise KeyError(f"{url} {parameters} is not cached (offline mode)")
+        
+        headers = None if meta is None else self.cache.revalidation_headers(meta)
+        response = self.request(url, parameters, headers)
+        
+        if response.status_code == 304 and meta is not None:
+            self.cache.refresh(url, parameters, meta)
+            return self.cached_response(url, content)
+        if response.status_code == 200:
+            self.cache.store(url, parameters, response.content, response.headers)
+        return response
+    
+    def cached_response(self, url, content):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = content
         return response
     
     def search_html(self, soup, tag, attributes=None, all=True):
@@ -69,7 +333,7 @@ class Snail():
         """
         #coursecatalogue-start.action?advanced=true
         url = self.base_url + "coursecatalogue-start.action" + "?advanced=true"
-        soup = self.crawl(url)
+        soup = self.crawl(url, parse_only=self.catalogue_tags)
         return soup
     
     def prepare_catalogue_search(self, soup):
@@ -99,22 +363,26 @@ class Snail():
         """
         Returns the search results
         """
-        result_html = self.crawl(self.base_url + action, payload)
+        url = self.base_url + action
+        result_html = self.crawl(url, payload, parse_only=self.search_result_tags)
         
+        # the result table is the last table, its first row holds the column names
         tables = self.search_html(result_html, "table", all=True)
-        result_table = self.search_html(tables[-1], "tr", all=True)
+        result_table = self.search_html(tables[-1], "tr", all=True) if tables else []
+        if len(result_table) == 0 or len(self.search_html(result_table[0], "th", all=True)) == 0:
+            raise SearchResultError(f"No search result table for room {payload.get('room')} at {url}")
         
         return result_table
 
-    def extract_search_results(self, result_table):
+    def extract_search_results(self, result_table, room_name=None):
         """
-        Extracts the search results
+        Extracts the search results, room_name is only used in the error messages
         """
         format = result_table[0]
         columns = [x.text.strip() for x in self.search_html(format, "th", all=True)]
         
         link_dict = {}
-        dataframe = pd.DataFrame(columns=columns)
+        records = []
 
         for row in result_table[1:]:
             
@@ -127,7 +395,6 @@ class Snail():
                 
                 # clean text
                 x = [x for x in re.split("\n|\t", text) if x != ""]
-                text = "\n".join(x)
                 text = x[0]
                 
                 link = cell.a
@@ -135,9 +402,16 @@ class Snail():
                     link = link["href"]
                     link_dict[x[0]] = link
 
-                row .append(text)
+                row.append(text)
                 
-            dataframe.loc[len(dataframe)] = row
+            records.append(row)
+        
+        # build the dataframe once from the collected rows
+        for i, row in enumerate(records):
+            if len(row) != len(columns):
+                raise SearchResultError(f"Search results of room {room_name}: row {i + 1} has {len(row)} cells, "
+                                        f"the result table has {len(columns)} columns")
+        dataframe = pd.DataFrame(records, columns=columns, dtype=object)
 
         dataframe["max_students"] = None
         dataframe["registered_students"] = None
@@ -150,12 +424,12 @@ class Snail():
     def get_lva_details_and_dates(self, lva_url):
 
         # harvest all the information from the lva overview page
-        lva_page = self.crawl(self.base_url + lva_url)        
+        lva_page = self.crawl(self.base_url + lva_url, parse_only=self.lva_page_tags)
         
         ############# Study Handbook #############
         # get link to study handbook
         studyhandbook_link = self.search_html(lva_page, "a", {"title":"Studienhandbuch"}, all=False)["href"]
-        studyhandbook_page = self.crawl(studyhandbook_link)
+        studyhandbook_page = self.crawl(studyhandbook_link, parse_only=self.studyhandbook_tags)
         
         handbook_info_dict = dict()
 
@@ -210,13 +484,12 @@ class Snail():
         dates_table = self.search_html(lva_page, "table", attributes={"summary":summary}, all=True)[1]
         
         
-        # dataframe to store information
-        dates_dataframe = pd.DataFrame(columns=["LVA-Nummer", "Wochentag", "Datum", "Startzeit", "Endzeit", "Ort", "Anmerkung"])
+        # collect the dates row by row, the dataframe is built once at the end
+        dates_records = []
 
-        #lva_dates = []
         date_list_uncleaned = dates_table.find_all("tr")[1:]
         
-        # filter out all dates not in the desired room
+        # every date row is followed by a row with the note of the date
         for idx in range(len(date_list_uncleaned)-1):
             
             date_info = [x.strip() for x in self.clean_string_dates(date_list_uncleaned[idx].get_text()) if x!=""]
@@ -226,13 +499,13 @@ class Snail():
                     helper = [" "] * (5 - len(date_info))
                     date_info += helper
 
-                dates_dataframe.loc[len(dates_dataframe)] =   [lva_number, date_info[0], date_info[1], date_info[2], date_info[3], date_info[4], ""]
-                #lva_dates.append([date_info[0], date_info[1], date_info[2], date_info[3], date_info[4], ""])
+                dates_records.append([lva_number, date_info[0], date_info[1], date_info[2], date_info[3], date_info[4], ""])
 
             else:
                 if len(date_info) != 0:
-                    dates_dataframe.loc[idx//2, "Anmerkung"] = " ".join(date_info)
+                    dates_records[idx//2][-1] = " ".join(date_info)
 
+        dates_dataframe = pd.DataFrame(dates_records, columns=self.dates_columns, dtype=object)
 
         return max_students, registered_students, dates_dataframe, subinfo_dict, handbook_info_dict
 
@@ -278,6 +551,7 @@ class Snail():
         
         no_dates_total = len(dates_total)
         return no_dates_total
+    
         #if weeks_between >= 10: 
         #    ratio = no_dates_total / weeks_between
         #    if 0.7 <= ratio <= 1.2:
@@ -309,61 +583,113 @@ class Snail():
             
             # twice a week
             
-    def accumulate_course_dates(self, dataframe_courses, link_dict, room):
+    def derive_regularity_per_course(self, dates_dataframe, n_courses):
+        """
+        derive_regularity for the concatenated dates of several courses,
+        the first index level is the position of the course
+        """
+        df_dates = dates_dataframe[~dates_dataframe["exam"] & ~dates_dataframe["tutorium"]]
+        # same validation of the dates as in derive_regularity
+        pd.to_datetime(df_dates["Datum"], format="%d.%m.%y")
+        
+        courses = df_dates.index.get_level_values(0).to_numpy(dtype=np.int64)
+        return np.bincount(courses, minlength=n_courses).astype(np.float64)
+    
+    def crawl_lva_pages(self, actions):
+        """
+        Crawls the details and dates of all lvas, concurrently if n_workers > 1.
+        The results are returned in the order of the actions
+        """
+        if self.n_workers <= 1:
+            return [self.get_lva_details_and_dates(action) for action in tqdm(actions)]
+        
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            return list(tqdm(executor.map(self.get_lva_details_and_dates, actions), total=len(actions)))
+            
+    def crawl_unique_lva_pages(self, lva_numbers, link_dict):
+        """
+        Crawls every lva number only once, returns a dictionary lva number -> lva page info
+        """
+        lva_numbers = list(dict.fromkeys(lva_numbers))
+        actions = [link_dict[lva_number] for lva_number in lva_numbers]
+        return dict(zip(lva_numbers, self.crawl_lva_pages(actions)))
+    
+    def accumulate_course_dates(self, dataframe_courses, link_dict, room, lva_pages=None):
         
         df_courses = dataframe_courses.copy()
         
+        # extract the lva numbers and action links and crawl the lva pages,
+        # unless they were already crawled (e.g. for another room)
+        if lva_pages is None:
+            lva_pages = self.crawl_unique_lva_pages(df_courses["LVA-Nr."], link_dict)
+        
+        # all features
+        # ['Workload', 'Ausbildungslevel', 'Studienfachbereich', 
+        #  'VerantwortlicheR', 'Semesterstunden', 'Anbietende Uni', 
+        #  'Quellcurriculum', 'Ziele', 'Lehrinhalte', 
+        #  'Beurteilungskriterien', 'Lehrmethoden', 
+        #  'Abhaltungssprache', 'Literatur', 'Lehrinhalte wechselnd?', 
+        #  'Sonstige Informationen', 'Äquivalenzen', 'Studienfach']
+            
+        interesting_features = ['Ausbildungslevel', 'Studienfachbereich', 'Anbietende Uni', 
+         'Quellcurriculum', 'Beurteilungskriterien', 'Lehrmethoden', 
+         'Abhaltungssprache', 'Literatur', 'Lehrinhalte wechselnd?', 
+         'Sonstige Informationen', 'Studienfach']
+        
+        # collect the information of all lvas in plain lists and dictionaries,
+        # the columns of df_courses are set once at the end
         dates_list = []
-        for i,row in tqdm(df_courses.iterrows(), total=len(df_courses)):
-            # extract the lva number and action link
-            lva_number = row["LVA-Nr."]
-            action = link_dict[lva_number]
+        max_students_list = []
+        registered_students_list = []
+        info_records = []
+        for lva_number in df_courses["LVA-Nr."]:
             
             # get the details and dates of the lva
-            max_students, registered_students, df_dates, subinfo_dict, studyhandbook_dict = self.get_lva_details_and_dates(action)
+            max_students, registered_students, df_dates, subinfo_dict, studyhandbook_dict = lva_pages[lva_number]
             
-            df_dates = self.derive_exam_dates(df_dates)
-            df_dates = self.derive_tutorium_dates(df_dates)
-            # derive regularity
-            no_dates_total = self.derive_regularity(df_dates)
-            df_courses.loc[i, "no_dates_total"] = no_dates_total
-            # filter the dates by the room            
-            df_dates = self.filter_by_room(df_dates, room)
-            
-            # store the dates
+            # store the dates and the max and registered students
             dates_list.append(df_dates)
-            # store the max and registered students
-            df_courses.loc[i, "max_students"] = max_students
-            df_courses.loc[i, "registered_students"] = registered_students
+            max_students_list.append(max_students)
+            registered_students_list.append(registered_students)
             
             # store infromation from dictionaries
+            record = {}
             for key in subinfo_dict.keys():
                 if key == "Abhaltungs-Sprache":
-                    df_courses.loc[i, "Abhaltungssprache_subinfo"] = subinfo_dict[key]
+                    record["Abhaltungssprache_subinfo"] = subinfo_dict[key]
                 else:
-                    df_courses.loc[i, key] = subinfo_dict[key]
+                    record[key] = subinfo_dict[key]
             
-            # all features
-            # ['Workload', 'Ausbildungslevel', 'Studienfachbereich', 
-            #  'VerantwortlicheR', 'Semesterstunden', 'Anbietende Uni', 
-            #  'Quellcurriculum', 'Ziele', 'Lehrinhalte', 
-            #  'Beurteilungskriterien', 'Lehrmethoden', 
-            #  'Abhaltungssprache', 'Literatur', 'Lehrinhalte wechselnd?', 
-            #  'Sonstige Informationen', 'Äquivalenzen', 'Studienfach']
-                
-            interesting_features = ['Ausbildungslevel', 'Studienfachbereich', 'Anbietende Uni', 
-             'Quellcurriculum', 'Beurteilungskriterien', 'Lehrmethoden', 
-             'Abhaltungssprache', 'Literatur', 'Lehrinhalte wechselnd?', 
-             'Sonstige Informationen', 'Studienfach']
-
             for key in studyhandbook_dict.keys():
                 if key in interesting_features:
                     if key == "Abhaltungssprache":
-                        df_courses.loc[i, "Abhaltungssprache_studyhandbook"] = studyhandbook_dict[key]
+                        record["Abhaltungssprache_studyhandbook"] = studyhandbook_dict[key]
                     else:
-                        df_courses.loc[i, key] = studyhandbook_dict[key]
-
-        df_dates = pd.concat(dates_list).reset_index(drop=True)
+                        record[key] = studyhandbook_dict[key]
+            info_records.append(record)
+        
+        # no courses (e.g. empty search result) -> no dates
+        if len(dates_list) == 0:
+            df_dates = pd.DataFrame(columns=self.dates_columns, dtype=object)
+        else:
+            df_dates = pd.concat(dates_list, keys=range(len(dates_list)), names=["course", None])
+        
+        df_dates = self.derive_exam_dates(df_dates)
+        df_dates = self.derive_tutorium_dates(df_dates)
+        # derive regularity
+        no_dates_total = self.derive_regularity_per_course(df_dates, len(dates_list))
+        
+        df_courses["no_dates_total"] = no_dates_total
+        df_courses["max_students"] = pd.Series(max_students_list, index=df_courses.index, dtype=object)
+        df_courses["registered_students"] = pd.Series(registered_students_list, index=df_courses.index, dtype=object)
+        
+        # one column per key, courses without the key are nan
+        info_columns = list(dict.fromkeys(key for record in info_records for key in record))
+        for key in info_columns:
+            df_courses[key] = pd.Series([record.get(key, np.nan) for record in info_records], index=df_courses.index, dtype=object)
+        
+        # filter the dates by the room            
+        df_dates = self.filter_by_room(df_dates, room)
         
         return df_courses, df_dates
     
@@ -374,11 +700,181 @@ class Snail():
             # get the search results
             result_table = self.get_search_result_table(self.action, self.payload)
             # extract the search results
-            df_courses, link_dict = self.extract_search_results(result_table)
+            df_courses, link_dict = self.extract_search_results(result_table, room_name)
             
             df_courses, df_dates = self.accumulate_course_dates(df_courses, link_dict, room_name)
             
             return df_courses, df_dates 
         
         else:
-            return None, None
\ No newline at end of file
+            return None, None
+    
+    def search_rooms(self, room_names):
+        """
+        Runs the catalogue search for every valid room,
+        returns a dictionary room -> search results and the links of all lvas
+        """
+        search_results = {}
+        link_dict = {}
+        for room_name in room_names:
+            if self.validate_room(room_name):
+                result_table = self.get_search_result_table(self.action, self.payload)
+                df_courses, room_link_dict = self.extract_search_results(result_table, room_name)
+                search_results[room_name] = df_courses
+                link_dict = {**room_link_dict, **link_dict}
+        return search_results, link_dict
+    
+    def get_courses_by_rooms(self, room_names):
+        """
+        Same as get_courses_by_room for several rooms, but every lva is only
+        crawled once, also if it takes place in more than one room.
+        Returns a dictionary room -> (df_courses, df_dates)
+        """
+        # run the search for every room first
+        search_results, link_dict = self.search_rooms(room_names)
+        
+        # crawl the unique lvas of all rooms
+        lva_numbers = [x for df_courses in search_results.values() for x in df_courses["LVA-Nr."]]
+        lva_pages = self.crawl_unique_lva_pages(lva_numbers, link_dict)
+        
+        # split the dates per room
+        results = {}
+        for room_name in room_names:
+            if room_name in search_results:
+                results[room_name] = self.accumulate_course_dates(search_results[room_name], link_dict, room_name, lva_pages)
+            else:
+                results[room_name] = (None, None)
+        return results
+    
+    ######### Incremental Crawl #########
+    def get_crawl_paths(self, path_to_raw_data, room_name):
+        courses_path = os.path.join(path_to_raw_data, f"{room_name}_courses.csv")
+        dates_path = os.path.join(path_to_raw_data, f"{room_name}_dates.csv")
+        crawl_times_path = os.path.join(path_to_raw_data, f"{room_name}_crawl_times.json")
+        return courses_path, dates_path, crawl_times_path
+    
+    def read_previous_crawl(self, path_to_raw_data, room_name):
+        """
+        Reads the courses and dates of a previous crawl and the crawl time of every lva.
+        All values are read as strings, so the csv files are written back unchanged
+        """
+        courses_path, dates_path, crawl_times_path = self.get_crawl_paths(path_to_raw_data, room_name)
+        if not (os.path.exists(courses_path) and os.path.exists(dates_path)):
+            return None, None, {}
+        
+        df_courses = pd.read_csv(courses_path, dtype=str, keep_default_na=False)
+        df_dates = pd.read_csv(dates_path, dtype=str, keep_default_na=False)
+        
+        if os.path.exists(crawl_times_path):
+            with open(crawl_times_path, "r") as file:
+                crawl_times = json.load(file)
+        else:
+            # crawl without stored crawl times, use the time of the csv file
+            crawl_time = os.path.getmtime(courses_path)
+            crawl_times = {lva_number:crawl_time for lva_number in df_courses["LVA-Nr."]}
+        return df_courses, df_dates, crawl_times
+    
+    def select_lvas_to_crawl(self, lva_numbers, previous_courses, crawl_times, max_age=None):
+        """
+        Returns the lvas that are new, missing in the previous crawl or older than max_age seconds
+        """
+        known = set() if previous_courses is None else set(previous_courses["LVA-Nr."])
+        now = time.time()
+        
+        to_crawl = []
+        for lva_number in lva_numbers:
+            if lva_number not in known or lva_number not in crawl_times:
+                to_crawl.append(lva_number)
+            elif max_age is not None and now - crawl_times[lva_number] > max_age:
+                to_crawl.append(lva_number)
+        return list(dict.fromkeys(to_crawl))
+    
+    def concat_non_empty(self, dataframes):
+        # empty frames would change the dtypes of the concatenation
+        non_empty = [x for x in dataframes if len(x) > 0]
+        if len(non_empty) == 0:
+            return dataframes[0]
+        return pd.concat(non_empty, axis=0)
+    
+    def merge_crawl(self, df_search, df_new_courses, df_new_dates, previous_courses, previous_dates):
+        """
+        Merges the recrawled lvas into the previous crawl. The courses are in the 
+        order of the current search results, the columns of the search results are
+        updated for all courses. Courses that are no longer found are dropped
+        """
+        if previous_courses is None:
+            return df_new_courses, df_new_dates
+        
+        search_columns = [x for x in df_search.columns if x not in ["max_students", "registered_students"]]
+        recrawled = df_search["LVA-Nr."].isin(df_new_courses["LVA-Nr."])
+        
+        # courses kept from the previous crawl, with the current search results
+        previous = previous_courses.drop_duplicates("LVA-Nr.").set_index("LVA-Nr.", drop=False)
+        df_kept = previous.loc[df_search.loc[~recrawled, "LVA-Nr."]].copy()
+        df_kept.index = df_search.index[~recrawled]
+        df_kept[search_columns] = df_search.loc[~recrawled, search_columns]
+        
+        columns = list(dict.fromkeys(list(previous_courses.columns) + list(df_new_courses.columns)))
+        df_courses = self.concat_non_empty([df_kept, df_new_courses]).sort_index()
+        df_courses = df_courses.reindex(columns=columns).reset_index(drop=True)
+        
+        # dates in the order of the courses
+        order = {lva_number:i for i, lva_number in reversed(list(enumerate(df_courses["LVA-Nr."])))}
+        df_kept_dates = previous_dates[previous_dates["LVA-Nummer"].isin(df_kept["LVA-Nr."])]
+        df_dates = self.concat_non_empty([df_kept_dates, df_new_dates])
+        position = df_dates["LVA-Nummer"].map(order).to_numpy()
+        df_dates = df_dates.iloc[np.argsort(position, kind="stable")].reset_index(drop=True)
+        
+        return df_courses, df_dates
+    
+    def update_courses_by_rooms(self, room_names, path_to_raw_data, max_age=None):
+        """
+        Incremental version of get_courses_by_rooms. The search results are crawled first,
+        only lvas that are new, missing in the previous crawl or older than max_age seconds
+        are crawled again. The results are merged into <room>_courses.csv and 
+        <room>_dates.csv in path_to_raw_data, the crawl times are stored in <room>_crawl_times.json.
+        Returns a dictionary room -> (df_courses, df_dates)
+        """
+        search_results, link_dict = self.search_rooms(room_names)
+        
+        # select and crawl the lvas of all rooms that have to be updated
+        previous_crawls = {}
+        to_crawl = {}
+        for room_name, df_search in search_results.items():
+            previous_crawls[room_name] = self.read_previous_crawl(path_to_raw_data, room_name)
+            previous_courses, _, crawl_times = previous_crawls[room_name]
+            to_crawl[room_name] = self.select_lvas_to_crawl(df_search["LVA-Nr."], previous_courses, crawl_times, max_age)
+        
+        lva_numbers = [x for lva_numbers in to_crawl.values() for x in lva_numbers]
+        lva_pages = self.crawl_unique_lva_pages(lva_numbers, link_dict)
+        crawl_time = time.time()
+        
+        results = {}
+        for room_name in room_names:
+            if room_name not in search_results:
+                results[room_name] = (None, None)
+                continue
+            
+            df_search = search_results[room_name]
+            previous_courses, previous_dates, crawl_times = previous_crawls[room_name]
+            
+            df_new = df_search[df_search["LVA-Nr."].isin(to_crawl[room_name])]
+            if len(df_new) > 0:
+                df_new_courses, df_new_dates = self.accumulate_course_dates(df_new, link_dict, room_name, lva_pages)
+            else:
+                df_new_courses, df_new_dates = df_new, pd.DataFrame(columns=["LVA-Nummer"])
+            
+            df_courses, df_dates = self.merge_crawl(df_search, df_new_courses, df_new_dates, previous_courses, previous_dates)
+            
+            # crawl times of the courses that are still found
+            crawl_times = {**crawl_times, **{lva_number:crawl_time for lva_number in to_crawl[room_name]}}
+            crawl_times = {lva_number:crawl_times[lva_number] for lva_number in df_courses["LVA-Nr."]}
+            
+            courses_path, dates_path, crawl_times_path = self.get_crawl_paths(path_to_raw_data, room_name)
+            self.export_to_csv(df_courses, courses_path)
+            self.export_to_csv(df_dates, dates_path)
+            with open(crawl_times_path, "w") as file:
+                json.dump(crawl_times, file, indent=4)
+            
+            results[room_name] = (df_courses, df_dates)
+        return results
\ No newline at end of file